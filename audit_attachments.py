@@ -0,0 +1,94 @@
+# audit_attachments.py
+"""Archivio su disco degli allegati (foto e PDF), indirizzato per contenuto.
+
+Ogni file viene copiato a blocchi in ``<dir>/<hash[:2]>/<hash>`` calcolando lo
+SHA-256 durante la copia: file identici sono salvati una volta sola. Nei
+record resta solo un riferimento leggero (:class:`Allegato`), mentre il
+contenuto viene riletto dal disco quando serve (report PDF).
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+from typing import Any, BinaryIO, Dict, Iterable, List, Mapping, NamedTuple
+
+ALLEGATI_DIR = os.environ.get("AUDIT_ALLEGATI", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "allegati"))
+# byte di allegati che una sessione (l'audit in corso) può accumulare: i caricamenti oltre il
+# totale vengono scartati; il singolo file è limitato prima, da server.maxUploadSize
+LIMITE_SESSIONE = int(os.environ.get("AUDIT_LIMITE_SESSIONE_MB", "256")) * 1024 * 1024
+_BLOCCO = 1024 * 1024
+
+
+class Allegato(NamedTuple):
+    sha256: str
+    nome: str
+    mime: str
+    dimensione: int
+
+    @property
+    def is_image(self) -> bool:
+        return (self.mime or "").startswith("image/")
+
+    @property
+    def is_pdf(self) -> bool:
+        return self.mime == "application/pdf" or self.nome.lower().endswith(".pdf")
+
+
+def percorso(sha256: str, cartella: str = ALLEGATI_DIR) -> str:
+    return os.path.join(cartella, sha256[:2], sha256)
+
+
+def salva(sorgente: BinaryIO, nome: str, mime: str = "", cartella: str = ALLEGATI_DIR) -> Allegato:
+    """Copia `sorgente` nell'archivio a blocchi; se il contenuto esiste già non viene riscritto."""
+    os.makedirs(cartella, exist_ok=True)
+    h = hashlib.sha256()
+    n = 0
+    fd, tmp = tempfile.mkstemp(dir=cartella, prefix=".upload-")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            if hasattr(sorgente, "seek"):
+                sorgente.seek(0)
+            while True:
+                blocco = sorgente.read(_BLOCCO)
+                if not blocco:
+                    break
+                h.update(blocco)
+                out.write(blocco)
+                n += len(blocco)
+        dest = percorso(h.hexdigest(), cartella)
+        if os.path.exists(dest):
+            os.remove(tmp)
+        else:
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            os.replace(tmp, dest)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return Allegato(h.hexdigest(), nome, mime or "", n)
+
+
+def apri(ref: Allegato, cartella: str = ALLEGATI_DIR) -> BinaryIO:
+    return open(percorso(ref.sha256, cartella), "rb")
+
+
+def copia_in(ref: Allegato, dest: BinaryIO, cartella: str = ALLEGATI_DIR) -> None:
+    with apri(ref, cartella) as fh:
+        shutil.copyfileobj(fh, dest, _BLOCCO)
+
+
+def da_dict(d: Mapping[str, Any]) -> Allegato:
+    return Allegato(d["sha256"], d["nome"], d.get("mime", ""), int(d.get("dimensione", 0)))
+
+
+def allegati_da_risposte(risposte: Mapping[str, Any]) -> Dict[str, List[Allegato]]:
+    """Dai valori salvati di una sessione (chiavi ``<ID>_allegati``) ai riferimenti per requisito."""
+    out = {}
+    for k, v in risposte.items():
+        if k.endswith("_allegati") and v:
+            out[k[: -len("_allegati")]] = [da_dict(d) for d in v]
+    return out
+
+
+def dimensione_totale(refs: Iterable[Allegato]) -> int:
+    return sum(r.dimensione for r in refs)
@@ -0,0 +1,66 @@
+# audit_cache.py
+"""Cache LRU condivisa a livello di processo, limitata per dimensione ed età."""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class BoundedCache:
+    """LRU thread-safe: elimina le voci più vecchie oltre ``max_bytes`` o ``max_age`` secondi.
+
+    ``sizeof`` misura il peso di un valore (default: len, adatto a bytes).
+    """
+
+    def __init__(self, max_bytes: int, max_age: Optional[float] = None,
+                 sizeof: Callable[[Any], int] = len):
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._sizeof = sizeof
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _drop(self, key):
+        _, size, _ = self._data.pop(key)
+        self._bytes -= size
+
+    def _evict(self, now: float):
+        if self.max_age is not None:
+            scaduti = [k for k, (_, _, ts) in self._data.items() if now - ts > self.max_age]
+            for k in scaduti:
+                self._drop(k)
+        while self._bytes > self.max_bytes and len(self._data) > 1:
+            self._drop(next(iter(self._data)))
+
+    def get(self, key: Hashable, default=None):
+        now = time.monotonic()
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is None:
+                return default
+            if self.max_age is not None and now - hit[2] > self.max_age:
+                self._drop(key)
+                return default
+            self._data.move_to_end(key)
+            return hit[0]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        now = time.monotonic()
+        size = self._sizeof(value)
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (value, size, now)
+            self._bytes += size
+            self._evict(now)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
@@ -0,0 +1,124 @@
+# audit_catalog.py
+"""Cataloghi dei requisiti, caricati da file JSON versionati in ``cataloghi/``.
+
+Ogni catalogo viene letto e validato una sola volta per processo (la cache
+è invalidata se il file cambia) ed è condiviso in sola lettura fra le
+sessioni. I requisiti sono indicizzati per ID stabile (es. ``DOC-01``),
+usato anche come prefisso delle chiavi di session_state: le risposte
+salvate restano valide se gli item vengono riordinati.
+
+Formato del file::
+
+    {"id": "dlgs81-base", "versione": "2025.1", "titolo": "...",
+     "sezioni": [{"nome": "...", "requisiti": [
+         {"id": "DOC-01", "requisito": "...", "riferimento": "..."}, ...]}]}
+"""
+import json
+import os
+from types import MappingProxyType
+from typing import Dict, Mapping, NamedTuple, Tuple
+
+CATALOGHI_DIR = os.environ.get("AUDIT_CATALOGHI", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cataloghi"))
+CATALOGO_DEFAULT = "dlgs81-base"
+
+
+class Requisito(NamedTuple):
+    id: str
+    sezione: str
+    n: int  # posizione (1-based) nella sezione, solo per visualizzazione
+    requisito: str
+    riferimento: str
+
+
+class Catalogo:
+    __slots__ = ("id", "versione", "titolo", "sezioni", "indice")
+
+    def __init__(self, id: str, versione: str, titolo: str, sezioni: Mapping[str, Tuple[Requisito, ...]]):
+        self.id = id
+        self.versione = versione
+        self.titolo = titolo
+        self.sezioni = MappingProxyType(dict(sezioni))
+        self.indice = MappingProxyType({r.id: r for reqs in self.sezioni.values() for r in reqs})
+
+    def __iter__(self):
+        for reqs in self.sezioni.values():
+            yield from reqs
+
+    def __len__(self) -> int:
+        return len(self.indice)
+
+    @property
+    def etichetta(self) -> str:
+        return f"{self.titolo} (v{self.versione})"
+
+
+def _valida(data: dict, path: str) -> Catalogo:
+    def errore(msg):
+        return ValueError(f"Catalogo non valido ({os.path.basename(path)}): {msg}")
+
+    for campo in ("id", "versione", "titolo", "sezioni"):
+        if campo not in data:
+            raise errore(f"campo '{campo}' mancante")
+    sezioni: Dict[str, Tuple[Requisito, ...]] = {}
+    visti = set()
+    for sez in data["sezioni"]:
+        nome = str(sez.get("nome", "")).strip()
+        if not nome:
+            raise errore("sezione senza nome")
+        if nome in sezioni:
+            raise errore(f"sezione duplicata '{nome}'")
+        reqs = []
+        for n, item in enumerate(sez.get("requisiti", []), start=1):
+            rid = str(item.get("id", "")).strip()
+            if not rid:
+                raise errore(f"requisito {n} di '{nome}' senza id")
+            if "_" in rid:
+                raise errore(f"id '{rid}' non valido: '_' separa l'id dal campo nelle chiavi di sessione")
+            if rid in visti:
+                raise errore(f"id duplicato '{rid}'")
+            if not item.get("requisito"):
+                raise errore(f"requisito '{rid}' senza testo")
+            visti.add(rid)
+            reqs.append(Requisito(rid, nome, n, str(item["requisito"]), str(item.get("riferimento", ""))))
+        sezioni[nome] = tuple(reqs)
+    return Catalogo(str(data["id"]), str(data["versione"]), str(data["titolo"]), sezioni)
+
+
+# percorso -> (mtime, catalogo): una voce per file, sostituita quando il file cambia
+_CACHE: Dict[str, Tuple[float, Catalogo]] = {}
+
+
+def _carica(path: str) -> Catalogo:
+    with open(path, encoding="utf-8") as fh:
+        return _valida(json.load(fh), path)
+
+
+def carica_catalogo(path: str) -> Catalogo:
+    path = os.path.abspath(path)
+    mtime = os.path.getmtime(path)
+    voce = _CACHE.get(path)
+    if voce is None or voce[0] != mtime:
+        voce = _CACHE[path] = (mtime, _carica(path))
+    return voce[1]
+
+
+def cataloghi_disponibili(cartella: str = CATALOGHI_DIR) -> Dict[str, str]:
+    """ID catalogo -> percorso del file, per tutti i *.json della cartella."""
+    out = {}
+    for nome in sorted(os.listdir(cartella)):
+        if nome.endswith(".json"):
+            path = os.path.join(cartella, nome)
+            out[carica_catalogo(path).id] = path
+    return out
+
+
+def catalogo(cat_id: str = CATALOGO_DEFAULT, cartella: str = CATALOGHI_DIR) -> Catalogo:
+    disponibili = cataloghi_disponibili(cartella)
+    if cat_id not in disponibili:
+        raise KeyError(f"Catalogo '{cat_id}' non trovato in {cartella}")
+    return carica_catalogo(disponibili[cat_id])
+
+
+def id_requisiti(cartella: str = CATALOGHI_DIR) -> frozenset:
+    """Tutti gli ID requisito dei cataloghi disponibili."""
+    return frozenset(rid for path in cataloghi_disponibili(cartella).values() for rid in carica_catalogo(path).indice)
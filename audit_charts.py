@@ -0,0 +1,222 @@
+# audit_charts.py
+"""Grafici delle statistiche dell'audit, per l'app e per il report PDF.
+
+I dati vengono dall'aggregato per sezione (``audit_scoring.aggrega``) e dai
+record delle NC. In app i grafici sono spec Vega-Lite (dizionari con i dati
+inline, disegnati da ``st.vega_lite_chart`` senza importare altre librerie),
+da memorizzare insieme alle statistiche: a punteggi invariati si rimanda la
+stessa spec e il browser non ridisegna nulla. Nel PDF sono disegni vettoriali
+nativi di ReportLab (``reportlab.graphics``), importati solo alla generazione e
+tenuti in cache per impronta dei dati già espansi in forme semplici.
+"""
+from collections import Counter
+from typing import List, Optional, Sequence
+
+import pandas as pd
+
+from audit_cache import BoundedCache
+from audit_scoring import PERIODI
+
+LIVELLI_NC = ["Livello 1", "Livello 2"]
+SERIE = {"% Conformità": "Semplice", "% Conformità ponderata": "Ponderata"}
+COLORI_SERIE = ("#16a34a", "#2563eb")
+COLORI_LIVELLI = ("#f59e0b", "#b91c1c")
+SENZA_PERIODO = "n.d."
+# disegni PDF per impronta dei dati (peso 1 per voce: al più DISEGNI_MAX grafici)
+DISEGNI_MAX = 64
+_disegni = BoundedCache(DISEGNI_MAX, max_age=3600, sizeof=lambda v: 1)
+
+
+def dati_sezioni(agg: pd.DataFrame) -> pd.DataFrame:
+    """% di conformità semplice e ponderata per sezione (ordine del catalogo), solo sezioni con valutati."""
+    if agg.empty:
+        return pd.DataFrame(columns=list(SERIE))
+    out = agg[list(SERIE)].astype(float)
+    out.index = out.index.astype(str)
+    return out.dropna(how="all")
+
+
+def distribuzione_nc(df: pd.DataFrame, periodi: Sequence[str] = PERIODI) -> pd.DataFrame:
+    """Numero di NC per periodo di gestione (righe, nell'ordine di `periodi`) e livello (colonne)."""
+    # conteggio in Python invece di pd.crosstab (~20 ms): il report la ricalcola a ogni generazione
+    nc = df.loc[df["Stato"] == "Non conforme", ["Periodo", "NC Livello"]]
+    periodo = [p if isinstance(p, str) and p not in ("", "nan", "None") else SENZA_PERIODO
+               for p in nc["Periodo"].astype(str).tolist()]
+    conta = Counter(zip(periodo, nc["NC Livello"].tolist()))
+    presenti = set(periodo)
+    righe = [p for p in periodi if p in presenti] + sorted(presenti.difference(periodi))
+    return pd.DataFrame([[conta[p, l] for l in LIVELLI_NC] for p in righe], index=righe, columns=LIVELLI_NC,
+                        dtype="int64")
+
+
+# ---------- App (Vega-Lite) ----------
+def spec_sezioni(dati: pd.DataFrame) -> dict:
+    valori = [{"Sezione": s, "Calcolo": SERIE[c], "%": round(float(v), 1)}
+              for s, riga in dati.iterrows() for c, v in riga.items() if pd.notna(v)]
+    return {
+        "data": {"values": valori},
+        "mark": {"type": "bar", "tooltip": True},
+        "height": {"step": 12},
+        "encoding": {
+            "y": {"field": "Sezione", "type": "nominal", "sort": list(dati.index), "title": None,
+                  "axis": {"labelLimit": 260}},
+            "yOffset": {"field": "Calcolo", "sort": list(SERIE.values())},
+            "x": {"field": "%", "type": "quantitative", "scale": {"domain": [0, 100]}, "title": "% conformità"},
+            "color": {"field": "Calcolo", "sort": list(SERIE.values()),
+                      "scale": {"range": list(COLORI_SERIE)}, "legend": {"orient": "top", "title": None}},
+        },
+    }
+
+
+def spec_nc(dist: pd.DataFrame) -> dict:
+    valori = [{"Periodo": p, "Livello": l, "NC": int(n)} for p, riga in dist.iterrows() for l, n in riga.items() if n]
+    return {
+        "data": {"values": valori},
+        "mark": {"type": "bar", "tooltip": True},
+        "encoding": {
+            "x": {"field": "Periodo", "type": "nominal", "sort": list(dist.index), "title": None,
+                  "axis": {"labelAngle": 0, "labelLimit": 160}},
+            "y": {"field": "NC", "type": "quantitative", "title": "Non conformità", "axis": {"tickMinStep": 1}},
+            "color": {"field": "Livello", "sort": LIVELLI_NC, "scale": {"range": list(COLORI_LIVELLI)},
+                      "legend": {"orient": "top", "title": None}},
+        },
+    }
+
+
+# ---------- PDF (ReportLab) ----------
+def _tronca(testo: str, larghezza: float, font: str, corpo: float) -> str:
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+
+    if stringWidth(testo, font, corpo) <= larghezza:
+        return testo
+    while testo and stringWidth(testo + "…", font, corpo) > larghezza:
+        testo = testo[:-1]
+    return testo + "…"
+
+
+def _legenda(serie: List[tuple], x: float, y: float):
+    from reportlab.graphics.charts.legends import Legend
+    from reportlab.lib import colors
+
+    leg = Legend()
+    leg.x, leg.y = x, y
+    leg.alignment = "right"
+    leg.columnMaximum = 1
+    leg.deltax = 80
+    leg.fontName, leg.fontSize = "Helvetica", 8
+    leg.colorNamePairs = [(colors.HexColor(c), n) for c, n in serie]
+    return leg
+
+
+def _espandi(nodo):
+    # widget (grafico, assi, etichette, legenda) sostituiti dalle forme che producono: la resa
+    # è identica, ma ReportLab non li riespande a ogni disegno (due terzi del costo)
+    from reportlab.graphics.shapes import Group, UserNode
+
+    while isinstance(nodo, UserNode):
+        nodo = nodo.provideNode()
+    if isinstance(nodo, Group):
+        nodo.contents = [_espandi(n) for n in nodo.contents]
+    return nodo
+
+
+def _da_cache(chiave: str, costruisci):
+    """``Drawing`` dalla cache delle forme espanse, costruendolo alla prima richiesta.
+
+    Ogni chiamata restituisce un ``Drawing`` nuovo sulle stesse forme (che la resa legge soltanto):
+    come flowable ReportLab gli assegna il canvas, quindi non va condiviso tra report concorrenti.
+    """
+    from reportlab.graphics.shapes import Drawing
+
+    hit = _disegni.get(chiave)
+    if hit is None:
+        d = costruisci()
+        hit = (d.width, d.height, _espandi(d).contents)
+        _disegni.put(chiave, hit)
+    larghezza, altezza, forme = hit
+    return Drawing(larghezza, altezza, *forme)
+
+
+def disegno_sezioni(dati: pd.DataFrame, larghezza: float, altezza_max: float = 480):
+    """Barre orizzontali per sezione (semplice e ponderata) come ``Drawing`` vettoriale; None se non ci sono dati."""
+    if dati.empty:
+        return None
+    return _da_cache(repr(("sezioni", impronta_grafico(dati), larghezza, altezza_max)),
+                     lambda: _disegno_sezioni(dati, larghezza, altezza_max))
+
+
+def _disegno_sezioni(dati: pd.DataFrame, larghezza: float, altezza_max: float):
+    from reportlab.graphics.charts.barcharts import HorizontalBarChart
+    from reportlab.graphics.shapes import Drawing
+    from reportlab.lib import colors
+
+    corpo = 7.5
+    per_sezione = max(8.0, min(20.0, altezza_max / len(dati)))
+    etichette = larghezza * 0.38
+    alto = per_sezione * len(dati)
+    d = Drawing(larghezza, alto + 36)
+    ch = HorizontalBarChart()
+    ch.x, ch.y, ch.width, ch.height = etichette, 14, larghezza - etichette - 24, alto
+    ch.data = [tuple(None if pd.isna(v) else float(v) for v in dati[c]) for c in SERIE]
+    ch.categoryAxis.categoryNames = [_tronca(s, etichette - 6, "Helvetica", corpo) for s in dati.index]
+    ch.categoryAxis.reverseDirection = 1  # prima sezione in alto
+    ch.categoryAxis.labels.fontName, ch.categoryAxis.labels.fontSize = "Helvetica", corpo
+    ch.categoryAxis.labels.boxAnchor = "e"
+    ch.categoryAxis.labels.dx = -4
+    ch.valueAxis.valueMin, ch.valueAxis.valueMax, ch.valueAxis.valueStep = 0, 100, 20
+    ch.valueAxis.labelTextFormat = "%d%%"
+    ch.valueAxis.labels.fontName, ch.valueAxis.labels.fontSize = "Helvetica", corpo
+    ch.valueAxis.visibleGrid = 1
+    ch.valueAxis.gridStrokeColor = colors.HexColor("#e5e7eb")
+    ch.barSpacing, ch.groupSpacing = 0.5, max(1.0, per_sezione * 0.2)
+    ch.barLabelFormat = "%.0f%%"
+    ch.barLabels.fontName, ch.barLabels.fontSize = "Helvetica", 6
+    ch.barLabels.boxAnchor, ch.barLabels.dx = "w", 2
+    for i, c in enumerate(COLORI_SERIE):
+        ch.bars[i].fillColor = colors.HexColor(c)
+        ch.bars[i].strokeColor = None
+    d.add(ch)
+    d.add(_legenda(list(zip(COLORI_SERIE, SERIE.values())), ch.x + ch.width - 160, alto + 30))
+    return d
+
+
+def disegno_nc(dist: pd.DataFrame, larghezza: float = 420, altezza: float = 150):
+    """Barre impilate delle NC per periodo di gestione e livello; None se non ci sono NC."""
+    if dist.empty or not dist.to_numpy().sum():
+        return None
+    return _da_cache(repr(("nc", impronta_grafico(dist), larghezza, altezza)),
+                     lambda: _disegno_nc(dist, larghezza, altezza))
+
+
+def _disegno_nc(dist: pd.DataFrame, larghezza: float, altezza: float):
+    from reportlab.graphics.charts.barcharts import VerticalBarChart
+    from reportlab.graphics.shapes import Drawing
+    from reportlab.lib import colors
+
+    d = Drawing(larghezza, altezza + 30)
+    ch = VerticalBarChart()
+    ch.x, ch.y, ch.width, ch.height = 30, 20, larghezza - 40, altezza - 10
+    ch.data = [tuple(int(n) for n in dist[l]) for l in LIVELLI_NC]
+    ch.categoryAxis.style = "stacked"
+    ch.categoryAxis.categoryNames = [str(p) for p in dist.index]
+    ch.categoryAxis.labels.fontName, ch.categoryAxis.labels.fontSize = "Helvetica", 8
+    ch.valueAxis.valueMin = 0
+    massimo = int(dist.sum(axis=1).max())
+    ch.valueAxis.valueStep = max(1, -(-massimo // 5))
+    ch.valueAxis.labels.fontName, ch.valueAxis.labels.fontSize = "Helvetica", 8
+    ch.valueAxis.visibleGrid = 1
+    ch.valueAxis.gridStrokeColor = colors.HexColor("#e5e7eb")
+    ch.barWidth = 18
+    for i, c in enumerate(COLORI_LIVELLI):
+        ch.bars[i].fillColor = colors.HexColor(c)
+        ch.bars[i].strokeColor = None
+    d.add(ch)
+    d.add(_legenda(list(zip(COLORI_LIVELLI, LIVELLI_NC)), ch.x + ch.width - 160, altezza + 24))
+    return d
+
+
+def impronta_grafico(dati: Optional[pd.DataFrame]) -> tuple:
+    """Dati di un grafico come tupla confrontabile (per le chiavi di cache dei frammenti PDF)."""
+    if dati is None or dati.empty:
+        return ()
+    return (tuple(dati.index), tuple(dati.columns), tuple(map(tuple, dati.round(1).to_numpy().tolist())))
@@ -0,0 +1,315 @@
+# audit_export.py
+"""Serializzazione dei record di audit in CSV, Excel e formato colonnare (Parquet / Arrow).
+
+CSV ed Excel riportano i record come li mostra l'app ("Sì"/"No", date
+GG/MM/AAAA). Parquet e Arrow IPC sono per le analisi a valle: colonne
+tipizzate (booleani, categorie, date vere, float32), leggibili senza
+riconversioni da pandas, pyarrow, DuckDB o Polars. L'Arrow è scritto non
+compresso, così :func:`leggi_colonnare` lo mappa in memoria senza copie.
+"""
+import hashlib
+import os
+from datetime import date
+from io import BytesIO
+from typing import Iterable, Mapping, Optional, Sequence, Tuple, Union
+
+import pandas as pd
+
+from audit_scoring import LIVELLI, STATI
+
+
+def digest_df(df: pd.DataFrame, *extra: Iterable) -> str:
+    """Hash del contenuto (valori e colonne) più eventuali parametri, es. i filtri attivi."""
+    h = hashlib.sha1()
+    h.update(repr(list(df.columns)).encode("utf-8"))
+    h.update(pd.util.hash_pandas_object(df.astype(str), index=False).values.tobytes())
+    h.update(repr(extra).encode("utf-8"))
+    return h.hexdigest()
+
+
+def export_csv(df: pd.DataFrame) -> bytes:
+    return df.to_csv(index=False).encode("utf-8")
+
+
+def export_excel(df: pd.DataFrame, sheet_name: str = "Audit") -> bytes:
+    """Workbook xlsx scritto riga per riga in modalità constant_memory.
+
+    pandas.to_excel scrive per colonne, incompatibile con constant_memory:
+    qui le righe vengono passate in ordine direttamente a xlsxwriter, che le
+    scarica su file temporaneo man mano invece di tenerle tutte in memoria.
+    """
+    import xlsxwriter
+
+    buf = BytesIO()
+    wb = xlsxwriter.Workbook(buf, {"constant_memory": True, "strings_to_urls": False, "strings_to_formulas": False})
+    ws = wb.add_worksheet(sheet_name)
+    bold = wb.add_format({"bold": True})
+    ws.write_row(0, 0, [str(c) for c in df.columns], bold)
+    vals = df.astype(object).where(df.notna(), None)
+    for r, row in enumerate(vals.itertuples(index=False, name=None), start=1):
+        ws.write_row(r, 0, row)
+    wb.close()
+    return buf.getvalue()
+
+
+# ---------- Formato colonnare ----------
+# tipo di ogni colonna (nomi come nei record/CSV); le colonne di testata compaiono nell'export dello storico.
+# "categoria" = dizionario con valori aperti, una lista = categorie fisse
+TIPI_COLONNARI = {
+    "Audit": "int32", "Fornitore": "categoria", "Data audit": "data", "Auditor": "testo", "Catalogo": "testo",
+    "ID": "testo", "Applicabile": "bool", "N": "int16", "Sezione": "categoria", "Requisito": "testo",
+    "Riferimento": "testo", "Stato": STATI, "NC Livello": LIVELLI, "Note": "testo", "Allegati": "testo",
+    "Punteggio": "float32", "Punteggio ponderato": "float32", "Cause": "testo", "Trattamento": "testo",
+    "Periodo": "categoria", "Data trattamento": "data", "Data verifica": "data", "Responsabile": "categoria",
+}
+# testata audit (tabella `audit`) -> colonne dell'export storico
+COLONNE_TESTATA = {"audit_id": "Audit", "fornitore": "Fornitore", "data_audit": "Data audit",
+                   "auditor": "Auditor", "catalogo_id": "Catalogo"}
+# audit letti dall'archivio per blocco nell'export dello storico
+BLOCCO_STORICO = 500
+
+Fonte = Union[str, bytes, memoryview]
+
+
+def _date(s: pd.Series) -> pd.Series:
+    # già tipizzate (audit_record.frame_record); record testuali: GG/MM/AAAA; archivio: AAAA-MM-GG
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s
+    s = s.astype(object).where(s.notna(), None)
+    return pd.to_datetime(s, format="%d/%m/%Y", errors="coerce").fillna(
+        pd.to_datetime(s, format="%Y-%m-%d", errors="coerce"))
+
+
+def tipizza_record(df: pd.DataFrame) -> pd.DataFrame:
+    """Record (formato app o righe dell'archivio già rinominate) -> colonne tipizzate di ``TIPI_COLONNARI``.
+
+    Le colonne non previste (es. ``_files``) vengono scartate.
+    """
+    out = {}
+    for c, tipo in TIPI_COLONNARI.items():
+        if c not in df:
+            continue
+        s = df[c]
+        if tipo == "bool":
+            out[c] = s.isin(["Sì", 1, True])
+        elif tipo == "data":
+            out[c] = _date(s)
+        elif tipo == "categoria":
+            out[c] = s.fillna("").astype(str).astype("category")
+        elif isinstance(tipo, list):
+            out[c] = pd.Categorical(s.fillna(""), categories=tipo)
+        elif tipo == "testo":
+            out[c] = s.fillna("").astype(str)
+        elif tipo.startswith("int"):
+            out[c] = pd.to_numeric(s, errors="coerce").astype(tipo.capitalize())
+        else:
+            out[c] = pd.to_numeric(s, errors="coerce").astype(tipo)
+    return pd.DataFrame(out, index=df.index).reset_index(drop=True)
+
+
+def _schema(colonne: Sequence[str]):
+    import pyarrow as pa
+
+    tipi = {"bool": pa.bool_(), "data": pa.date32(), "testo": pa.string(), "int16": pa.int16(),
+            "int32": pa.int32(), "float32": pa.float32()}
+    dizionario = pa.dictionary(pa.int32(), pa.string())
+    campi = []
+    for c in colonne:
+        t = TIPI_COLONNARI[c]
+        campi.append((c, tipi[t] if isinstance(t, str) and t in tipi else dizionario))
+    return pa.schema(campi)
+
+
+def tabella_arrow(df: pd.DataFrame, metadati: Optional[Mapping[str, str]] = None):
+    """Record -> ``pyarrow.Table`` tipizzata; ``metadati`` finisce nei metadati di schema (chiavi ``audit.*``)."""
+    import pyarrow as pa
+
+    tip = tipizza_record(df)
+    table = pa.Table.from_pandas(tip, schema=_schema(list(tip.columns)), preserve_index=False)
+    if metadati:
+        extra = {f"audit.{k}".encode(): str(v).encode("utf-8") for k, v in metadati.items() if v is not None}
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), **extra})
+    return table
+
+
+def export_parquet(df: pd.DataFrame, metadati: Optional[Mapping[str, str]] = None) -> bytes:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    buf = pa.BufferOutputStream()
+    pq.write_table(tabella_arrow(df, metadati), buf, compression="zstd")
+    return buf.getvalue().to_pybytes()
+
+
+def export_arrow(df: pd.DataFrame, metadati: Optional[Mapping[str, str]] = None) -> bytes:
+    """Arrow IPC (file, non compresso: leggibile in memory map senza copie)."""
+    import pyarrow as pa
+
+    table = tabella_arrow(df, metadati)
+    buf = pa.BufferOutputStream()
+    with pa.ipc.new_file(buf, table.schema) as w:
+        w.write_table(table)
+    return buf.getvalue().to_pybytes()
+
+
+def _formato(dest: str) -> str:
+    ext = os.path.splitext(dest)[1].lower()
+    if ext == ".parquet":
+        return "parquet"
+    if ext in (".arrow", ".feather"):
+        return "arrow"
+    raise ValueError(f"Formato non riconosciuto per {dest!r}: usare .parquet, .arrow o .feather")
+
+
+def esporta_storico(store, dest: str, fornitore: str = "", dal: Optional[date] = None, al: Optional[date] = None,
+                    blocco: int = BLOCCO_STORICO) -> int:
+    """Scrive in `dest` (.parquet o .arrow/.feather) i record di tutti gli audit filtrati, con la testata.
+
+    L'archivio viene letto a blocchi di `blocco` audit. In Parquet ogni blocco è un row group scritto
+    subito; l'Arrow IPC ammette un solo dizionario per colonna, quindi i blocchi vengono uniti e i
+    dizionari unificati prima della scrittura. Restituisce il numero di righe scritte.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    from audit_store import COLONNE_RECORD
+
+    formato = _formato(dest)
+    nomi = {**{v: k for k, v in COLONNE_RECORD.items()}, **COLONNE_TESTATA}
+    ids = sorted(a["id"] for a in store.cerca_audit(fornitore, dal=dal, al=al, limit=10 ** 9))
+    schema = _schema([c for c in TIPI_COLONNARI])
+    tmp = dest + ".tmp"
+    righe, tabelle, writer = 0, [], None
+    try:
+        if formato == "parquet":
+            writer = pq.ParquetWriter(tmp, schema, compression="zstd")
+        for i in range(0, len(ids), blocco):
+            df = store.record_storici(audit_ids=ids[i:i + blocco]).rename(columns=nomi)
+            df = df.sort_values(["Audit", "Sezione", "N"], kind="stable")
+            table = pa.Table.from_pandas(tipizza_record(df), schema=schema, preserve_index=False)
+            righe += table.num_rows
+            if writer is not None:
+                writer.write_table(table)
+            else:
+                tabelle.append(table)
+        if writer is not None:
+            writer.close()
+            writer = None
+        else:
+            table = pa.concat_tables(tabelle).unify_dictionaries() if tabelle else schema.empty_table()
+            with pa.OSFile(tmp, "wb") as fh, pa.ipc.new_file(fh, schema) as w:
+                w.write_table(table)
+        os.replace(tmp, dest)
+    finally:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return righe
+
+
+def leggi_colonnare(fonte: Fonte, colonne: Optional[Sequence[str]] = None):
+    """Apre un export Parquet o Arrow (percorso o bytes) come ``pyarrow.Table``, leggendo solo `colonne`.
+
+    Da file l'Arrow è mappato in memoria: i buffer della tabella puntano al file, senza copie;
+    il Parquet va comunque decodificato, ma si leggono solo le colonne richieste.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if isinstance(fonte, str):
+        with open(fonte, "rb") as fh:
+            magic = fh.read(6)
+        src = pa.memory_map(fonte) if magic == b"ARROW1" else fonte
+    else:
+        magic = bytes(fonte[:6])
+        src = pa.BufferReader(pa.py_buffer(fonte))
+    if magic == b"ARROW1":
+        table = pa.ipc.open_file(src).read_all()
+        return table.select(list(colonne)) if colonne is not None else table
+    if magic[:4] == b"PAR1":
+        return pq.read_table(src, columns=list(colonne) if colonne is not None else None, memory_map=True)
+    raise ValueError("Né Parquet né Arrow IPC")
+
+
+def metadati_colonnari(table) -> dict:
+    """Metadati ``audit.*`` scritti da :func:`tabella_arrow`."""
+    meta = table.schema.metadata or {}
+    return {k.decode()[6:]: v.decode("utf-8") for k, v in meta.items() if k.startswith(b"audit.")}
+
+
+def record_da_colonnare(fonte) -> pd.DataFrame:
+    """Import: export Parquet/Arrow (percorso, bytes o ``pyarrow.Table`` già letta) -> record nel formato
+    dell'app e di CSV/Excel ("Sì"/"No", date GG/MM/AAAA)."""
+    import pyarrow as pa
+
+    table = fonte if isinstance(fonte, pa.Table) else leggi_colonnare(fonte)
+    df = table.to_pandas(date_as_object=False)
+    for c, tipo in TIPI_COLONNARI.items():
+        if c not in df:
+            continue
+        if tipo == "bool":
+            df[c] = df[c].map({True: "Sì", False: "No"})
+        elif tipo == "data":
+            df[c] = df[c].dt.strftime("%d/%m/%Y").fillna("")
+        elif tipo == "categoria" or isinstance(tipo, list):
+            df[c] = df[c].astype(str).where(df[c].notna(), "")
+        elif tipo.startswith("float"):
+            df[c] = df[c].astype("float64")
+    return df
+
+
+def leggi_export(fonte: Fonte, nome: str = "") -> Tuple[pd.DataFrame, dict]:
+    """Rilegge un export dell'app (CSV, Excel, Parquet o Arrow; percorso o bytes) nel formato dei record.
+
+    Il formato si riconosce dall'estensione di `nome` (o del percorso). Restituisce i record come testo
+    (punteggi e N numerici) e i metadati di testata degli export colonnari (vuoti per CSV/Excel).
+    """
+    nome = (nome or (fonte if isinstance(fonte, str) else "")).lower()
+    sorgente = fonte if isinstance(fonte, str) else BytesIO(bytes(fonte))
+    if nome.endswith((".parquet", ".arrow", ".feather")):
+        table = leggi_colonnare(fonte)
+        return record_da_colonnare(table), metadati_colonnari(table)
+    if nome.endswith(".csv"):
+        df = pd.read_csv(sorgente, dtype=str, keep_default_na=False)
+    elif nome.endswith((".xlsx", ".xls")):
+        df = pd.read_excel(sorgente, dtype=str).fillna("")
+    else:
+        raise ValueError(f"Formato non riconosciuto per {nome!r}: usare CSV, Excel, Parquet o Arrow")
+    for c in ("Punteggio", "Punteggio ponderato", "N"):
+        if c in df:
+            df[c] = pd.to_numeric(df[c], errors="coerce")
+    return df, {}
+
+
+def main(argv=None) -> int:
+    """Export dello storico da riga di comando, es. ``python audit_export.py storico.parquet --dal 2026-01-01``."""
+    import argparse
+    import time
+
+    from audit_store import DB_PATH, AuditStore
+
+    ap = argparse.ArgumentParser(description="Esporta i record di tutti gli audit archiviati in Parquet o Arrow.")
+    ap.add_argument("dest", help="file di destinazione (.parquet, .arrow o .feather)")
+    ap.add_argument("--db", default=DB_PATH, help=f"archivio SQLite (default: {DB_PATH})")
+    ap.add_argument("--fornitore", default="", help="solo fornitori che iniziano con il testo dato")
+    ap.add_argument("--dal", type=date.fromisoformat, default=None, help="data audit minima AAAA-MM-GG")
+    ap.add_argument("--al", type=date.fromisoformat, default=None, help="data audit massima AAAA-MM-GG")
+    args = ap.parse_args(argv)
+    try:
+        _formato(args.dest)
+    except ValueError as e:
+        ap.error(str(e))
+    store = AuditStore(args.db)
+    t0 = time.perf_counter()
+    try:
+        righe = esporta_storico(store, args.dest, args.fornitore, args.dal, args.al)
+    finally:
+        store.close()
+    print(f"{righe} righe in {args.dest} ({os.path.getsize(args.dest) / 1e6:.1f} MB, "
+          f"{time.perf_counter() - t0:.1f}s)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,59 @@
+# audit_filters.py
+"""Filtri di vista sui requisiti dell'audit in corso.
+
+Tutti i criteri vengono valutati insieme come un'unica maschera booleana sul
+frame dei record (``audit_record.frame_record``; vanno bene anche i record
+testuali di CSV/Excel, con date GG/MM/AAAA). La stessa maschera decide quali
+schede disegnare e quali righe mostrare nel riepilogo; i record nascosti
+restano nei punteggi.
+"""
+from datetime import date
+from typing import Collection, NamedTuple, Optional
+
+import pandas as pd
+
+CAMPI_DATA = ("Data trattamento", "Data verifica")
+
+
+class Filtri(NamedTuple):
+    solo_nc: bool = False
+    ids: Optional[Collection[str]] = None  # esito della ricerca testuale (None = nessuna ricerca)
+    sezioni: tuple = ()
+    livelli: tuple = ()
+    responsabili: tuple = ()
+    dal: Optional[date] = None
+    al: Optional[date] = None
+    campo_data: str = "Data trattamento"
+
+    @property
+    def attivi(self) -> bool:
+        return bool(self.solo_nc or self.ids is not None or self.sezioni or self.livelli or self.responsabili
+                    or self.dal or self.al)
+
+
+def maschera(df: pd.DataFrame, f: Filtri) -> pd.Series:
+    """True per i record che soddisfano tutti i filtri; livello, responsabile e date valgono solo per le NC."""
+    m = pd.Series(True, index=df.index)
+    if df.empty or not f.attivi:
+        return m
+    if f.solo_nc:
+        m &= df["Stato"] == "Non conforme"
+    if f.ids is not None:
+        m &= df["ID"].isin(f.ids)
+    if f.sezioni:
+        m &= df["Sezione"].isin(f.sezioni)
+    if f.livelli:
+        m &= df["NC Livello"].isin(f.livelli)
+    if f.responsabili:
+        m &= df["Responsabile"].isin(f.responsabili)
+    if f.dal or f.al:
+        if f.campo_data not in CAMPI_DATA:
+            raise ValueError(f"campo_data: {f.campo_data!r} (ammessi: {', '.join(CAMPI_DATA)})")
+        d = df[f.campo_data]
+        if not pd.api.types.is_datetime64_any_dtype(d):
+            d = pd.to_datetime(d, format="%d/%m/%Y", errors="coerce")
+        if f.dal:
+            m &= d >= pd.Timestamp(f.dal)
+        if f.al:
+            m &= d <= pd.Timestamp(f.al)
+    return m
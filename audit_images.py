@@ -0,0 +1,85 @@
+# audit_images.py
+"""Preparazione delle immagini per l'appendice fotografica del PDF.
+
+Le foto caricate dal telefono (10-12 MP) vengono raddrizzate secondo l'EXIF,
+ridotte alla risoluzione utile per il riquadro in cui verranno stampate e
+ricompresse. Il risultato è memorizzato per hash del contenuto, così più
+generazioni dello stesso report non rielaborano le stesse foto.
+"""
+import hashlib
+from io import BytesIO
+from typing import Optional, Tuple, Union
+
+from PIL import Image, ImageOps
+
+from audit_cache import BoundedCache
+
+DPI_DEFAULT = 150
+QUALITA_DEFAULT = 80
+# ReportLab incorpora i JPEG così come sono (DCTDecode); il WEBP viene invece
+# ridecodificato e salvato in Flate, quindi conviene solo fuori dal PDF.
+FORMATI = ("JPEG", "WEBP")
+
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+_cache = BoundedCache(CACHE_MAX_BYTES, sizeof=lambda res: len(res[0]))
+
+
+def hash_contenuto(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def dimensioni_target(iw: int, ih: int, box_w: float, box_h: float, dpi: int) -> Tuple[int, int]:
+    """Dimensioni in pixel per stampare l'immagine nel riquadro (punti PDF) al DPI richiesto.
+    L'immagine viene solo ridotta, mai ingrandita."""
+    max_px_w = box_w / 72.0 * dpi
+    max_px_h = box_h / 72.0 * dpi
+    scale = min(max_px_w / iw, max_px_h / ih, 1.0)
+    return max(1, round(iw * scale)), max(1, round(ih * scale))
+
+
+def _elabora(data: Union[bytes, str], box_w: float, box_h: float, dpi: int, formato: str, qualita: int) -> Tuple[bytes, Tuple[int, int]]:
+    # un percorso viene letto da PIL a blocchi, senza caricare il file intero in memoria
+    with Image.open(data if isinstance(data, str) else BytesIO(data)) as im:
+        if im.format == "JPEG":
+            # decodifica già ridotta (1/2, 1/4, 1/8): l'orientamento EXIF non è ancora
+            # applicato, quindi si chiede il lato massimo fra le due rotazioni
+            lato = max(dimensioni_target(im.width, im.height, box_w, box_h, dpi)
+                       + dimensioni_target(im.height, im.width, box_w, box_h, dpi))
+            im.draft("RGB", (lato, lato))
+        im = ImageOps.exif_transpose(im)
+        size = dimensioni_target(im.width, im.height, box_w, box_h, dpi)
+        if size != im.size:
+            im = im.resize(size, Image.LANCZOS)
+        if im.mode in ("RGBA", "LA", "P"):
+            im = im.convert("RGBA")
+            fondo = Image.new("RGB", im.size, (255, 255, 255))
+            fondo.paste(im, mask=im.getchannel("A"))
+            im = fondo
+        elif im.mode != "RGB":
+            im = im.convert("RGB")
+        out = BytesIO()
+        if formato == "WEBP":
+            im.save(out, format="WEBP", quality=qualita, method=4)
+        else:
+            im.save(out, format="JPEG", quality=qualita, optimize=True, progressive=True)
+        return out.getvalue(), im.size
+
+
+def prepara_immagine(data: Union[bytes, str], box_w: float, box_h: float, dpi: int = DPI_DEFAULT,
+                     formato: str = "JPEG", qualita: int = QUALITA_DEFAULT,
+                     sha256: Optional[str] = None) -> Tuple[bytes, Tuple[int, int]]:
+    """Restituisce (bytes ricompressi, (larghezza_px, altezza_px)) per il riquadro box_w x box_h punti.
+    `data` sono i byte dell'immagine o il percorso del file; con un percorso va indicato `sha256`."""
+    if formato not in FORMATI:
+        raise ValueError(f"Formato immagine non supportato: {formato}")
+    if sha256 is None:
+        if isinstance(data, str):
+            raise ValueError("sha256 obbligatorio quando data è un percorso")
+        sha256 = hash_contenuto(data)
+    key = (sha256, round(box_w), round(box_h), int(dpi), formato, int(qualita))
+    res = _cache.get(key)
+    if res is None:
+        res = _elabora(data, box_w, box_h, int(dpi), formato, int(qualita))
+        _cache.put(key, res)
+    return res
@@ -0,0 +1,174 @@
+# audit_jobs.py
+"""Generazione dei report PDF in background, su un pool di thread condiviso dal server.
+
+Lo script Streamlit invia il lavoro e torna subito all'utente; l'avanzamento si
+legge dal :class:`LavoroPDF` (fase corrente e frazione completata), che si può
+annullare. Richieste identiche (stessa impronta, vedi
+``audit_report.fingerprint_report``) mentre un lavoro è ancora in corso
+restituiscono lo stesso lavoro invece di avviarne un secondo, anche da
+sessioni diverse; i report completati finiscono nella cache condivisa e il
+lavoro concluso ne conserva solo stato e chiave.
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, Optional
+
+from audit_cache import BoundedCache
+
+# generazioni contemporanee per processo (le altre restano in coda)
+PDF_WORKERS = int(os.environ.get("AUDIT_PDF_WORKERS", "2"))
+# per quanto un lavoro concluso resta consultabile per id (solo lo stato: il report sta nella cache)
+CONSERVA_S = 3600
+
+IN_CODA, IN_CORSO, COMPLETATO, ANNULLATO, ERRORE = "in coda", "in corso", "completato", "annullato", "errore"
+
+
+class Annullato(Exception):
+    """Sollevata dentro la generazione, al primo avanzamento dopo la richiesta di annullamento."""
+
+
+class LavoroPDF:
+    __slots__ = ("id", "chiave", "stato", "fase", "progresso", "report", "errore",
+                 "richieste", "creato", "concluso", "_annulla", "_future")
+
+    def __init__(self, chiave: Hashable):
+        self.id = uuid.uuid4().hex[:12]
+        self.chiave = chiave
+        self.stato = IN_CODA
+        self.fase = "In coda"
+        self.progresso = 0.0
+        self.report = None
+        self.errore = ""
+        self.richieste = 1  # sessioni che aspettano questo lavoro
+        self.creato = time.monotonic()
+        self.concluso: Optional[float] = None
+        self._annulla = threading.Event()
+        self._future = None
+
+    @property
+    def in_corso(self) -> bool:
+        return self.stato in (IN_CODA, IN_CORSO)
+
+    def avanzamento(self, fase: str, frazione: float) -> None:
+        """Callback passata alla generazione: aggiorna lo stato e interrompe se annullato."""
+        if self._annulla.is_set():
+            raise Annullato()
+        self.fase = fase
+        self.progresso = min(max(frazione, 0.0), 1.0)
+
+    def _chiudi(self, stato: str) -> None:
+        self.stato = stato
+        self.concluso = time.monotonic()
+
+
+class CodaPDF:
+    """Pool limitato di generatori PDF con deduplica dei lavori in corso.
+
+    `cache` (opzionale) è la cache dei report: una richiesta già in cache torna
+    subito come lavoro completato, e ogni report generato vi viene salvato. Il
+    report si legge con :meth:`report`: con la cache il lavoro non ne tiene una
+    copia (la memoria la governano i limiti della cache); senza, lo tiene fino
+    alla prima lettura.
+    """
+
+    def __init__(self, workers: int = PDF_WORKERS, cache: Optional[BoundedCache] = None,
+                 conserva: float = CONSERVA_S):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="audit-pdf")
+        self._cache = cache
+        self._conserva = conserva
+        self._lavori: Dict[str, LavoroPDF] = {}
+        self._attivi: Dict[Hashable, LavoroPDF] = {}
+        self._lock = threading.Lock()
+
+    def invia(self, chiave: Hashable, genera: Callable, *args, **kwargs) -> LavoroPDF:
+        """Accoda ``genera(*args, avanzamento=..., **kwargs)``, che deve restituire il report.
+
+        Se un lavoro con la stessa chiave è già in corso lo restituisce (contando una richiesta in più).
+        """
+        with self._lock:
+            self._pulisci()
+            lav = self._attivi.get(chiave)
+            if lav is not None:
+                lav.richieste += 1
+                return lav
+            lav = LavoroPDF(chiave)
+            self._lavori[lav.id] = lav
+            if self._cache is not None and chiave in self._cache:
+                lav.fase, lav.progresso = "Completato", 1.0
+                lav._chiudi(COMPLETATO)
+                return lav
+            self._attivi[chiave] = lav
+            lav._future = self._pool.submit(self._esegui, lav, genera, args, kwargs)
+            return lav
+
+    def lavoro(self, id_lavoro: Optional[str]) -> Optional[LavoroPDF]:
+        if not id_lavoro:
+            return None
+        with self._lock:
+            self._pulisci()
+            return self._lavori.get(id_lavoro)
+
+    def report(self, lav: LavoroPDF):
+        """Report di un lavoro completato; None se non è più disponibile (uscito dalla cache o già consegnato)."""
+        if lav.stato != COMPLETATO:
+            return None
+        if self._cache is not None:
+            return self._cache.get(lav.chiave)
+        with self._lock:
+            report, lav.report = lav.report, None
+        return report
+
+    def annulla(self, id_lavoro: str) -> None:
+        """Ritira una richiesta; il lavoro si ferma solo quando nessun'altra sessione lo aspetta."""
+        with self._lock:
+            lav = self._lavori.get(id_lavoro)
+            if lav is None or not lav.in_corso:
+                return
+            lav.richieste -= 1
+            if lav.richieste > 0:
+                return
+            lav._annulla.set()
+            if lav._future is not None and lav._future.cancel():  # non ancora partito
+                self._concludi(lav, ANNULLATO, "Annullato")
+
+    def _esegui(self, lav: LavoroPDF, genera: Callable, args, kwargs) -> None:
+        if lav._annulla.is_set():  # annullato mentre partiva
+            with self._lock:
+                self._concludi(lav, ANNULLATO, "Annullato")
+            return
+        lav.stato, lav.fase = IN_CORSO, "Avvio"
+        try:
+            report = genera(*args, avanzamento=lav.avanzamento, **kwargs)
+        except Annullato:
+            with self._lock:
+                self._concludi(lav, ANNULLATO, "Annullato")
+            return
+        except Exception as e:
+            with self._lock:
+                lav.errore = f"{type(e).__name__}: {e}"
+                self._concludi(lav, ERRORE, "Errore")
+            return
+        if self._cache is not None:
+            self._cache.put(lav.chiave, report)
+        with self._lock:
+            if self._cache is None:
+                lav.report = report
+            lav.progresso = 1.0
+            self._concludi(lav, COMPLETATO, "Completato")
+
+    def _concludi(self, lav: LavoroPDF, stato: str, fase: str) -> None:
+        # chiamata con il lock: da qui una nuova richiesta uguale avvia un altro lavoro
+        lav.fase = fase
+        lav._chiudi(stato)
+        if self._attivi.get(lav.chiave) is lav:
+            del self._attivi[lav.chiave]
+
+    def _pulisci(self) -> None:
+        # chiamata con il lock, a ogni invio e a ogni lettura di un lavoro
+        ora = time.monotonic()
+        for k in [k for k, lav in self._lavori.items()
+                  if lav.concluso is not None and ora - lav.concluso > self._conserva]:
+            del self._lavori[k]
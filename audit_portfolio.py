@@ -0,0 +1,147 @@
+# audit_portfolio.py
+"""Vista di portafoglio su tutti gli audit archiviati.
+
+I record dell'archivio SQLite vengono convertiti una volta in una tabella
+colonnare tipizzata (categorie, float32, datetime) e salvati come snapshot
+Parquet accanto al database; quando l'archivio cambia vengono riletti solo
+gli audit modificati. Le aggregazioni usano ``audit_scoring.aggrega`` sullo
+stesso frame, raggruppando per fornitore, sezione, livello NC o periodo.
+"""
+import os
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from audit_scoring import LIVELLI, STATI, aggrega
+from audit_store import AuditStore
+
+# colonne tabella `record` lette dall'archivio -> nomi usati da UI e scoring
+COLONNE = {
+    "sezione": "Sezione", "stato": "Stato", "nc_livello": "NC Livello",
+    "punteggio": "Punteggio", "punteggio_pond": "Punteggio ponderato",
+}
+
+
+def _tipizza(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.rename(columns={"audit_id": "Audit", "fornitore": "Fornitore", "data_audit": "Data audit", **COLONNE})
+    out = pd.DataFrame({
+        "Audit": df["Audit"].astype("int32"),
+        "Fornitore": df["Fornitore"].fillna("").astype("category"),
+        "Data audit": pd.to_datetime(df["Data audit"], errors="coerce"),
+        "Sezione": df["Sezione"].astype("category"),
+        "Stato": pd.Categorical(df["Stato"], categories=STATI),
+        "NC Livello": pd.Categorical(df["NC Livello"].fillna(""), categories=LIVELLI),
+        "Punteggio": df["Punteggio"].astype("float32"),
+        "Punteggio ponderato": df["Punteggio ponderato"].astype("float32"),
+    })
+    return out
+
+
+def _unisci(vecchi: pd.DataFrame, nuovi: pd.DataFrame) -> pd.DataFrame:
+    """Concatena due frame tipizzati mantenendo le colonne categoriche (unione delle categorie)."""
+    if nuovi.empty:
+        return vecchi.reset_index(drop=True)
+    vecchi, nuovi = vecchi.copy(), nuovi.copy()
+    for c in ("Fornitore", "Sezione"):
+        cat = vecchi[c].cat.categories.union(nuovi[c].cat.categories)
+        vecchi[c] = vecchi[c].cat.set_categories(cat)
+        nuovi[c] = nuovi[c].cat.set_categories(cat)
+    out = pd.concat([vecchi, nuovi], ignore_index=True)
+    for c in ("Fornitore", "Sezione"):
+        # categorie rimaste senza righe (audit eliminati); bincount sui codici costa molto meno di
+        # remove_unused_categories, che ordina l'intera colonna
+        codici = out[c].cat.codes.to_numpy()
+        usate = np.bincount(codici[codici >= 0], minlength=len(out[c].cat.categories)) > 0
+        if not usate.all():
+            out[c] = out[c].cat.remove_categories(out[c].cat.categories[~usate])
+    return out
+
+
+def carica_portafoglio(store: AuditStore, snapshot: Optional[str] = None,
+                       precedente: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """Record di tutti gli audit in formato colonnare, versione dell'archivio in ``df.attrs["versione"]``.
+
+    Parte da ``precedente`` (frame di una chiamata precedente) o dallo snapshot
+    Parquet e rilegge solo gli audit modificati o eliminati da allora, come
+    ``IndiceArchivio.sincronizza``; senza base legge tutto l'archivio. Lo
+    snapshot viene riscritto solo quando non si parte da ``precedente``, così
+    i salvataggi automatici non lo riscrivono a ogni modifica.
+    """
+    import pyarrow.parquet as pq
+
+    if snapshot is None and store.path != ":memory:":
+        snapshot = os.path.splitext(store.path)[0] + "_portafoglio.parquet"
+    _, versione = store.versione_dati()
+    base, da_snapshot = None, False
+    if precedente is not None and "versione" in precedente.attrs:
+        base = precedente
+    elif snapshot and os.path.exists(snapshot):
+        meta = pq.read_schema(snapshot).metadata or {}
+        if b"versione" in meta:
+            base = pq.read_table(snapshot, memory_map=True).to_pandas()
+            base.attrs["versione"] = int(meta[b"versione"])
+            da_snapshot = True
+    if base is not None and base.attrs["versione"] == versione:
+        return base
+
+    if base is None:
+        df = _tipizza(store.record_storici(colonne=list(COLONNE)))
+    else:
+        modificati = [a["id"] for a in store.audit_modificati(base.attrs["versione"])]
+        tieni = base["Audit"].isin(store.id_audit()) & ~base["Audit"].isin(modificati)
+        nuovi = _tipizza(store.record_storici(audit_ids=modificati, colonne=list(COLONNE))) if modificati else base[:0]
+        df = _unisci(base[tieni], nuovi)
+    # versione letta prima degli audit: una scrittura concorrente viene riletta alla chiamata successiva
+    df.attrs["versione"] = versione
+    if snapshot and (precedente is None or da_snapshot):
+        import pyarrow as pa
+
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), b"versione": str(versione).encode()})
+        tmp = snapshot + ".tmp"
+        pq.write_table(table, tmp, compression="zstd")
+        os.replace(tmp, snapshot)
+    return df
+
+
+def filtra(df: pd.DataFrame, dal=None, al=None, fornitori=None) -> pd.DataFrame:
+    mask = pd.Series(True, index=df.index)
+    if dal is not None:
+        mask &= df["Data audit"] >= pd.Timestamp(dal)
+    if al is not None:
+        mask &= df["Data audit"] <= pd.Timestamp(al)
+    if fornitori:
+        mask &= df["Fornitore"].isin(fornitori)
+    return df[mask]
+
+
+def _tabella(agg: pd.DataFrame) -> pd.DataFrame:
+    return agg[["% Conformità", "% Conformità ponderata", "Conformi", "Non conformi", "Valutati"]].reset_index()
+
+
+def per_fornitore(df: pd.DataFrame) -> pd.DataFrame:
+    agg = aggrega(df, by="Fornitore")
+    info = df.groupby("Fornitore", observed=True).agg(**{
+        "Audit": ("Audit", "nunique"), "Ultimo audit": ("Data audit", "max")})
+    out = _tabella(agg).merge(info.reset_index(), on="Fornitore", how="left")
+    return out.sort_values("% Conformità", ascending=True, na_position="last", kind="stable")
+
+
+def per_sezione(df: pd.DataFrame) -> pd.DataFrame:
+    return _tabella(aggrega(df, by="Sezione")).sort_values("% Conformità", na_position="last", kind="stable")
+
+
+def nc_per_livello(df: pd.DataFrame, by: str = "Sezione") -> pd.DataFrame:
+    """Conteggio NC per livello (colonne) e `by` (righe)."""
+    nc = df[df["Stato"] == "Non conforme"]
+    livello = nc["NC Livello"].cat.remove_unused_categories()
+    return pd.crosstab(nc[by], livello).rename_axis(columns=None).reset_index()
+
+
+def andamento(df: pd.DataFrame, freq: str = "M") -> pd.DataFrame:
+    """Conformità per mese ("M") o anno ("Y") della data audit."""
+    # troncamento numpy della data: molto più rapido di dt.to_period su centinaia di migliaia di righe
+    periodo = pd.Series(df["Data audit"].to_numpy().astype(f"datetime64[{freq}]").astype("datetime64[ns]"), index=df.index)
+    agg = aggrega(df.assign(Periodo=periodo), by="Periodo").sort_index()
+    return agg[["% Conformità", "% Conformità ponderata", "Valutati"]]
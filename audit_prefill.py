@@ -0,0 +1,123 @@
+# audit_prefill.py
+"""Precompilazione di un nuovo audit dalle risposte di un audit precedente.
+
+La sorgente è un DataFrame nel formato dei record esportati (CSV/Excel/Parquet
+dell'app, o ``record_come_export`` di un audit archiviato). Ogni riga viene
+ricondotta a un requisito del catalogo corrente, nell'ordine:
+
+1. per ID, se esiste ancora nel catalogo;
+2. per testo del requisito (senza accenti, maiuscole e spazi superflui);
+3. per riferimento normativo, se identifica un solo requisito.
+
+Ne escono i valori dei widget di ogni scheda (stesse colonne di
+``valori_sessione`` nell'app), che l'app scrive in session_state in un solo
+callback: un unico rerun invece di uno per widget.
+"""
+import re
+from collections import Counter, defaultdict
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from audit_catalog import Catalogo
+from audit_search import normalizza
+from audit_utils import parse_date_it
+
+STATI_SCHEDA = ("Conforme", "Non conforme")
+LIVELLI_SCHEDA = ("Livello 1", "Livello 2")
+
+
+def _chiave_testo(s) -> str:
+    return re.sub(r"\s+", " ", normalizza(s)).strip(" .;:")
+
+
+def _data(v) -> Optional[date]:
+    if isinstance(v, datetime):
+        return v.date()
+    if isinstance(v, date):
+        return v
+    if v is None or (isinstance(v, float) and pd.isna(v)) or v == "":
+        return None
+    s = str(v)
+    return parse_date_it(s) if "/" in s else _iso(s)
+
+
+def _iso(s: str) -> Optional[date]:
+    try:
+        return date.fromisoformat(s[:10])
+    except ValueError:
+        return None
+
+
+def mappa_catalogo(df: pd.DataFrame, cat: Catalogo) -> Tuple[List[Optional[str]], Counter]:
+    """ID del catalogo corrente per ogni riga di `df` (None se non riconducibile) e conteggio per metodo.
+
+    Un requisito riceve al più una riga: a parità vince la prima (i duplicati contano come "non trovati").
+    """
+    per_testo: Dict[str, List[str]] = defaultdict(list)
+    per_rif: Dict[str, List[str]] = defaultdict(list)
+    for req in cat:
+        per_testo[_chiave_testo(req.requisito)].append(req.id)
+        if req.riferimento:
+            per_rif[_chiave_testo(req.riferimento)].append(req.id)
+
+    n = len(df)
+    col = {c: (df[c].fillna("").astype(str).tolist() if c in df else [""] * n) for c in ("ID", "Requisito", "Riferimento")}
+    ids: List[Optional[str]] = []
+    usati, esito = set(), Counter()
+    for rid, testo, rif in zip(col["ID"], col["Requisito"], col["Riferimento"]):
+        trovato = metodo = None
+        if rid in cat.indice:
+            trovato, metodo = rid, "ID"
+        else:
+            cand = per_testo.get(_chiave_testo(testo), [])
+            if len(cand) == 1:
+                trovato, metodo = cand[0], "testo"
+            else:
+                cand = per_rif.get(_chiave_testo(rif), []) if rif else []
+                if len(cand) == 1:
+                    trovato, metodo = cand[0], "riferimento"
+        if trovato is None or trovato in usati:
+            ids.append(None)
+            esito["non trovati"] += 1
+            continue
+        usati.add(trovato)
+        ids.append(trovato)
+        esito[metodo] += 1
+    return ids, esito
+
+
+def valori_schede(df: pd.DataFrame, ids: Sequence[Optional[str]], responsabili: Iterable[str],
+                  periodi: Sequence[str]) -> Dict[str, dict]:
+    """ID requisito -> valori della scheda (colonne di ``valori_sessione``) per le righe mappate.
+
+    Valori non più ammessi dalle schede (stato, livello, periodo) tornano al default del widget;
+    un responsabile fuori elenco diventa "Altro" con il nome nel campo libero.
+    """
+    responsabili = list(responsabili)
+    righe = df.reindex(columns=["Applicabile", "Stato", "NC Livello", "Note", "Cause", "Trattamento", "Periodo",
+                                "Data trattamento", "Data verifica", "Responsabile"]).to_dict("records")
+    out: Dict[str, dict] = {}
+    for rid, r in zip(ids, righe):
+        if rid is None:
+            continue
+        testo = {c: ("" if r[c] is None or (isinstance(r[c], float) and pd.isna(r[c])) else str(r[c]))
+                 for c in ("Stato", "NC Livello", "Note", "Cause", "Trattamento", "Periodo", "Responsabile")}
+        applicabile = r["Applicabile"] in ("Sì", "Si", "si", "sì", True, 1, "1", "True")
+        stato = testo["Stato"] if testo["Stato"] in STATI_SCHEDA else STATI_SCHEDA[0]
+        v = {"Applicabile": applicabile and testo["Stato"] in STATI_SCHEDA, "Stato": stato, "Note": testo["Note"]}
+        if stato == "Non conforme":
+            resp = testo["Responsabile"]
+            v.update({
+                "NC Livello": testo["NC Livello"] if testo["NC Livello"] in LIVELLI_SCHEDA else LIVELLI_SCHEDA[0],
+                "Cause": testo["Cause"], "Trattamento": testo["Trattamento"],
+                "Periodo": testo["Periodo"] if testo["Periodo"] in periodi else periodi[0],
+                "Data trattamento": _data(r["Data trattamento"]), "Data verifica": _data(r["Data verifica"]),
+                "Responsabile": resp if resp in responsabili or not resp else "Altro",
+                "Altro responsabile": "" if resp in responsabili else resp,
+            })
+            if not v["Responsabile"]:
+                del v["Responsabile"]
+        out[rid] = v
+    return out
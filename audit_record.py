@@ -0,0 +1,139 @@
+# audit_record.py
+"""Record dei requisiti dell'audit in corso, in forma compatta e tipizzata.
+
+Un :class:`Record` è una tupla: i dati del catalogo restano nel
+:class:`~audit_catalog.Requisito` condiviso fra le sessioni (un solo
+riferimento), le risposte hanno tipi veri (bool, date, allegati come
+riferimenti) e i punteggi non vengono memorizzati ma calcolati in blocco.
+Ad ogni run i record diventano un unico DataFrame colonnare
+(:func:`frame_record`) con stati e livelli categoriali e date ``datetime64``;
+viste e filtri lavorano su maschere di quel frame. Il formato testuale di
+CSV/Excel ("Sì"/"No", date GG/MM/AAAA) si produce solo all'export
+(:func:`formato_export`).
+"""
+from datetime import date
+from typing import Any, Dict, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from audit_catalog import Requisito
+from audit_scoring import LIVELLI, STATI
+from audit_utils import fmt_date
+
+# colonne del frame, nell'ordine dei record esportati
+COLONNE = ["ID", "Applicabile", "N", "Sezione", "Requisito", "Riferimento", "Stato", "NC Livello", "Note",
+           "Allegati", "Punteggio", "Punteggio ponderato", "Cause", "Trattamento", "Periodo", "Data trattamento",
+           "Data verifica", "Responsabile"]
+DATE = ("Data trattamento", "Data verifica")
+
+
+class Record(NamedTuple):
+    req: Requisito
+    applicabile: bool = False
+    stato: str = "Non applicabile"
+    livello: str = ""
+    note: str = ""
+    allegati: tuple = ()  # audit_attachments.Allegato
+    cause: str = ""
+    trattamento: str = ""
+    periodo: str = ""
+    data_trattamento: Optional[date] = None
+    data_verifica: Optional[date] = None
+    responsabile: str = ""
+
+    @property
+    def id(self) -> str:
+        return self.req.id
+
+    def firma(self) -> tuple:
+        """Risposte confrontabili fra due run (allegati per hash), senza il requisito."""
+        return (self.applicabile, self.stato, self.livello, self.note, tuple(a.sha256 for a in self.allegati),
+                self.cause, self.trattamento, self.periodo, self.data_trattamento, self.data_verifica,
+                self.responsabile)
+
+    def get(self, campo: str, default: Any = None) -> Any:
+        """Accesso per nome di colonna (es. "Note"), come un record dict; usato dall'indice testuale."""
+        attr = _ATTRIBUTI.get(campo)
+        if attr is None:
+            return default
+        return getattr(self.req, attr[4:]) if attr.startswith("req.") else getattr(self, attr)
+
+    def come_dict(self) -> Dict[str, Any]:
+        """Record nel formato esportato (e accettato da ``AuditStore.salva_record``)."""
+        punti, pond = punteggi(self.applicabile, self.stato, self.livello)
+        return {
+            "ID": self.req.id, "Applicabile": "Sì" if self.applicabile else "No", "N": self.req.n,
+            "Sezione": self.req.sezione, "Requisito": self.req.requisito, "Riferimento": self.req.riferimento,
+            "Stato": self.stato, "NC Livello": self.livello, "Note": self.note,
+            "Allegati": ", ".join(a.nome for a in self.allegati), "Punteggio": punti, "Punteggio ponderato": pond,
+            "Cause": self.cause, "Trattamento": self.trattamento, "Periodo": self.periodo,
+            "Data trattamento": fmt_date(self.data_trattamento), "Data verifica": fmt_date(self.data_verifica),
+            "Responsabile": self.responsabile,
+        }
+
+
+_ATTRIBUTI = {"ID": "req.id", "N": "req.n", "Sezione": "req.sezione", "Requisito": "req.requisito",
+              "Riferimento": "req.riferimento", "Applicabile": "applicabile", "Stato": "stato",
+              "NC Livello": "livello", "Note": "note", "Cause": "cause", "Trattamento": "trattamento",
+              "Periodo": "periodo", "Data trattamento": "data_trattamento", "Data verifica": "data_verifica",
+              "Responsabile": "responsabile"}
+
+
+def punteggi(applicabile: bool, stato: str, livello: str) -> Tuple[Optional[int], Optional[float]]:
+    """Punteggio semplice e ponderato (L1=0.5 / L2=0) di un requisito; None se non valutato."""
+    if not applicabile or stato not in ("Conforme", "Non conforme"):
+        return None, None
+    if stato == "Conforme":
+        return 1, 1.0
+    return 0, 0.5 if livello == "Livello 1" else 0.0
+
+
+def frame_record(records: Sequence[Record]) -> pd.DataFrame:
+    """Un solo DataFrame tipizzato per tutti i record, costruito per colonne (più ``_files``)."""
+    if not records:
+        return pd.DataFrame(columns=COLONNE + ["_files"])
+    (reqs, appl, stato, livello, note, allegati, cause, tratt, periodo, d_tratt, d_ver,
+     resp) = (list(c) for c in zip(*records))
+    appl = np.array(appl, dtype=bool)
+    stato = pd.Categorical(stato, categories=STATI)
+    livello = pd.Categorical(livello, categories=LIVELLI)
+    conforme, nc = appl & (stato == "Conforme"), appl & (stato == "Non conforme")
+    return pd.DataFrame({
+        "ID": [r.id for r in reqs],
+        "Applicabile": appl,
+        "N": np.array([r.n for r in reqs], dtype="int32"),
+        "Sezione": pd.Categorical([r.sezione for r in reqs]),
+        "Requisito": [r.requisito for r in reqs],
+        "Riferimento": [r.riferimento for r in reqs],
+        "Stato": stato,
+        "NC Livello": livello,
+        "Note": note,
+        "Allegati": [", ".join(a.nome for a in files) if files else "" for files in allegati],
+        "Punteggio": np.select([conforme, nc], [1.0, 0.0], np.nan).astype("float32"),
+        "Punteggio ponderato": np.select([conforme, nc & (livello == "Livello 1"), nc], [1.0, 0.5, 0.0],
+                                         np.nan).astype("float32"),
+        "Cause": cause,
+        "Trattamento": tratt,
+        "Periodo": pd.Categorical(periodo),
+        "Data trattamento": pd.to_datetime(pd.Series(d_tratt, dtype=object)),
+        "Data verifica": pd.to_datetime(pd.Series(d_ver, dtype=object)),
+        "Responsabile": pd.Categorical(resp),
+        "_files": allegati,
+    })
+
+
+def formato_export(df: pd.DataFrame) -> pd.DataFrame:
+    """Frame di :func:`frame_record` -> colonne testuali di CSV/Excel ("Sì"/"No", date GG/MM/AAAA)."""
+    out = df.drop(columns=["_files"], errors="ignore").copy()
+    if out["Applicabile"].dtype == bool:
+        out["Applicabile"] = np.where(out["Applicabile"], "Sì", "No")
+    for c in DATE:
+        if pd.api.types.is_datetime64_any_dtype(out[c]):
+            out[c] = out[c].dt.strftime("%d/%m/%Y").fillna("")
+    for c in out.columns:
+        if isinstance(out[c].dtype, pd.CategoricalDtype):
+            out[c] = out[c].astype(str)
+    out["Punteggio"] = out["Punteggio"].astype("Int8")
+    out["Punteggio ponderato"] = out["Punteggio ponderato"].astype("float64")
+    return out
@@ -0,0 +1,628 @@
+# audit_report.py
+"""Generazione del report PDF dell'audit (ReportLab), con cache dei report già generati.
+
+Il report è composto da frammenti PDF indipendenti (uno per sezione, appendici),
+ciascuno in cache per l'impronta del proprio contenuto e poi uniti: una modifica
+rigenera solo i frammenti che tocca. Il PDF viene scritto su un file temporaneo
+(in memoria solo sotto ``SPOOL_MAX_MEMORIA``) e letto solo al momento del
+download; gli allegati PDF vengono accodati pagina per pagina in un'appendice
+documentale, fino a ``ALLEGATI_PDF_MAX`` byte in totale.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from io import BytesIO
+from contextlib import contextmanager
+from datetime import date
+from functools import partial
+from itertools import groupby
+from typing import BinaryIO, Callable, Iterator, List, NamedTuple, Optional
+from xml.sax.saxutils import escape
+
+import pandas as pd
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import cm
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.platypus import (
+    BaseDocTemplate, PageTemplate, Frame,
+    Paragraph, Spacer, Table, TableStyle,
+    PageBreak, Image as RLImage
+)
+
+from audit_cache import BoundedCache
+from audit_charts import dati_sezioni, disegno_nc, disegno_sezioni, distribuzione_nc, impronta_grafico
+from audit_export import digest_df
+from audit_scoring import aggrega, totali, percentuali
+from audit_images import prepara_immagine, hash_contenuto, DPI_DEFAULT, QUALITA_DEFAULT
+from audit_attachments import percorso
+from audit_timing import Cronometro
+from audit_utils import fmt_date
+
+# Cache dei PDF generati: max 256 MB e 1 ora per voce
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+CACHE_MAX_AGE = 3600
+# oltre questa dimensione il PDF in costruzione passa dalla RAM a un file temporaneo
+SPOOL_MAX_MEMORIA = 8 * 1024 * 1024
+# pypdf tiene in memoria tutte le pagine accodate fino alla scrittura finale (non sa scrivere
+# un PDF a flusso, e la modalità incrementale rilegge comunque l'intero file): gli allegati
+# PDF oltre questo totale restano solo nell'elenco dell'appendice documentale
+ALLEGATI_PDF_MAX = int(os.environ.get("AUDIT_ALLEGATI_PDF_MB", "64")) * 1024 * 1024
+# le tabelle lunghe vengono spezzate in blocchi: ReportLab ricalcola l'altezza di tutte
+# le righe rimanenti a ogni salto pagina, quindi il costo cresce col quadrato delle righe
+RIGHE_PER_TABELLA = 80
+
+# ---- Stili (creati una volta al caricamento del modulo, condivisi da tutti i report) ----
+_base = getSampleStyleSheet()
+H1 = ParagraphStyle("H1", parent=_base["Heading1"], fontSize=18, spaceAfter=8, leading=22, textColor=colors.HexColor("#0f172a"))
+H2 = ParagraphStyle("H2", parent=_base["Heading2"], fontSize=14, spaceBefore=8, spaceAfter=4, textColor=colors.HexColor("#111827"))
+P = ParagraphStyle("P", parent=_base["BodyText"], fontSize=10, leading=13)
+Small = ParagraphStyle("Small", parent=_base["BodyText"], fontSize=9, textColor=colors.grey)
+Cell = ParagraphStyle("Cell", parent=P, fontSize=8.55, leading=11, wordWrap='LTR')
+CellSmall = ParagraphStyle("CellSmall", parent=P, fontSize=8.2, leading=10.5, wordWrap='LTR')
+HeaderCell = ParagraphStyle("HeaderCell", parent=_base["Heading4"], fontSize=8.0, leading=11)
+# TEXTCOLOR di TableStyle colora solo le celle di testo semplice: i Paragraph usano il colore del loro stile
+ROSSO_NC, ROSSO_APPENDICE = colors.HexColor("#b91c1c"), colors.HexColor("#7f1d1d")
+CellNC = ParagraphStyle("CellNC", parent=Cell, textColor=ROSSO_NC)
+CellSmallNC = ParagraphStyle("CellSmallNC", parent=CellSmall, textColor=ROSSO_NC)
+CellApp = ParagraphStyle("CellApp", parent=Cell, textColor=ROSSO_APPENDICE)
+CellSmallApp = ParagraphStyle("CellSmallApp", parent=CellSmall, textColor=ROSSO_APPENDICE)
+
+_GRIGLIA = [
+    ("FONTNAME", (0,0), (-1,0), "Helvetica-Bold"),
+    ("BOX", (0,0), (-1,-1), 0.5, colors.grey),
+    ("INNERGRID", (0,0), (-1,-1), 0.25, colors.grey),
+    ("VALIGN", (0,0), (-1,-1), "TOP"),
+    # celle di testo semplice con il corpo delle celle Paragraph (vedi _celle)
+    ("FONTNAME", (0,1), (-1,-1), "Helvetica"),
+    ("FONTSIZE", (0,1), (-1,-1), Cell.fontSize),
+    ("LEADING", (0,1), (-1,-1), Cell.leading),
+]
+STILE_SEZIONE = TableStyle(_GRIGLIA + [
+    ("FONTSIZE", (3,1), (4,-1), CellSmall.fontSize),
+    ("LEADING", (3,1), (4,-1), CellSmall.leading),
+    ("BACKGROUND", (0,0), (-1,0), colors.HexColor("#e5e7eb")),
+    ("LEFTPADDING", (0,0), (-1,-1), 4),
+    ("RIGHTPADDING", (0,0), (-1,-1), 4),
+    ("TOPPADDING", (0,0), (-1,-1), 3),
+    ("BOTTOMPADDING", (0,0), (-1,-1), 3),
+])
+STILE_NC = TableStyle(_GRIGLIA + [
+    *[(cmd, (c,1), (c,-1), v) for c in (1, 4, 5, 9)
+      for cmd, v in (("FONTSIZE", CellSmall.fontSize), ("LEADING", CellSmall.leading))],
+    ("BACKGROUND", (0,0), (-1,0), colors.HexColor("#fee2e2")),
+    ("LEFTPADDING",(0,0),(-1,-1),2),
+    ("RIGHTPADDING",(0,0),(-1,-1),2),
+    ("TOPPADDING",(0,0),(-1,-1),2),
+    ("BOTTOMPADDING",(0,0),(-1,-1),2),
+    ("TEXTCOLOR", (0,1), (-1,-1), ROSSO_APPENDICE),
+])
+STILE_SINTESI = TableStyle([
+    ("BACKGROUND", (0,0), (-1,0), colors.HexColor("#f3f4f6")),
+    ("BOX", (0,0), (-1,-1), 0.5, colors.grey),
+    ("INNERGRID", (0,0), (-1,-1), 0.25, colors.grey),
+    ("FONTNAME", (0,0), (-1,0), "Helvetica-Bold")
+])
+STILE_FIRME = TableStyle([("ALIGN", (0,0), (-1,-1), "CENTER"), ("FONTNAME", (0,0), (-1,0), "Helvetica-Bold")])
+MARGINI = (2*cm, 2*cm, 1.5*cm, 1.5*cm)  # sinistro, destro, alto, basso
+MARGINE_NC = 0.2*cm  # appendice NC orizzontale: margini ridotti (≈ 2 mm)
+COLONNE_SEZIONE = [1.0*cm, 6.2*cm, 2.4*cm, 4.1*cm, 3.3*cm]
+COLONNE_NC = [
+    0.9*cm,  # #
+    3.2*cm,  # Sezione
+    8.7*cm,  # Requisito
+    1.4*cm,  # Livello
+    4.3*cm,  # Cause
+    4.0*cm,  # Trattamento
+    1.4*cm,  # Periodo
+    1.7*cm,  # Data tratt.
+    1.7*cm,  # Verifica
+    2.0*cm   # Responsabile
+]
+
+
+class ReportPDF:
+    """PDF generato, conservato su file temporaneo (cancellato quando l'oggetto viene rilasciato).
+
+    ``len()`` è la dimensione in byte, così può stare in :class:`BoundedCache`; la lettura
+    è serializzata perché lo stesso report in cache può servire più sessioni. ``tempi`` è il
+    riepilogo del :class:`Cronometro` della generazione (fasi in ms).
+    """
+    __slots__ = ("_file", "_lock", "dimensione", "tempi")
+
+    def __init__(self, file: BinaryIO, tempi: Optional[dict] = None):
+        self._file = file
+        self._lock = threading.Lock()
+        self.tempi = tempi or {}
+        file.seek(0, 2)
+        self.dimensione = file.tell()
+
+    def __len__(self) -> int:
+        return self.dimensione
+
+    def leggi(self) -> bytes:
+        with self._lock:
+            self._file.seek(0)
+            return self._file.read()
+
+    def copia_in(self, dest: BinaryIO) -> None:
+        with self._lock:
+            self._file.seek(0)
+            shutil.copyfileobj(self._file, dest, 1024 * 1024)
+
+    @contextmanager
+    def aperto(self) -> Iterator[BinaryIO]:
+        """Il file, dall'inizio e in uso esclusivo per la durata del blocco (es. per un PdfReader)."""
+        with self._lock:
+            self._file.seek(0)
+            yield self._file
+
+
+def _spool() -> BinaryIO:
+    return tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORIA, suffix=".pdf")
+
+
+def nuova_cache_report(max_bytes: int = CACHE_MAX_BYTES, max_age: float = CACHE_MAX_AGE) -> BoundedCache:
+    return BoundedCache(max_bytes, max_age=max_age)
+
+
+def _hash_file(f) -> str:
+    if hasattr(f, "sha256"):  # riferimento all'archivio allegati: l'hash è già noto
+        return f.sha256
+    try:
+        return hash_contenuto(f.getvalue())
+    except Exception:
+        return ""
+
+
+def fingerprint_report(df_all: pd.DataFrame, logo_file, fornitore: str = "", data_audit: Optional[date] = None,
+                       auditor: str = "", dpi_foto: int = DPI_DEFAULT, qualita_foto: int = QUALITA_DEFAULT) -> str:
+    """Impronta di tutto ciò che entra nel PDF: record, hash degli allegati, logo, intestazione e opzioni foto."""
+    h = hashlib.sha256()
+    h.update(digest_df(df_all.drop(columns=["_files"], errors="ignore")).encode())
+    if "_files" in df_all:
+        for files in df_all["_files"]:
+            h.update(("|".join(_hash_file(f) for f in files) if files else "-").encode())
+    h.update((_hash_file(logo_file) if logo_file is not None else "-").encode())
+    h.update(repr((fornitore or "", fmt_date(data_audit), auditor or "", int(dpi_foto), int(qualita_foto))).encode())
+    return h.hexdigest()
+
+
+class _ParagrafoCella(Paragraph):
+    """Paragraph di cella che riusa il wrap finché la larghezza non cambia: la tabella lo
+    rimisura a ogni split e di nuovo al disegno, sempre con la larghezza della colonna."""
+    _misura = None
+
+    def wrap(self, availWidth, availHeight):
+        if self._misura is None or self._misura[0] != availWidth:
+            self._misura = (availWidth, super().wrap(availWidth, availHeight))
+        return self._misura[1]
+
+
+def _colonna(df: pd.DataFrame, nome: str) -> List[str]:
+    """Valori della colonna come testo ("" per mancanti o colonna assente), in un solo passaggio."""
+    if nome not in df:
+        return [""] * len(df)
+    s = df[nome]
+    if pd.api.types.is_datetime64_any_dtype(s):  # record tipizzati (audit_record): date come nel resto del report
+        s = s.dt.strftime("%d/%m/%Y")
+    return s.astype(object).where(s.notna(), "").astype(str).tolist()
+
+
+def _celle(testi: List[str], stili: List[ParagraphStyle], larghezza: float) -> list:
+    """Celle di una colonna: il testo che sta su una riga resta una stringa (disegnata con
+    font e colore della tabella), il resto diventa un Paragraph con a capo automatico.
+    Un Paragraph costa parsing del markup e un wrap per ogni misura/split della tabella."""
+    out = []
+    for t, s in zip(testi, stili):
+        if t and ("\n" in t or stringWidth(t, s.fontName, s.fontSize) > larghezza):
+            t = _ParagrafoCella(escape(t), s)
+        out.append(t)
+    return out
+
+
+def _intervalli(maschera) -> Iterator[tuple]:
+    """Intervalli [inizio, fine] di posizioni consecutive a True."""
+    inizio = None
+    for i, v in enumerate(maschera):
+        if v and inizio is None:
+            inizio = i
+        elif not v and inizio is not None:
+            yield inizio, i - 1
+            inizio = None
+    if inizio is not None:
+        yield inizio, len(maschera) - 1
+
+
+def _tabelle(intestazione: tuple, righe: list, colonne: list, stile: TableStyle, evidenzia=None) -> Iterator[Table]:
+    """Tabelle da al più RIGHE_PER_TABELLA righe, ognuna con la propria intestazione.
+
+    `evidenzia` (maschera per riga) colora in rosso le righe di testo semplice, con un
+    comando TEXTCOLOR per ogni gruppo di righe consecutive invece che uno per riga.
+    """
+    for i in range(0, len(righe), RIGHE_PER_TABELLA):
+        tbl = Table([[Paragraph(h, HeaderCell) for h in intestazione]] + righe[i:i + RIGHE_PER_TABELLA],
+                    colWidths=colonne, repeatRows=1, splitByRow=1)
+        tbl.setStyle(stile)
+        if evidenzia is not None:
+            tbl.setStyle([("TEXTCOLOR", (0, a + 1), (-1, b + 1), ROSSO_NC)
+                          for a, b in _intervalli(evidenzia[i:i + RIGHE_PER_TABELLA])])
+        yield tbl
+
+
+class _DocReport(BaseDocTemplate):
+    """Documento di un frammento del report, su pagine tutte verticali o tutte orizzontali.
+
+    Segnala l'avanzamento quando disegna un titolo marcato con ``_avanzamento`` e annota in
+    ``segnalibri`` la pagina (0-based) dei titoli marcati con ``_segnalibro``.
+    """
+    avanza: Optional[Callable[[str], None]] = None
+
+    def __init__(self, buf: BinaryIO, orizzontale: bool = False):
+        if orizzontale:
+            super().__init__(buf, pagesize=landscape(A4), leftMargin=MARGINE_NC, rightMargin=MARGINE_NC,
+                             topMargin=MARGINE_NC, bottomMargin=MARGINE_NC)
+        else:
+            lm, rm, tm, bm = MARGINI
+            super().__init__(buf, pagesize=A4, leftMargin=lm, rightMargin=rm, topMargin=tm, bottomMargin=bm)
+        frame = Frame(self.leftMargin, self.bottomMargin, self.width, self.height)
+        self.addPageTemplates([PageTemplate(frames=[frame], pagesize=self.pagesize)])
+        self.segnalibri: List[tuple] = []
+
+    def afterFlowable(self, flowable):
+        segnalibro = getattr(flowable, "_segnalibro", None)
+        if segnalibro:
+            self.segnalibri.append((segnalibro, self.page - 1))
+        fase = getattr(flowable, "_avanzamento", None)
+        if fase and self.avanza is not None:
+            self.avanza(fase)
+
+
+def _titolo(testo: str, stile: ParagraphStyle, fase: str = "", segnalibro: str = "") -> Paragraph:
+    p = Paragraph(testo, stile)
+    p._avanzamento = fase
+    p._segnalibro = segnalibro
+    return p
+
+
+# ---- Frammenti ----
+# Il report è la sequenza di PDF indipendenti (apertura e prime sezioni, gruppi di sezioni,
+# appendice NC, firme e foto, elenco documenti), ognuno in cache per l'impronta del suo
+# contenuto e uniti alla fine con pypdf: modificando un requisito si rigenerano solo
+# il suo gruppo di sezioni, la sintesi (se cambiano i punteggi) e l'appendice NC (se è una NC).
+# Ogni frammento comincia su una pagina nuova: le sezioni brevi consecutive stanno nello
+# stesso frammento fino a RIGHE_PER_FRAMMENTO righe, così i report piccoli restano compatti.
+# I gruppi dipendono solo dal numero di righe per sezione, non dal contenuto.
+FRAMMENTI_MAX_BYTES = 128 * 1024 * 1024
+RIGHE_PER_FRAMMENTO = 60
+# valore: (ReportPDF del frammento, segnalibri [(titolo, pagina)]); come il report, il frammento
+# è su file temporaneo: oltre SPOOL_MAX_MEMORIA (es. l'appendice fotografica) sta su disco
+_frammenti = BoundedCache(FRAMMENTI_MAX_BYTES, max_age=CACHE_MAX_AGE, sizeof=lambda v: len(v[0]))
+
+
+class _Frammento(NamedTuple):
+    chiave: str
+    storia: Callable[[], list]
+    fase: str  # tappa del Cronometro
+    passi: int = 0  # chiamate di avanzamento durante la generazione
+    orizzontale: bool = False
+
+
+def _impronta(*parti) -> str:
+    return hashlib.sha256(repr(parti).encode()).hexdigest()
+
+
+def _rendi(fr: _Frammento, avanza: Callable[[str], None]) -> tuple:
+    out = _spool()
+    doc = _DocReport(out, fr.orizzontale)
+    doc.avanza = avanza
+    doc.build(fr.storia())
+    return ReportPDF(out), doc.segnalibri
+
+
+def _storia_apertura(logo_file, fornitore: str, data_audit: Optional[date], auditor: str, sintesi: list,
+                     sezioni: pd.DataFrame) -> list:
+    story = []
+    if logo_file is not None:
+        try:
+            logo_file.seek(0)
+            story.append(RLImage(logo_file, width=3*cm))
+            story.append(Spacer(1, 6))
+        except Exception:
+            pass
+    story.append(Paragraph("Report Audit Fornitore — D.Lgs. 81/08 & SMEI", H1))
+    story.append(Paragraph(
+        f"Fornitore: <b>{escape(fornitore or '—')}</b> &nbsp;&nbsp; Data: <b>{fmt_date(data_audit)}</b> &nbsp;&nbsp; Auditor: <b>{escape(auditor or '—')}</b>",
+        P
+    ))
+    story.append(Spacer(1, 8))
+    t = Table(sintesi, colWidths=[7*cm, 7*cm])
+    t.setStyle(STILE_SINTESI)
+    story.append(t)
+    story.append(Spacer(1, 12))
+    lm, rm, _, _ = MARGINI
+    grafico = disegno_sezioni(sezioni, A4[0] - lm - rm - 12)
+    if grafico is not None:
+        story.append(Paragraph("Conformità per sezione", H2))
+        story.append(grafico)
+        story.append(Spacer(1, 12))
+    return story
+
+
+def _storia_sezioni(sezioni: list, prima: Optional[Callable[[], list]] = None) -> list:
+    """Tabelle di un gruppo di sezioni (portrait), preceduto da `prima()` se dato."""
+    story = prima() if prima is not None else []
+    for sezione, testi in sezioni:
+        story.extend(_storia_sezione(sezione, testi))
+    return story
+
+
+def _storia_sezione(sezione: str, testi: tuple) -> list:
+    """Tabella di una sezione dalle colonne già come testo: N, Requisito, Stato, Riferimento, Note."""
+    n, requisito, stato, riferimento, note = testi
+    story = [_titolo(escape(sezione), H2, f"Sezione {sezione}", sezione)]
+    utile = [w - 8 for w in COLONNE_SEZIONE]  # larghezza meno il padding orizzontale
+    nc = [s == "Non conforme" for s in stato]
+    cell = [CellNC if x else Cell for x in nc]
+    small = [CellSmallNC if x else CellSmall for x in nc]
+    rows = [list(r) for r in zip(n, _celle(requisito, cell, utile[1]), stato, _celle(riferimento, small, utile[3]),
+                                 _celle(note, small, utile[4]))]
+    story.extend(_tabelle(("#", "Requisito", "Stato", "Riferimento", "Note"), rows,
+                          COLONNE_SEZIONE, STILE_SEZIONE, evidenzia=nc))
+    story.append(Spacer(1, 10))
+    return story
+
+
+def _storia_nc(testi: tuple, distribuzione: pd.DataFrame) -> list:
+    """Appendice NC in landscape (tutte insieme), dalle colonne già come testo nell'ordine di COLONNE_NC."""
+    story = [_titolo("Non Conformità — Riepilogo complessivo", H1, "Riepilogo non conformità", "Non Conformità"),
+             Paragraph("Elenco sintetico di tutte le NC rilevate, con campi principali.", Small),
+             Spacer(1, 6)]
+    grafico = disegno_nc(distribuzione)
+    if grafico is not None:
+        story.append(Paragraph("NC per periodo di gestione e livello", Small))
+        story.append(grafico)
+        story.append(Spacer(1, 8))
+    utile = [w - 4 for w in COLONNE_NC]
+    n, sezione, requisito, livello, cause, tratt, periodo, d_tratt, d_ver, resp = testi
+    cell, small = [CellApp] * len(n), [CellSmallApp] * len(n)
+    nc_rows = [list(r) for r in zip(
+        n,
+        _celle(sezione, small, utile[1]),
+        _celle(requisito, cell, utile[2]),
+        _celle(livello, cell, utile[3]),
+        _celle(cause, small, utile[4]),
+        _celle(tratt, small, utile[5]),
+        _celle(periodo, cell, utile[6]),
+        d_tratt,
+        d_ver,
+        _celle(resp, small, utile[9]),
+    )]
+    story.extend(_tabelle(("#", "Sezione", "Requisito", "Livello", "Cause", "Trattamento", "Periodo",
+                           "Data tratt.", "Verifica", "Responsabile"), nc_rows, COLONNE_NC, STILE_NC))
+    story.append(Spacer(1, 12))
+    return story
+
+
+def _storia_chiusura(imgs: list, dpi_foto: int, qualita_foto: int, avanza: Callable[[str], None]) -> list:
+    story = [_titolo("Firme", H2, segnalibro="Firme")]
+    firm_tbl = Table([
+        ["Auditor", "Rappresentante Fornitore"],
+        ["\n\n__________________________", "\n\n__________________________"]
+    ], colWidths=[8*cm, 8*cm])
+    firm_tbl.setStyle(STILE_FIRME)
+    story.append(firm_tbl)
+    story.append(Spacer(1, 8))
+
+    # Appendice fotografica (ridimensionamento sicuro)
+    # `_files` contiene riferimenti all'archivio allegati (audit_attachments.Allegato):
+    # le foto vengono lette dal disco una alla volta, solo se non già in cache
+    if imgs:
+        story.append(PageBreak())
+        story.append(_titolo("Appendice fotografica", H1, segnalibro="Appendice fotografica"))
+        story.append(Paragraph("Selezione immagini caricate a supporto dell’audit.", Small))
+        story.append(Spacer(1, 6))
+
+        lm, rm, tm, bm = MARGINI
+        # area del frame (meno il padding di 6 pt per lato)
+        max_w = A4[0] - lm - rm - 12
+        max_h = (A4[1] - tm - bm - 12) * 0.65
+        for i, f in enumerate(imgs, start=1):
+            avanza(f"Foto {i}/{len(imgs)}")
+            try:
+                # riduzione al DPI richiesto per il riquadro e ricompressione (cache per hash)
+                data, (iw, ih) = prepara_immagine(percorso(f.sha256), max_w, max_h, dpi=dpi_foto,
+                                                  qualita=qualita_foto, sha256=f.sha256)
+                scale = min(max_w / iw, max_h / ih)
+                w, h = iw * scale, ih * scale
+                story.append(RLImage(BytesIO(data), width=w, height=h))
+                story.append(Spacer(1, 6))
+                story.append(Paragraph(escape(f.nome), Small))
+                story.append(Spacer(1, 12))
+            except Exception:
+                continue
+    return story
+
+
+def _storia_documenti(pdfs: list, esclusi: list) -> list:
+    # Appendice documentale (`pdfs`): elenco qui, pagine accodate dopo l'unione dei frammenti
+    story = [_titolo("Appendice documentale", H1, segnalibro="Appendice documentale"),
+             Paragraph("Documenti PDF caricati a supporto dell’audit, riportati nelle pagine seguenti.", Small),
+             Spacer(1, 6)]
+    for f, req in pdfs:
+        story.append(Paragraph(escape(f"{f.nome} — {req}"), P))
+    if esclusi:
+        story += [Spacer(1, 10), Paragraph(f"Documenti non riportati (oltre {ALLEGATI_PDF_MAX / 2**20:.0f} MB di "
+                                           "allegati PDF per report), disponibili nell’archivio dell’audit:", Small),
+                  Spacer(1, 6)]
+        story.extend(Paragraph(escape(f"{f.nome} — {req}"), P) for f, req in esclusi)
+    return story
+
+
+def _dimensione(f) -> int:
+    if f.dimensione:
+        return f.dimensione
+    try:  # riferimenti senza dimensione (sessioni salvate prima che venisse registrata)
+        return os.path.getsize(percorso(f.sha256))
+    except OSError:
+        return 0
+
+
+def _entro_limite(pdfs: list, limite: int = ALLEGATI_PDF_MAX) -> tuple:
+    """Divide gli allegati PDF in (accodati, esclusi): nell'ordine dei requisiti, finché il totale sta nel limite."""
+    accodati, esclusi = [], []
+    for f, req in pdfs:
+        peso = _dimensione(f)
+        (accodati if peso <= limite else esclusi).append((f, req))
+        if peso <= limite:
+            limite -= peso
+    return accodati, esclusi
+
+
+def build_pdf(df_all: pd.DataFrame, logo_file, fornitore: str = "", data_audit: Optional[date] = None,
+              auditor: str = "", dpi_foto: int = DPI_DEFAULT, qualita_foto: int = QUALITA_DEFAULT,
+              avanzamento: Optional[Callable[[str, float], None]] = None) -> ReportPDF:
+    """Genera il report dai frammenti in cache, rigenerando solo quelli il cui contenuto è cambiato.
+
+    `avanzamento(fase, frazione)`, se dato, viene chiamata per ogni foto, per ogni sezione impaginata
+    e per gli allegati (solo dei frammenti da rigenerare); può sollevare un'eccezione per interrompere.
+    """
+    cron = Cronometro("pdf")
+    if avanzamento is not None:
+        avanzamento("Preparazione", 0.0)
+
+    imgs, pdfs = [], []
+    if "_files" in df_all:
+        for files, n, req in zip(df_all["_files"], _colonna(df_all, "N"), _colonna(df_all, "Requisito")):
+            if files:
+                imgs.extend(f for f in files if f.is_image)
+                pdfs.extend((f, f"{n}. {req}") for f in files if f.is_pdf)
+
+    # Sintesi e grafico per sezione: entrano nel primo frammento, con logo e intestazione
+    agg = aggrega(df_all)
+    tot = totali(agg)
+    sezioni = dati_sezioni(agg)
+    perc_tot_s, conf_tot_s, nc_tot_s, tot_tot_s = percentuali(tot)
+    perc_tot_w, _, _, _ = percentuali(tot, ponderata=True)
+    sintesi_data = [
+        ["Conformità totale (semplice)", f"{perc_tot_s if perc_tot_s is not None else '—'}%"],
+        ["Conformità totale (ponderata)", f"{perc_tot_w if perc_tot_w is not None else '—'}%"],
+        ["Requisiti conformi", str(conf_tot_s)],
+        ["Requisiti non conformi", str(nc_tot_s)],
+        ["Requisiti valutati", str(tot_tot_s)],
+    ]
+    apertura_id = (_hash_file(logo_file) if logo_file is not None else "-", fornitore or "", fmt_date(data_audit),
+                   auditor or "", sintesi_data, impronta_grafico(sezioni))
+    apertura = partial(_storia_apertura, logo_file, fornitore, data_audit, auditor, sintesi_data, sezioni)
+
+    # Colonne materializzate come testo una sola volta, nell'ordine del report (sezione, N):
+    # le sezioni e l'appendice NC ne prendono fette, che fanno anche da impronta dei frammenti
+    ordinato = df_all.dropna(subset=["Sezione"]).sort_values(["Sezione", "N"], kind="stable")
+    testo = {c: _colonna(ordinato, c) for c in ("N", "Sezione", "Requisito", "Stato", "Riferimento", "Note",
+                                                "NC Livello", "Cause", "Trattamento", "Periodo", "Data trattamento",
+                                                "Data verifica", "Responsabile")}
+    gruppi, righe, inizio = [], RIGHE_PER_FRAMMENTO, 0
+    for sezione, pos in groupby(range(len(ordinato)), key=testo["Sezione"].__getitem__):
+        fine = inizio + sum(1 for _ in pos)
+        if righe + fine - inizio > RIGHE_PER_FRAMMENTO:
+            gruppi.append([])
+            righe = 0
+        gruppi[-1].append((sezione, tuple(testo[c][inizio:fine] for c in ("N", "Requisito", "Stato", "Riferimento", "Note"))))
+        righe += fine - inizio
+        inizio = fine
+    frammenti: List[_Frammento] = []
+    for i, sezioni in enumerate(gruppi):
+        frammenti.append(_Frammento(_impronta("sezioni", sezioni, apertura_id if i == 0 else None),
+                                    partial(_storia_sezioni, sezioni, apertura if i == 0 else None),
+                                    "sezioni", len(sezioni)))
+    if not frammenti:
+        frammenti.append(_Frammento(_impronta("apertura", apertura_id), apertura, "intestazione"))
+
+    nc = [i for i, stato in enumerate(testo["Stato"]) if stato == "Non conforme"]
+    if nc:
+        testi = tuple([testo[c][i] for i in nc] for c in ("N", "Sezione", "Requisito", "NC Livello", "Cause", "Trattamento",
+                                                          "Periodo", "Data trattamento", "Data verifica", "Responsabile"))
+        dist = distribuzione_nc(df_all)
+        frammenti.append(_Frammento(_impronta("nc", testi, impronta_grafico(dist)), partial(_storia_nc, testi, dist),
+                                    "appendice_nc", 1, orizzontale=True))
+
+    frammenti.append(_Frammento(
+        _impronta("chiusura", [(f.sha256, f.nome) for f in imgs], int(dpi_foto), int(qualita_foto)),
+        lambda: _storia_chiusura(imgs, dpi_foto, qualita_foto, avanza), "foto", len(imgs)))
+    pdfs, esclusi = _entro_limite(pdfs)
+    if pdfs or esclusi:
+        frammenti.append(_Frammento(_impronta("documenti", [(f.sha256, f.nome, req) for f, req in pdfs],
+                                              [(f.sha256, f.nome, req) for f, req in esclusi], ALLEGATI_PDF_MAX),
+                                    partial(_storia_documenti, pdfs, esclusi), "documenti"))
+
+    pronti = [_frammenti.get(fr.chiave) for fr in frammenti]
+    # passi: frammenti da rigenerare (sezioni, appendice NC, foto), unione, allegati PDF accodati
+    totale = sum(fr.passi for fr, pdf in zip(frammenti, pronti) if pdf is None) + 1 + bool(pdfs)
+    fatti = 0
+
+    def avanza(fase: str) -> None:
+        nonlocal fatti
+        fatti += 1
+        if avanzamento is not None:
+            avanzamento(fase, fatti / totale)
+
+    riusati = sum(pdf is not None for pdf in pronti)
+    cron.tappa("impaginazione")
+    for i, fr in enumerate(frammenti):
+        if pronti[i] is None:
+            pronti[i] = _rendi(fr, avanza)
+            _frammenti.put(fr.chiave, pronti[i])
+            cron.tappa(fr.fase)
+    buf, pagine = _unisci(pronti, pdfs)
+    avanza("Impaginazione completata")
+    cron.tappa("unione")
+    if pdfs:
+        avanza("Allegati PDF accodati")
+    report = ReportPDF(buf)
+    report.tempi = cron.emetti(righe=len(df_all), pagine_report=pagine, foto=len(imgs), allegati_pdf=len(pdfs),
+                               allegati_esclusi=len(esclusi),
+                               frammenti=len(frammenti), riusati=riusati, kb=round(len(report) / 1024))
+    return report
+
+
+def _unisci(frammenti: List[tuple], pdfs) -> tuple:
+    """Unisce i frammenti (ReportPDF, segnalibri), letti dai loro file, riportando i segnalibri nel sommario, e accoda le pagine
+    degli allegati PDF, un file alla volta letto dall'archivio. Allegati illeggibili o protetti da
+    password vengono saltati. Restituisce il file e il numero di pagine del report (senza allegati).
+
+    Le pagine clonate restano nel writer fino a ``write()``: il picco di memoria cresce col totale
+    degli allegati, che ``build_pdf`` tiene entro ``ALLEGATI_PDF_MAX``. Ogni reader viene rilasciato
+    appena copiate le sue pagine, così non restano in memoria anche gli oggetti già letti."""
+    from pypdf import PdfReader, PdfWriter
+
+    writer = PdfWriter()
+    for frammento, segnalibri in frammenti:
+        inizio = len(writer.pages)
+        # add_page clona la pagina leggendo tutto dal file: il lock copre solo la copia,
+        # lo stesso frammento in cache può servire più report in parallelo
+        with frammento.aperto() as fh:
+            for pagina in PdfReader(fh).pages:
+                writer.add_page(pagina)
+        for titolo, pagina in segnalibri:
+            writer.add_outline_item(titolo, inizio + pagina)
+    pagine = len(writer.pages)
+    for f, req in pdfs:
+        try:
+            with open(percorso(f.sha256), "rb") as fh:
+                reader = PdfReader(fh)
+                if reader.is_encrypted and not reader.decrypt(""):
+                    continue
+                inizio = len(writer.pages)
+                for pagina in reader.pages:
+                    writer.add_page(pagina)
+                writer.add_outline_item(f"{f.nome} — {req}", inizio)
+        except Exception:
+            continue
+        finally:
+            reader = None
+    out = _spool()
+    writer.write(out)
+    return out, pagine
@@ -0,0 +1,87 @@
+# audit_scoring.py
+"""Calcolo vettoriale della conformità (semplice e ponderata L1=0.5 / L2=0).
+
+Un solo passaggio di aggregazione per gruppo produce tutti i contatori;
+le percentuali per sezione e totali si ricavano dai contatori senza
+rileggere i record. Con ``by`` si può raggruppare anche per audit,
+fornitore, ecc. (es. ``by=["Audit", "Sezione"]``) per i calcoli di portafoglio.
+"""
+from typing import Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+# valori ammessi di Stato e NC Livello (categorie dei frame tipizzati)
+STATI = ["Non applicabile", "Conforme", "Non conforme"]
+LIVELLI = ["", "Livello 1", "Livello 2"]
+# periodi di gestione di una NC, dal più breve
+PERIODI = ["BREVE (≤ 1 mese)", "MEDIO (≤ 6 mesi)", "LUNGO (≤ 12 mesi)"]
+
+# contatori sommabili prodotti da aggrega()
+CONTATORI = ["Valutati", "Conformi", "Non conformi", "Valutati pond.", "Somma pond.", "Conformi (stato)", "NC (stato)"]
+
+
+def aggrega(df: pd.DataFrame, by: Union[str, Sequence[str]] = "Sezione") -> pd.DataFrame:
+    """Contatori e percentuali per gruppo; indice = chiavi di raggruppamento."""
+    keys = [by] if isinstance(by, str) else list(by)
+    if df.empty:
+        out = pd.DataFrame(columns=keys + CONTATORI).set_index(keys)
+        return _percentuali(out)
+    s = pd.to_numeric(df["Punteggio"], errors="coerce")
+    w = pd.to_numeric(df["Punteggio ponderato"], errors="coerce")
+    stato = df["Stato"]
+    tmp = pd.DataFrame({
+        "Valutati": s.notna(),
+        "Conformi": s.eq(1),
+        "Non conformi": s.eq(0),
+        "Valutati pond.": w.notna(),
+        "Somma pond.": w.fillna(0.0),
+        "Conformi (stato)": stato.eq("Conforme"),
+        "NC (stato)": stato.eq("Non conforme"),
+    })
+    for k in keys:
+        tmp[k] = df[k]  # mantiene il dtype (categorie: groupby sui codici)
+    out = tmp.groupby(keys, sort=False, observed=True).sum()
+    return _percentuali(out)
+
+
+def _percentuali(agg: pd.DataFrame) -> pd.DataFrame:
+    v = agg["Valutati"].astype(float)
+    vw = agg["Valutati pond."].astype(float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        agg["% Conformità"] = (agg["Conformi"] / v * 100).where(v > 0).round(1)
+        agg["% Conformità ponderata"] = (agg["Somma pond."] / vw * 100).where(vw > 0).round(1)
+    return agg
+
+
+def totali(agg: pd.DataFrame) -> pd.Series:
+    """Contatori e percentuali complessivi a partire dall'aggregato per gruppo."""
+    tot = agg[CONTATORI].sum().to_frame().T
+    return _percentuali(tot).iloc[0]
+
+
+def percentuali(tot: pd.Series, ponderata: bool = False) -> Tuple[Optional[float], int, int, int]:
+    """(percentuale, conformi, non conformi, valutati) come mostrati in UI e PDF."""
+    if ponderata:
+        perc = tot["% Conformità ponderata"]
+        conf, nc, n = tot["Conformi (stato)"], tot["NC (stato)"], tot["Valutati pond."]
+    else:
+        perc = tot["% Conformità"]
+        conf, nc, n = tot["Conformi"], tot["Non conformi"], tot["Valutati"]
+    return (None if pd.isna(perc) else float(perc)), int(conf), int(nc), int(n)
+
+
+def tabella_sezioni(agg: pd.DataFrame, ponderata: bool = False) -> pd.DataFrame:
+    """Tabella per sezione ordinata per percentuale decrescente (senza dati in coda)."""
+    if agg.empty:
+        return pd.DataFrame()
+    if ponderata:
+        metric = "% Conformità ponderata"
+        cols = {"Conformi (stato)": "Conformi", "NC (stato)": "Non conformi", "Valutati pond.": "Requisiti valutati"}
+    else:
+        metric = "% Conformità"
+        cols = {"Conformi": "Conformi", "Non conformi": "Non conformi", "Valutati": "Requisiti valutati"}
+    sdf = agg.sort_values(metric, ascending=False, na_position="last", kind="stable")
+    out = sdf.reset_index()[[*agg.index.names, metric, *cols]].rename(columns=cols)
+    out[metric] = out[metric].astype(object).where(out[metric].notna(), "—")
+    return out
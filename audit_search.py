@@ -0,0 +1,306 @@
+# audit_search.py
+"""Indice invertito per la ricerca testuale su requisiti, riferimenti e note.
+
+- normalizzazione senza accenti e maiuscole ("sicurezzà" == "SICUREZZA");
+- ricerca per prefisso su ogni parola della query ("sorv" trova "sorveglianza");
+- tutte le parole devono comparire (AND), ordinamento BM25 con pesi per campo;
+- aggiornamento incrementale: un documento viene reindicizzato solo se il suo
+  contenuto cambia.
+
+I documenti sono identificati da una chiave qualsiasi (es. ``(audit_id, req_id)``)
+e possono portare metadati restituiti con i risultati.
+"""
+import math
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Mapping, Optional, Tuple
+
+# campo record -> peso nel punteggio
+PESI_CAMPI = {"Requisito": 2.0, "Riferimento": 2.0, "Sezione": 1.0, "Note": 1.0, "Cause": 1.0, "Trattamento": 1.0}
+# IndiceArchivio: campi del requisito (condivisi fra audit) e campi compilati in ogni audit
+CAMPI_BASE = ("Requisito", "Riferimento", "Sezione")
+CAMPI_LIBERI = ("Note", "Cause", "Trattamento")
+
+_RE_TOKEN = re.compile(r"[a-z0-9]+")
+_K1, _B = 1.2, 0.75
+_PESO_PREFISSO = 0.7  # corrispondenza per prefisso vale meno della parola intera
+
+
+def normalizza(testo: Any) -> str:
+    if testo is None:
+        return ""
+    s = unicodedata.normalize("NFKD", str(testo))
+    return "".join(c for c in s if not unicodedata.combining(c)).lower()
+
+
+def tokenizza(testo: Any) -> List[str]:
+    return _RE_TOKEN.findall(normalizza(testo))
+
+
+class IndiceTesto:
+    """Indice BM25 incrementale.
+
+    Un documento può ereditare i termini di un documento *base* condiviso
+    (``base=``): negli audit archiviati il testo del requisito e il riferimento
+    sono gli stessi in ogni audit, quindi vengono indicizzati una volta per
+    requisito (``aggiorna_base``) e per audit solo note, cause e trattamento.
+    I documenti senza testo proprio costano solo il collegamento alla base e
+    in ricerca vengono valutati a gruppi, senza scorrerli uno per uno.
+    """
+
+    def __init__(self, pesi: Mapping[str, float] = PESI_CAMPI):
+        self.pesi = dict(pesi)
+        self._post: Dict[str, Dict[Hashable, float]] = defaultdict(dict)   # termine -> {doc: tf pesata}
+        self._bpost: Dict[str, Dict[Hashable, float]] = defaultdict(dict)  # termine -> {base: tf pesata}
+        self._termini_doc: Dict[Hashable, Tuple[str, ...]] = {}  # solo documenti con testo proprio
+        self._termini_base: Dict[Hashable, Tuple[str, ...]] = {}
+        self._firma: Dict[Hashable, int] = {}
+        self._len: Dict[Hashable, float] = {}
+        self._len_base: Dict[Hashable, float] = {}
+        self._base_di: Dict[Hashable, Hashable] = {}
+        self._figli: Dict[Hashable, set] = defaultdict(set)
+        self._meta: Dict[Hashable, Any] = {}
+        self._n_doc = 0
+        self._tot_len = 0.0
+        self._vocabolario: Optional[List[str]] = None  # termini ordinati per i prefissi (lazy)
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return self._n_doc
+
+    def __contains__(self, doc: Hashable) -> bool:
+        return doc in self._termini_doc or doc in self._base_di
+
+    def _tf(self, campi: Mapping[str, Any]) -> Counter:
+        tf: Counter = Counter()
+        for campo, peso in self.pesi.items():
+            for t in tokenizza(campi.get(campo)):
+                tf[t] += peso
+        return tf
+
+    def _doc_len(self, doc: Hashable) -> float:
+        b = self._base_di.get(doc)
+        return self._len.get(doc, 0.0) + (self._len_base.get(b, 0.0) if b is not None else 0.0)
+
+    def aggiorna_base(self, base: Hashable, campi: Mapping[str, Any]) -> None:
+        """Testo condiviso da tutti i documenti collegati a `base`."""
+        with self._lock:
+            for t in self._termini_base.pop(base, ()):
+                post = self._bpost[t]
+                post.pop(base, None)
+                if not post:
+                    del self._bpost[t]
+            tf = self._tf(campi)
+            for t, w in tf.items():
+                if t not in self._bpost and t not in self._post:
+                    self._vocabolario = None
+                self._bpost[t][base] = w
+            self._termini_base[base] = tuple(tf)
+            nuovo = sum(tf.values())
+            self._tot_len += (nuovo - self._len_base.get(base, 0.0)) * len(self._figli.get(base, ()))
+            self._len_base[base] = nuovo
+
+    def aggiorna(self, doc: Hashable, campi: Mapping[str, Any], meta: Any = None,
+                 base: Optional[Hashable] = None) -> bool:
+        """Indicizza/aggiorna un documento; False se il contenuto era invariato."""
+        testi = tuple(str(campi.get(c) or "") for c in self.pesi)
+        firma = hash((base, testi))
+        with self._lock:
+            noto = doc in self
+            if noto and self._firma.get(doc, hash((self._base_di.get(doc), ("",) * len(testi)))) == firma:
+                self._set_meta(doc, meta)
+                return False
+            if noto:
+                self._rimuovi(doc)
+            self._n_doc += 1
+            if base is not None:
+                self._base_di[doc] = base
+                self._figli[base].add(doc)
+            if any(testi):
+                tf = self._tf(campi)
+                for t, w in tf.items():
+                    if t not in self._post and t not in self._bpost:
+                        self._vocabolario = None
+                    self._post[t][doc] = w
+                self._termini_doc[doc] = tuple(tf)
+                self._firma[doc] = firma
+                self._len[doc] = sum(tf.values())
+            self._tot_len += self._doc_len(doc)
+            self._set_meta(doc, meta)
+            return True
+
+    def collega(self, base: Hashable, docs: Iterable[Hashable]) -> None:
+        """Aggiunta massiva di documenti senza testo proprio (solo testo della base)."""
+        with self._lock:
+            for doc in docs:
+                if doc in self:
+                    if doc not in self._termini_doc and self._base_di.get(doc) == base:
+                        continue
+                    self._rimuovi(doc)
+                self._n_doc += 1
+                self._base_di[doc] = base
+                self._figli[base].add(doc)
+                self._tot_len += self._len_base.get(base, 0.0)
+
+    def _set_meta(self, doc: Hashable, meta: Any) -> None:
+        if meta is None:
+            self._meta.pop(doc, None)
+        else:
+            self._meta[doc] = meta
+
+    def rimuovi(self, doc: Hashable) -> None:
+        with self._lock:
+            self._rimuovi(doc)
+
+    def _rimuovi(self, doc: Hashable) -> None:
+        if doc not in self:
+            return
+        self._tot_len -= self._doc_len(doc)
+        self._n_doc -= 1
+        for t in self._termini_doc.pop(doc, ()):
+            post = self._post[t]
+            post.pop(doc, None)
+            if not post:
+                del self._post[t]
+        b = self._base_di.pop(doc, None)
+        if b is not None:
+            self._figli[b].discard(doc)
+        self._len.pop(doc, None)
+        self._firma.pop(doc, None)
+        self._meta.pop(doc, None)
+
+    def documenti(self) -> List[Hashable]:
+        with self._lock:
+            return list({**dict.fromkeys(self._termini_doc), **dict.fromkeys(self._base_di)})
+
+    def _espandi(self, token: str) -> List[Tuple[str, float]]:
+        if self._vocabolario is None:
+            self._vocabolario = sorted(set(self._post) | set(self._bpost))
+        voc = self._vocabolario
+        out = []
+        i = bisect_left(voc, token)
+        while i < len(voc) and voc[i].startswith(token):
+            out.append((voc[i], 1.0 if voc[i] == token else _PESO_PREFISSO))
+            i += 1
+        return out
+
+    def _bm25(self, tf: float, lunghezza: float, idf: float, avg_len: float) -> float:
+        return idf * tf * (_K1 + 1) / (tf + _K1 * (1 - _B + _B * lunghezza / avg_len))
+
+    def cerca(self, query: str, limit: Optional[int] = 50,
+              filtro: Optional[Callable[[Hashable], bool]] = None) -> List[Tuple[Hashable, float, Any]]:
+        """Risultati (doc, punteggio, meta) in ordine di rilevanza; tutte le parole devono comparire."""
+        tokens = list(dict.fromkeys(tokenizza(query)))
+        if not tokens:
+            return []
+        with self._lock:
+            avg_len = (self._tot_len / self._n_doc) if self._n_doc else 1.0
+            per_token = []  # [(punteggi documento, punteggi base)]
+            for tok in tokens:
+                sd: Dict[Hashable, float] = defaultdict(float)
+                sb: Dict[Hashable, float] = defaultdict(float)
+                for termine, peso in self._espandi(tok):
+                    post = self._post.get(termine, {})
+                    bpost = self._bpost.get(termine, {})
+                    n_t = len(post) + sum(len(self._figli.get(b, ())) for b in bpost)
+                    if not n_t:
+                        continue
+                    idf = math.log(1 + (self._n_doc - n_t + 0.5) / (n_t + 0.5))
+                    for doc, tf in post.items():
+                        sd[doc] = max(sd[doc], peso * self._bm25(tf, self._doc_len(doc), idf, avg_len))
+                    for b, tf in bpost.items():
+                        sb[b] = max(sb[b], peso * self._bm25(tf, self._len_base.get(b, 0.0), idf, avg_len))
+                if not sd and not sb:
+                    return []
+                per_token.append((sd, sb))
+
+            # documenti con testo proprio che corrisponde ad almeno una parola
+            punteggi: Dict[Hashable, float] = {}
+            for doc in set().union(*(sd for sd, _ in per_token)):
+                base = self._base_di.get(doc)
+                tot = 0.0
+                for sd, sb in per_token:
+                    v = max(sd.get(doc, 0.0), sb.get(base, 0.0) if base is not None else 0.0)
+                    if not v:
+                        break
+                    tot += v
+                else:
+                    if filtro is None or filtro(doc):
+                        punteggi[doc] = tot
+            # documenti che corrispondono solo tramite la base: stesso punteggio per tutti i figli
+            gruppi = []
+            for b in set.intersection(*(set(sb) for _, sb in per_token)):
+                gruppi.append((sum(sb[b] for _, sb in per_token), b))
+            gruppi.sort(key=lambda x: -x[0])
+
+            ordinati = sorted(punteggi.items(), key=lambda x: -x[1])
+            out: List[Tuple[Hashable, float]] = []
+            i = 0
+            for score_b, b in gruppi:
+                while i < len(ordinati) and ordinati[i][1] >= score_b:
+                    out.append(ordinati[i])
+                    i += 1
+                if limit is not None and len(out) >= limit:
+                    break
+                for doc in sorted(self._figli.get(b, ()), reverse=True):  # più recenti (id maggiore) prima
+                    if doc in punteggi or (filtro is not None and not filtro(doc)):
+                        continue
+                    out.append((doc, score_b))
+                    if limit is not None and len(out) >= limit:
+                        break
+            out.extend(ordinati[i:])
+            if limit is not None:
+                out = out[:limit]
+            return [(d, s, self._meta.get(d)) for d, s in out]
+
+
+class IndiceArchivio(IndiceTesto):
+    """Indice di tutti gli audit archiviati, documenti ``(audit_id, req_id)``.
+
+    ``sincronizza`` legge solo gli audit modificati dall'ultima chiamata e
+    rimuove quelli eliminati; i requisiti non applicabili non vengono indicizzati.
+    """
+
+    def __init__(self, pesi: Mapping[str, float] = PESI_CAMPI):
+        super().__init__(pesi)
+        self._ultimo: Optional[int] = None  # `versione` dell'ultima modifica letta
+        self._audit: set = set()
+        self._firma_base: Dict[Hashable, int] = {}
+
+    def sincronizza(self, store) -> int:
+        with self._lock:
+            ids = set(store.id_audit())
+            eliminati = self._audit - ids
+            if eliminati:
+                for doc in [d for d in self.documenti() if d[0] in eliminati]:
+                    self._rimuovi(doc)
+            self._audit = ids
+            modificati = store.audit_modificati(self._ultimo)
+            if not modificati:
+                return 0
+            df = store.record_storici(audit_ids=[a["id"] for a in modificati],
+                                      colonne=["req_id", "sezione", "applicabile", "requisito", "riferimento", "note", "cause", "trattamento"])
+            df["catalogo_id"] = df["catalogo_id"].fillna("")
+            n = 0
+            for r in df[df["applicabile"] == 0].itertuples(index=False):
+                self._rimuovi((r.audit_id, r.req_id))
+            df = df[df["applicabile"] != 0]
+            for r in df.drop_duplicates(["catalogo_id", "req_id"]).itertuples(index=False):
+                base = (r.catalogo_id, r.req_id)
+                firma_base = hash((r.requisito, r.riferimento, r.sezione))
+                if self._firma_base.get(base) != firma_base:
+                    self.aggiorna_base(base, {"Requisito": r.requisito, "Riferimento": r.riferimento, "Sezione": r.sezione})
+                    self._firma_base[base] = firma_base
+            con_testo = df[["note", "cause", "trattamento"]].fillna("").ne("").any(axis=1)
+            for r in df[con_testo].itertuples(index=False):
+                n += self.aggiorna((r.audit_id, r.req_id), {"Note": r.note, "Cause": r.cause, "Trattamento": r.trattamento},
+                                   base=(r.catalogo_id, r.req_id))
+            # documenti senza note: solo collegamento al testo del requisito
+            for (cat, rid), ids in df[~con_testo].groupby(["catalogo_id", "req_id"], sort=False)["audit_id"]:
+                self.collega((cat, rid), ((int(i), rid) for i in ids))
+                n += len(ids)
+            self._ultimo = max(a["versione"] for a in modificati)
+            return n
@@ -0,0 +1,399 @@
+# audit_store.py
+"""Archivio locale degli audit su SQLite (journal WAL).
+
+Due livelli di dato per ogni audit:
+- ``risposte``: i valori dei widget (chiave session_state -> valore JSON),
+  usati per riprendere un audit esattamente dove era stato lasciato;
+- ``record``: una riga per requisito con i campi calcolati (stato, punteggi,
+  date in formato ISO), usata per letture massive e statistiche storiche.
+
+Il salvataggio è incrementale: si scrivono solo le chiavi e i record cambiati.
+Un'istanza è condivisibile fra thread (sessioni Streamlit): le scritture sono
+serializzate da un lock, WAL permette letture concorrenti da altri processi.
+"""
+import json
+import os
+import sqlite3
+import threading
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Mapping, Optional
+
+import pandas as pd
+
+from audit_utils import parse_date_it
+
+DB_PATH = os.environ.get("AUDIT_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "audit.sqlite3"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS audit (
+    id                INTEGER PRIMARY KEY,
+    fornitore         TEXT NOT NULL DEFAULT '',
+    data_audit        TEXT,
+    auditor           TEXT NOT NULL DEFAULT '',
+    catalogo_id       TEXT,
+    catalogo_versione TEXT,
+    creato            TEXT NOT NULL,
+    aggiornato        TEXT NOT NULL,
+    versione          INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ix_audit_fornitore_data ON audit (fornitore COLLATE NOCASE, data_audit);
+CREATE INDEX IF NOT EXISTS ix_audit_data ON audit (data_audit);
+CREATE INDEX IF NOT EXISTS ix_audit_aggiornato ON audit (aggiornato);
+
+-- contatore monotono delle scritture: `audit.versione` = valore alla sua ultima modifica
+CREATE TABLE IF NOT EXISTS contatore (
+    id       INTEGER PRIMARY KEY CHECK (id = 1),
+    versione INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO contatore (id, versione) VALUES (1, 0);
+
+CREATE TABLE IF NOT EXISTS risposte (
+    audit_id INTEGER NOT NULL REFERENCES audit (id) ON DELETE CASCADE,
+    chiave   TEXT NOT NULL,
+    valore   TEXT,
+    PRIMARY KEY (audit_id, chiave)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS record (
+    audit_id         INTEGER NOT NULL REFERENCES audit (id) ON DELETE CASCADE,
+    req_id           TEXT NOT NULL,
+    sezione          TEXT NOT NULL,
+    n                INTEGER,
+    requisito        TEXT,
+    riferimento      TEXT,
+    applicabile      INTEGER NOT NULL,
+    stato            TEXT NOT NULL,
+    nc_livello       TEXT,
+    note             TEXT,
+    allegati         TEXT,
+    punteggio        REAL,
+    punteggio_pond   REAL,
+    cause            TEXT,
+    trattamento      TEXT,
+    periodo          TEXT,
+    data_trattamento TEXT,
+    data_verifica    TEXT,
+    responsabile     TEXT,
+    PRIMARY KEY (audit_id, req_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_record_stato ON record (stato, sezione);
+-- scadenzario NC: indici parziali sulle sole non conformità (date ISO AAAA-MM-GG, confrontabili come testo)
+CREATE INDEX IF NOT EXISTS ix_record_nc_trattamento ON record (data_trattamento) WHERE stato = 'Non conforme';
+CREATE INDEX IF NOT EXISTS ix_record_nc_verifica ON record (data_verifica) WHERE stato = 'Non conforme';
+CREATE INDEX IF NOT EXISTS ix_record_nc_responsabile
+    ON record (responsabile COLLATE NOCASE, data_trattamento) WHERE stato = 'Non conforme';
+CREATE INDEX IF NOT EXISTS ix_record_nc_periodo ON record (periodo, data_trattamento) WHERE stato = 'Non conforme';
+"""
+
+# colonna record (UI/export) -> colonna tabella `record`
+COLONNE_RECORD = {
+    "ID": "req_id", "Sezione": "sezione", "N": "n", "Requisito": "requisito", "Riferimento": "riferimento",
+    "Applicabile": "applicabile", "Stato": "stato", "NC Livello": "nc_livello", "Note": "note",
+    "Allegati": "allegati", "Punteggio": "punteggio", "Punteggio ponderato": "punteggio_pond",
+    "Cause": "cause", "Trattamento": "trattamento", "Periodo": "periodo",
+    "Data trattamento": "data_trattamento", "Data verifica": "data_verifica", "Responsabile": "responsabile",
+}
+
+
+# scadenze delle azioni NC -> colonna tabella `record`
+CAMPI_SCADENZA = {"trattamento": "data_trattamento", "verifica": "data_verifica"}
+
+
+def _adesso() -> str:
+    return datetime.now().isoformat(timespec="milliseconds")
+
+
+def _iso(d: Optional[date]) -> Optional[str]:
+    return d.isoformat() if d else None
+
+
+def _json_default(v):
+    if isinstance(v, date):
+        return {"$date": v.isoformat()}
+    raise TypeError(f"Valore non serializzabile: {type(v).__name__}")
+
+
+def _json_hook(obj):
+    if "$date" in obj:
+        return date.fromisoformat(obj["$date"])
+    return obj
+
+
+def _riga_record(audit_id: int, rec: Mapping[str, Any]) -> tuple:
+    v = dict(rec)
+    v["Applicabile"] = 1 if v.get("Applicabile") in ("Sì", True, 1) else 0
+    for c in ("Data trattamento", "Data verifica"):
+        d = v.get(c)
+        v[c] = _iso(d if isinstance(d, date) else parse_date_it(d))
+    for c in ("Punteggio", "Punteggio ponderato"):
+        if v.get(c) is not None and pd.isna(v[c]):
+            v[c] = None
+    return (audit_id, *(v.get(c) for c in COLONNE_RECORD))
+
+
+def record_come_export(df: pd.DataFrame) -> pd.DataFrame:
+    """Righe della tabella `record` -> colonne e formati dei record UI/export (Sì/No, date GG/MM/AAAA)."""
+    out = df.rename(columns={v: k for k, v in COLONNE_RECORD.items()})
+    out = out[[c for c in COLONNE_RECORD if c in out.columns]].copy()
+    if "Applicabile" in out:
+        out["Applicabile"] = out["Applicabile"].map({1: "Sì", 0: "No"})
+    for c in ("Data trattamento", "Data verifica"):
+        if c in out:
+            d = pd.to_datetime(out[c], format="%Y-%m-%d", errors="coerce")
+            out[c] = d.dt.strftime("%d/%m/%Y").fillna("")
+    testo = [c for c in ("NC Livello", "Note", "Allegati", "Cause", "Trattamento", "Periodo", "Responsabile",
+                         "Requisito", "Riferimento") if c in out]
+    out[testo] = out[testo].fillna("")
+    return out
+
+
+class AuditStore:
+    def __init__(self, path: str = DB_PATH):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.RLock()
+        self._con = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._con.row_factory = sqlite3.Row
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute("PRAGMA synchronous=NORMAL")
+        self._con.execute("PRAGMA foreign_keys=ON")
+        self._con.executescript(SCHEMA)
+        # archivi creati prima della colonna `versione`
+        if "versione" not in {r[1] for r in self._con.execute("PRAGMA table_info(audit)")}:
+            self._con.execute("ALTER TABLE audit ADD COLUMN versione INTEGER NOT NULL DEFAULT 0")
+        self._con.execute("CREATE INDEX IF NOT EXISTS ix_audit_versione ON audit (versione)")
+
+    def close(self) -> None:
+        with self._lock:
+            self._con.close()
+
+    def _tx(self, fn):
+        with self._lock:
+            self._con.execute("BEGIN IMMEDIATE")
+            try:
+                out = fn(self._con)
+            except BaseException:
+                self._con.execute("ROLLBACK")
+                raise
+            self._con.execute("COMMIT")
+            return out
+
+    @staticmethod
+    def _incrementa(con) -> int:
+        con.execute("UPDATE contatore SET versione = versione + 1 WHERE id = 1")
+        return con.execute("SELECT versione FROM contatore WHERE id = 1").fetchone()[0]
+
+    def _tocca(self, con, audit_id: int) -> None:
+        """Segna l'audit come modificato: `aggiornato` e nuova `versione` dal contatore (dentro `_tx`)."""
+        con.execute("UPDATE audit SET aggiornato = ?, versione = ? WHERE id = ?",
+                    (_adesso(), self._incrementa(con), audit_id))
+
+    # ---- testata ----
+    def nuovo_audit(self, fornitore: str = "", data_audit: Optional[date] = None, auditor: str = "",
+                    catalogo_id: Optional[str] = None, catalogo_versione: Optional[str] = None) -> int:
+        ts = _adesso()
+
+        def fn(con):
+            audit_id = con.execute(
+                "INSERT INTO audit (fornitore, data_audit, auditor, catalogo_id, catalogo_versione, creato, aggiornato)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (fornitore or "", _iso(data_audit), auditor or "", catalogo_id, catalogo_versione, ts, ts)).lastrowid
+            self._tocca(con, audit_id)
+            return audit_id
+        return self._tx(fn)
+
+    def aggiorna_testata(self, audit_id: int, fornitore: str = "", data_audit: Optional[date] = None,
+                         auditor: str = "") -> None:
+        def fn(con):
+            con.execute("UPDATE audit SET fornitore = ?, data_audit = ?, auditor = ? WHERE id = ?",
+                        (fornitore or "", _iso(data_audit), auditor or "", audit_id))
+            self._tocca(con, audit_id)
+        self._tx(fn)
+
+    def audit(self, audit_id: int) -> Optional[dict]:
+        with self._lock:
+            row = self._con.execute("SELECT * FROM audit WHERE id = ?", (audit_id,)).fetchone()
+        return dict(row) if row else None
+
+    def cerca_audit(self, fornitore: str = "", dal: Optional[date] = None, al: Optional[date] = None,
+                    limit: int = 50) -> List[dict]:
+        """Audit per fornitore (prefisso, senza distinzione maiuscole) e intervallo di date, più recenti prima."""
+        sql, args = "SELECT * FROM audit WHERE 1 = 1", []
+        if fornitore:
+            sql += r" AND fornitore LIKE ? ESCAPE '\'"
+            args.append(fornitore.replace("\\", r"\\").replace("%", r"\%").replace("_", r"\_") + "%")
+        if dal:
+            sql += " AND data_audit >= ?"
+            args.append(dal.isoformat())
+        if al:
+            sql += " AND data_audit <= ?"
+            args.append(al.isoformat())
+        sql += " ORDER BY data_audit DESC, aggiornato DESC LIMIT ?"
+        args.append(int(limit))
+        with self._lock:
+            return [dict(r) for r in self._con.execute(sql, args)]
+
+    def id_audit(self) -> List[int]:
+        with self._lock:
+            return [r[0] for r in self._con.execute("SELECT id FROM audit")]
+
+    def audit_modificati(self, dopo: Optional[int] = None) -> List[dict]:
+        """Audit con `versione` successiva a quella data (tutti se None).
+
+        La versione viene da un contatore incrementato a ogni scrittura, quindi
+        due salvataggi nello stesso millisecondo restano distinguibili.
+        """
+        with self._lock:
+            if dopo is None:
+                rows = self._con.execute("SELECT id, aggiornato, versione FROM audit").fetchall()
+            else:
+                rows = self._con.execute("SELECT id, aggiornato, versione FROM audit WHERE versione > ?",
+                                         (dopo,)).fetchall()
+        return [dict(r) for r in rows]
+
+    def elimina_audit(self, audit_id: int) -> None:
+        def fn(con):
+            if con.execute("DELETE FROM audit WHERE id = ?", (audit_id,)).rowcount:
+                self._incrementa(con)
+        self._tx(fn)
+
+    # ---- risposte (stato widget) ----
+    def salva_risposte(self, audit_id: int, valori: Mapping[str, Any]) -> None:
+        """Upsert delle sole chiavi passate (il chiamante passa il diff rispetto all'ultimo salvataggio)."""
+        if not valori:
+            return
+        righe = [(audit_id, k, json.dumps(v, default=_json_default, ensure_ascii=False)) for k, v in valori.items()]
+
+        def fn(con):
+            con.executemany(
+                "INSERT INTO risposte (audit_id, chiave, valore) VALUES (?, ?, ?)"
+                " ON CONFLICT (audit_id, chiave) DO UPDATE SET valore = excluded.valore", righe)
+            self._tocca(con, audit_id)
+        self._tx(fn)
+
+    def carica_risposte(self, audit_id: int) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._con.execute("SELECT chiave, valore FROM risposte WHERE audit_id = ?", (audit_id,)).fetchall()
+        return {r["chiave"]: json.loads(r["valore"], object_hook=_json_hook) for r in rows}
+
+    # ---- record calcolati ----
+    def salva_record(self, audit_id: int, records: Iterable[Mapping[str, Any]]) -> None:
+        righe = [_riga_record(audit_id, r) for r in records]
+        if not righe:
+            return
+        cols = ", ".join(["audit_id", *COLONNE_RECORD.values()])
+        upd = ", ".join(f"{c} = excluded.{c}" for c in list(COLONNE_RECORD.values())[1:])
+        sql = (f"INSERT INTO record ({cols}) VALUES ({', '.join('?' * (len(COLONNE_RECORD) + 1))})"
+               f" ON CONFLICT (audit_id, req_id) DO UPDATE SET {upd}")
+
+        def fn(con):
+            con.executemany(sql, righe)
+            self._tocca(con, audit_id)
+        self._tx(fn)
+
+    def versione_dati(self) -> tuple:
+        """(numero audit, contatore scritture): il contatore cresce a ogni salvataggio ed eliminazione,
+        anche da altri processi; chiave per cache/snapshot derivati dall'archivio."""
+        with self._lock:
+            return tuple(self._con.execute(
+                "SELECT (SELECT COUNT(*) FROM audit), versione FROM contatore WHERE id = 1").fetchone())
+
+    def record_storici(self, audit_ids: Optional[Iterable[int]] = None, fornitore: str = "",
+                       dal: Optional[date] = None, al: Optional[date] = None,
+                       colonne: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        """Lettura massiva dei record con i dati di testata, filtrata sugli indici di `audit`.
+        ``colonne`` limita le colonne lette dalla tabella `record` (default: tutte)."""
+        if colonne is None:
+            rcols = "r.*"
+        else:
+            colonne = [c for c in colonne if c != "audit_id"]
+            ignote = set(colonne) - set(COLONNE_RECORD.values())
+            if ignote:
+                raise ValueError(f"Colonne record sconosciute: {sorted(ignote)}")
+            rcols = ", ".join(f"r.{c}" for c in colonne)
+        sql = ("SELECT a.id AS audit_id, a.fornitore, a.data_audit, a.auditor, a.catalogo_id, " + rcols +
+               " FROM audit a JOIN record r ON r.audit_id = a.id WHERE 1 = 1")
+        args: list = []
+        if audit_ids is not None:
+            ids = [int(i) for i in audit_ids]
+            if not ids:
+                return pd.DataFrame()
+            sql += f" AND a.id IN ({', '.join('?' * len(ids))})"
+            args += ids
+        if fornitore:
+            sql += " AND a.fornitore = ? COLLATE NOCASE"
+            args.append(fornitore)
+        if dal:
+            sql += " AND a.data_audit >= ?"
+            args.append(dal.isoformat())
+        if al:
+            sql += " AND a.data_audit <= ?"
+            args.append(al.isoformat())
+        with self._lock:
+            df = pd.read_sql_query(sql, self._con, params=args)
+        return df.loc[:, ~df.columns.duplicated()]
+
+    # ---- azioni NC (scadenzario) ----
+    def azioni_nc(self, campo: str = "trattamento", dal: Optional[date] = None, al: Optional[date] = None,
+                  responsabile: Optional[str] = None, periodo: Optional[str] = None, fornitore: str = "",
+                  escludi_superate: bool = True, limit: Optional[int] = None) -> pd.DataFrame:
+        """Non conformità di tutti gli audit con scadenza (`campo`: trattamento o verifica) fra `dal` e `al`.
+
+        Con un intervallo restano fuori le NC senza data. ``escludi_superate`` scarta le NC di un
+        requisito rivalutato (applicabile e valutato) in un audit successivo dello stesso fornitore:
+        il record "Non applicabile" di default di un audit appena aperto non conta. Le date restano ISO:
+        la tipizzazione è in ``audit_tracker``.
+        """
+        col = CAMPI_SCADENZA[campo]
+        # senza statistiche (ANALYZE) il planner preferisce ix_record_stato, che scorre tutte le NC:
+        # l'indice parziale giusto viene indicato esplicitamente. È sempre utilizzabile perché la
+        # query contiene il letterale `stato = 'Non conforme'` della sua clausola WHERE.
+        if responsabile is not None:
+            indice = "ix_record_nc_responsabile"
+        elif periodo is not None:
+            indice = "ix_record_nc_periodo"
+        elif fornitore and not (dal or al):
+            indice = None  # si parte dagli audit del fornitore (CROSS JOIN fissa l'ordine)
+        else:
+            indice = f"ix_record_nc_{campo}"
+        sql = ("SELECT a.id AS audit_id, a.fornitore, a.data_audit, r.req_id, r.sezione, r.n, r.requisito,"
+               " r.nc_livello, r.cause, r.trattamento, r.periodo, r.data_trattamento, r.data_verifica, r.responsabile"
+               + (f" FROM record r INDEXED BY {indice} JOIN audit a ON a.id = r.audit_id" if indice else
+                  " FROM audit a CROSS JOIN record r ON r.audit_id = a.id") +
+               " WHERE r.stato = 'Non conforme'")
+        args: list = []
+        if dal:
+            sql += f" AND r.{col} >= ?"
+            args.append(dal.isoformat())
+        if al:
+            sql += f" AND r.{col} <= ?"
+            args.append(al.isoformat())
+        if responsabile is not None:
+            sql += " AND r.responsabile = ? COLLATE NOCASE"
+            args.append(responsabile)
+        if periodo is not None:
+            sql += " AND r.periodo = ?"
+            args.append(periodo)
+        if fornitore:
+            sql += " AND a.fornitore = ? COLLATE NOCASE"
+            args.append(fornitore)
+        if escludi_superate:
+            sql += (" AND NOT EXISTS (SELECT 1 FROM audit a2 JOIN record r2 ON r2.audit_id = a2.id AND r2.req_id = r.req_id"
+                    " WHERE a2.fornitore = a.fornitore COLLATE NOCASE AND a2.data_audit > a.data_audit"
+                    " AND r2.applicabile = 1 AND r2.stato <> 'Non applicabile')")
+        sql += f" ORDER BY r.{col}, a.fornitore, r.sezione, r.n"
+        if limit is not None:
+            sql += " LIMIT ?"
+            args.append(int(limit))
+        with self._lock:
+            return pd.read_sql_query(sql, self._con, params=args)
+
+    def valori_nc(self, colonna: str) -> List[str]:
+        """Valori distinti (non vuoti) di `responsabile` o `periodo` fra le NC archiviate."""
+        if colonna not in ("responsabile", "periodo"):
+            raise ValueError(f"Colonna non ammessa: {colonna}")
+        with self._lock:
+            return [r[0] for r in self._con.execute(
+                f"SELECT DISTINCT {colonna} FROM record WHERE stato = 'Non conforme' AND {colonna} <> ''"
+                f" ORDER BY {colonna}")]
@@ -0,0 +1,67 @@
+# audit_timing.py
+"""Misura dei tempi per fase (rerun dell'app, generazione PDF, export).
+
+Ogni misura è un :class:`Cronometro` con un evento (``rerun``, ``pdf``,
+``export``...) e le durate delle sue fasi in millisecondi. A fine misura
+``emetti()`` scrive una riga JSON sul logger ``audit.timing``, pensata per
+essere raccolta dai log di produzione::
+
+    {"evento": "rerun", "totale_ms": 812.4, "fasi": {"schede": 640.2, ...}, "audit": 12}
+
+Le righe escono su stderr (livello INFO); ``AUDIT_LOG_TEMPI=0`` le disattiva.
+"""
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+log = logging.getLogger("audit.timing")
+if not log.handlers:
+    _h = logging.StreamHandler()
+    _h.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+    log.addHandler(_h)
+    log.propagate = False
+log.setLevel(logging.INFO if os.environ.get("AUDIT_LOG_TEMPI", "1") != "0" else logging.WARNING)
+
+
+class Cronometro:
+    __slots__ = ("evento", "fasi", "_t0", "_tappa")
+
+    def __init__(self, evento: str):
+        self.evento = evento
+        self.fasi: Dict[str, float] = {}
+        self._t0 = self._tappa = time.perf_counter()
+
+    def tappa(self, nome: str) -> None:
+        """Attribuisce alla fase `nome` il tempo trascorso dalla tappa precedente (o dall'inizio):
+        comodo per codice lineare, senza annidare blocchi ``with``."""
+        ora = time.perf_counter()
+        self.fasi[nome] = self.fasi.get(nome, 0.0) + (ora - self._tappa) * 1000
+        self._tappa = ora
+
+    @contextmanager
+    def fase(self, nome: str) -> Iterator[None]:
+        """Somma al tempo della fase `nome` la durata del blocco (anche se solleva)."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.fasi[nome] = self.fasi.get(nome, 0.0) + (time.perf_counter() - t0) * 1000
+
+    @property
+    def totale_ms(self) -> float:
+        return (time.perf_counter() - self._t0) * 1000
+
+    def riepilogo(self) -> dict:
+        return {"evento": self.evento, "totale_ms": round(self.totale_ms, 1),
+                "fasi": {k: round(v, 1) for k, v in self.fasi.items()}}
+
+    def emetti(self, **extra) -> dict:
+        """Chiude la misura: scrive la riga di log strutturata e restituisce il riepilogo."""
+        dati = {**self.riepilogo(), **extra}
+        if log.isEnabledFor(logging.INFO):
+            log.info(json.dumps(dati, ensure_ascii=False, default=str))
+        return dati
+
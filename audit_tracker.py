@@ -0,0 +1,77 @@
+# audit_tracker.py
+"""Scadenzario delle azioni correttive (NC) su tutti gli audit archiviati.
+
+Le interrogazioni girano in SQLite sugli indici parziali delle non conformità
+(``AuditStore.azioni_nc``); qui i risultati vengono tipizzati (date vere,
+categorie) e completati con i giorni mancanti alla scadenza, negativi se
+scaduta. ``oggi`` è parametrico per poter ricostruire lo scadenzario a una data.
+"""
+from datetime import date, timedelta
+from typing import Optional
+
+import pandas as pd
+
+from audit_store import CAMPI_SCADENZA, AuditStore
+
+COLONNE = {
+    "audit_id": "Audit", "fornitore": "Fornitore", "data_audit": "Data audit", "req_id": "ID",
+    "sezione": "Sezione", "n": "N", "requisito": "Requisito", "nc_livello": "NC Livello",
+    "cause": "Cause", "trattamento": "Trattamento", "periodo": "Periodo",
+    "data_trattamento": "Data trattamento", "data_verifica": "Data verifica", "responsabile": "Responsabile",
+}
+SCADENZA = {"trattamento": "Data trattamento", "verifica": "Data verifica"}
+
+
+def _tipizza(df: pd.DataFrame, campo: str, oggi: date) -> pd.DataFrame:
+    out = df.rename(columns=COLONNE)
+    for c in ("Data audit", "Data trattamento", "Data verifica"):
+        out[c] = pd.to_datetime(out[c], format="%Y-%m-%d", errors="coerce")
+    for c in ("Fornitore", "Sezione", "NC Livello", "Periodo", "Responsabile"):
+        out[c] = out[c].fillna("").astype("category")
+    for c in ("Requisito", "Cause", "Trattamento"):
+        out[c] = out[c].fillna("")
+    out["Giorni"] = (out[SCADENZA[campo]] - pd.Timestamp(oggi)).dt.days.astype("Int32")
+    return out
+
+
+def azioni(store: AuditStore, campo: str = "trattamento", dal: Optional[date] = None, al: Optional[date] = None,
+           oggi: Optional[date] = None, **filtri) -> pd.DataFrame:
+    """NC con scadenza in [dal, al] (estremi opzionali); `filtri` come ``AuditStore.azioni_nc``."""
+    if campo not in CAMPI_SCADENZA:
+        raise ValueError(f"campo: {campo!r} (ammessi: {', '.join(CAMPI_SCADENZA)})")
+    return _tipizza(store.azioni_nc(campo, dal, al, **filtri), campo, oggi or date.today())
+
+
+def scadute(store: AuditStore, campo: str = "trattamento", oggi: Optional[date] = None, **filtri) -> pd.DataFrame:
+    """NC con scadenza già passata (fino a ieri)."""
+    oggi = oggi or date.today()
+    return azioni(store, campo, al=oggi - timedelta(days=1), oggi=oggi, **filtri)
+
+
+def in_scadenza(store: AuditStore, giorni: int = 30, campo: str = "trattamento", oggi: Optional[date] = None,
+                **filtri) -> pd.DataFrame:
+    """NC in scadenza da oggi ai prossimi `giorni` giorni compresi."""
+    oggi = oggi or date.today()
+    return azioni(store, campo, dal=oggi, al=oggi + timedelta(days=giorni), oggi=oggi, **filtri)
+
+
+def per_responsabile(store: AuditStore, responsabile: str, campo: str = "trattamento", **kw) -> pd.DataFrame:
+    return azioni(store, campo, responsabile=responsabile, **kw)
+
+
+def per_periodo(store: AuditStore, periodo: str, campo: str = "trattamento", **kw) -> pd.DataFrame:
+    return azioni(store, campo, periodo=periodo, **kw)
+
+
+def riepilogo(df: pd.DataFrame, by: str = "Responsabile") -> pd.DataFrame:
+    """Conteggio per `by` di NC scadute, in scadenza (0-30 giorni) e senza data."""
+    g = df["Giorni"]
+    fasce = pd.DataFrame({
+        by: df[by],
+        "Scadute": (g < 0).fillna(False),
+        "Entro 30 giorni": ((g >= 0) & (g <= 30)).fillna(False),
+        "Senza data": g.isna(),
+    })
+    out = fasce.groupby(by, observed=True).sum()
+    out["Totale"] = df.groupby(by, observed=True).size()
+    return out.sort_values(["Scadute", "Entro 30 giorni"], ascending=False).reset_index()
@@ -0,0 +1,22 @@
+# audit_utils.py
+from datetime import date
+from typing import Optional
+
+
+def fmt_date(d: Optional[date]) -> str:
+    return d.strftime("%d/%m/%Y") if d else ""
+
+
+def filename_date(d: Optional[date]) -> str:
+    return fmt_date(d).replace("/", "-") if d else "data"
+
+
+def parse_date_it(s: Optional[str]) -> Optional[date]:
+    """Inverso di fmt_date: 'GG/MM/AAAA' -> date (None se vuota o non valida)."""
+    if not s:
+        return None
+    try:
+        gg, mm, aa = (int(x) for x in str(s).split("/"))
+        return date(aa, mm, gg)
+    except ValueError:
+        return None
@@ -0,0 +1,199 @@
+# batch_report.py
+"""Generazione massiva dei report (PDF ed Excel) senza interfaccia Streamlit.
+
+Sorgenti:
+  --db FILE    archivio SQLite degli audit (default: quello dell'app)
+  --dir DIR    cartella di export CSV/XLSX/Parquet dell'app (audit_<fornitore>_<GG-MM-AAAA>.csv)
+
+Esempi:
+  python batch_report.py --out report_T3 --dal 2026-07-01 --al 2026-09-30
+  python batch_report.py --dir export/ --out report/ --workers 8 --formati pdf
+
+I report vengono generati in parallelo su più processi; a fine corsa viene
+stampato un riepilogo con tempi e throughput e gli errori sono scritti in
+``<out>/errori.csv``.
+"""
+import argparse
+import csv
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime
+from typing import List, NamedTuple, Optional
+
+from audit_utils import filename_date
+
+FORMATI = ("pdf", "xlsx")
+_RE_EXPORT = re.compile(r"^audit_(?P<fornitore>.*)_(?P<data>\d{2}-\d{2}-\d{4}|data)$", re.IGNORECASE)
+
+
+class Lavoro(NamedTuple):
+    etichetta: str
+    db: Optional[str] = None
+    audit_id: Optional[int] = None
+    file: Optional[str] = None
+
+
+class Esito(NamedTuple):
+    lavoro: Lavoro
+    ok: bool
+    secondi: float
+    byte: int = 0
+    file: tuple = ()
+    errore: str = ""
+
+
+def _nome_sicuro(s: str) -> str:
+    return re.sub(r'[\\/:*?"<>|\s]+', "_", s.strip()) or "fornitore"
+
+
+def _carica_da_archivio(db: str, audit_id: int):
+    from audit_attachments import allegati_da_risposte
+    from audit_store import AuditStore, record_come_export
+
+    store = AuditStore(db)
+    try:
+        testata = store.audit(audit_id)
+        if testata is None:
+            raise LookupError(f"audit #{audit_id} non trovato")
+        df = record_come_export(store.record_storici(audit_ids=[audit_id]))
+        allegati = allegati_da_risposte(store.carica_risposte(audit_id))
+    finally:
+        store.close()
+    # come nell'app: gli allegati contano solo per i requisiti applicabili
+    df["_files"] = [allegati.get(i, []) if a == "Sì" else [] for i, a in zip(df["ID"], df["Applicabile"])]
+    d = date.fromisoformat(testata["data_audit"]) if testata["data_audit"] else None
+    return df, testata["fornitore"], d, testata["auditor"], f"_{audit_id}"
+
+
+def _carica_da_file(path: str):
+    from audit_export import leggi_export
+
+    base = os.path.splitext(os.path.basename(path))[0]
+    m = _RE_EXPORT.match(base)
+    fornitore, d = (base, None)
+    if m:
+        fornitore = m.group("fornitore")
+        if m.group("data").lower() != "data":
+            d = datetime.strptime(m.group("data"), "%d-%m-%Y").date()
+    df, meta = leggi_export(path)
+    # testata scritta dall'app negli export colonnari: prevale sul nome del file
+    if meta.get("data_audit"):
+        d = date.fromisoformat(meta["data_audit"])
+    return df, meta.get("fornitore") or fornitore, d, meta.get("auditor", ""), ""
+
+
+def genera(lavoro: Lavoro, out_dir: str, formati: tuple) -> Esito:
+    """Eseguito nei processi worker: carica l'audit e scrive i report richiesti."""
+    t0 = time.perf_counter()
+    try:
+        if lavoro.db is not None:
+            df, fornitore, d, auditor, suffisso = _carica_da_archivio(lavoro.db, lavoro.audit_id)
+        else:
+            df, fornitore, d, auditor, suffisso = _carica_da_file(lavoro.file)
+        if df.empty:
+            raise ValueError("nessun requisito registrato")
+        nome = f"{_nome_sicuro(fornitore)}_{filename_date(d)}{suffisso}"
+        scritti, tot = [], 0
+        if "pdf" in formati:
+            from audit_report import build_pdf
+
+            report = build_pdf(df, None, fornitore=fornitore, data_audit=d, auditor=auditor)
+            scritti.append(os.path.join(out_dir, f"Audit_{nome}.pdf"))
+            with open(scritti[-1], "wb") as fh:
+                report.copia_in(fh)
+            tot += len(report)
+        if "xlsx" in formati:
+            from audit_export import export_excel
+
+            dati = export_excel(df.drop(columns=["_files"], errors="ignore"))  # allegati: solo nel PDF
+            scritti.append(os.path.join(out_dir, f"audit_{nome}.xlsx"))
+            with open(scritti[-1], "wb") as fh:
+                fh.write(dati)
+            tot += len(dati)
+        return Esito(lavoro, True, time.perf_counter() - t0, tot, tuple(scritti))
+    except Exception as e:  # un audit difettoso non deve fermare il lotto
+        return Esito(lavoro, False, time.perf_counter() - t0, errore=f"{type(e).__name__}: {e}")
+
+
+def lavori_da_archivio(db: str, fornitore: str = "", dal: Optional[date] = None, al: Optional[date] = None) -> List[Lavoro]:
+    from audit_store import AuditStore
+
+    store = AuditStore(db)
+    try:
+        audits = store.cerca_audit(fornitore, dal=dal, al=al, limit=10 ** 9)
+    finally:
+        store.close()
+    return [Lavoro(f"#{a['id']} {a['fornitore'] or '—'} {a['data_audit'] or ''}".strip(), db=db, audit_id=a["id"])
+            for a in audits]
+
+
+def lavori_da_cartella(cartella: str) -> List[Lavoro]:
+    files = sorted(f for f in os.listdir(cartella) if f.lower().endswith((".csv", ".xlsx", ".parquet", ".arrow", ".feather")))
+    return [Lavoro(f, file=os.path.join(cartella, f)) for f in files]
+
+
+def esegui(lavori: List[Lavoro], out_dir: str, formati: tuple, workers: Optional[int] = None,
+           stream=sys.stdout) -> List[Esito]:
+    os.makedirs(out_dir, exist_ok=True)
+    esiti: List[Esito] = []
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(genera, lav, out_dir, formati) for lav in lavori]
+        for i, fut in enumerate(as_completed(futures), start=1):
+            es = fut.result()
+            esiti.append(es)
+            stato = "ok" if es.ok else f"ERRORE {es.errore}"
+            print(f"[{i}/{len(lavori)}] {es.lavoro.etichetta}: {stato} ({es.secondi:.2f}s)", file=stream, flush=True)
+    durata = time.perf_counter() - t0
+
+    falliti = [e for e in esiti if not e.ok]
+    if falliti:
+        with open(os.path.join(out_dir, "errori.csv"), "w", newline="", encoding="utf-8") as fh:
+            w = csv.writer(fh)
+            w.writerow(["audit", "sorgente", "errore"])
+            for e in falliti:
+                w.writerow([e.lavoro.etichetta, e.lavoro.file or e.lavoro.db, e.errore])
+    ok = len(esiti) - len(falliti)
+    mb = sum(e.byte for e in esiti) / 1e6
+    print(f"\nCompletati {ok}/{len(esiti)} audit in {durata:.1f}s "
+          f"({(len(esiti) / durata) if durata else 0:.2f} audit/s, {mb:.1f} MB scritti, "
+          f"tempo medio per audit {sum(e.secondi for e in esiti) / max(len(esiti), 1):.2f}s)", file=stream)
+    if falliti:
+        print(f"{len(falliti)} errori: vedi {os.path.join(out_dir, 'errori.csv')}", file=stream)
+    return esiti
+
+
+def main(argv=None) -> int:
+    from audit_store import DB_PATH
+
+    ap = argparse.ArgumentParser(description="Genera i report PDF/Excel degli audit in parallelo.")
+    src = ap.add_mutually_exclusive_group()
+    src.add_argument("--db", default=None, help=f"archivio SQLite (default: {DB_PATH})")
+    src.add_argument("--dir", default=None, help="cartella con export CSV/XLSX/Parquet dell'app")
+    ap.add_argument("--out", required=True, help="cartella di destinazione")
+    ap.add_argument("--formati", default="pdf,xlsx", help="pdf, xlsx o entrambi separati da virgola")
+    ap.add_argument("--workers", type=int, default=None, help="processi paralleli (default: numero di CPU)")
+    ap.add_argument("--fornitore", default="", help="solo fornitori che iniziano con il testo dato (archivio)")
+    ap.add_argument("--dal", type=date.fromisoformat, default=None, help="data audit minima AAAA-MM-GG (archivio)")
+    ap.add_argument("--al", type=date.fromisoformat, default=None, help="data audit massima AAAA-MM-GG (archivio)")
+    args = ap.parse_args(argv)
+
+    formati = tuple(f.strip().lower() for f in args.formati.split(",") if f.strip())
+    if not formati or any(f not in FORMATI for f in formati):
+        ap.error(f"--formati: valori ammessi {', '.join(FORMATI)}")
+    if args.dir:
+        lavori = lavori_da_cartella(args.dir)
+    else:
+        lavori = lavori_da_archivio(args.db or DB_PATH, args.fornitore, args.dal, args.al)
+    if not lavori:
+        print("Nessun audit da elaborare.")
+        return 0
+    esiti = esegui(lavori, args.out, formati, args.workers)
+    return 0 if all(e.ok for e in esiti) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,352 @@
+# bench/bench_audit.py
+"""Benchmark riproducibili di rerun dell'app e generazione del report PDF.
+
+Ogni scenario gira in un processo separato (cache fredde, picco di memoria
+pulito) su dati sintetici generati con seme fisso:
+
+- ``app``: l'app viene eseguita senza browser con ``streamlit.testing``
+  (AppTest) su un catalogo sintetico di 56 / 500 / 5000 requisiti già
+  compilati; si misurano il primo run, il rerun senza modifiche e il rerun
+  dopo un'interazione;
+- ``pdf``: ``build_pdf`` chiamato direttamente, con quota di NC e numero di
+  foto (0-100) variabili; si misurano tempo, dimensione del PDF, picco di RSS
+  e la rigenerazione dopo la modifica di una nota (frammenti in cache).
+
+Uso::
+
+    python bench/bench_audit.py                    # tutti gli scenari, confronto con bench/baseline.json
+    python bench/bench_audit.py --rapido           # solo catalogo da 56 requisiti
+    python bench/bench_audit.py --salva-baseline   # riscrive la baseline con i valori misurati
+
+Con ``--soglia`` (default 25%) un tempo o una memoria peggiore della
+baseline oltre la soglia è segnalato come regressione e il processo esce con
+codice 1. Le baseline dipendono dalla macchina: vanno rigenerate sull'host
+su cui si confrontano i risultati. Gli scenari dell'app hanno inoltre un
+tetto assoluto (``limite_ms``) per rerun e interazione: superarlo fa uscire
+con codice 1 anche senza baseline.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from statistics import median
+from typing import Dict, List, NamedTuple
+
+RADICE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+SEME = 81
+
+
+class Scenario(NamedTuple):
+    tipo: str  # "app" | "pdf"
+    requisiti: int
+    quota_nc: float  # sui requisiti applicabili
+    foto: int = 0
+    quota_applicabili: float = 1.0
+    modalita: str = "Schede"  # inserimento dell'app: "Schede" | "Griglia"
+    solo_nc: bool = False  # filtro "Mostra solo Non conformi" attivo: si disegnano solo le schede NC
+    limite_ms: int = 0  # tetto assoluto per rerun e interazione dell'app (0 = nessuno)
+
+    @property
+    def nome(self) -> str:
+        s = f"{self.tipo}-{self.requisiti}req"
+        if self.quota_applicabili < 1:
+            s += f"-appl{int(self.quota_applicabili * 100)}"
+        s += f"-nc{int(self.quota_nc * 100)}"
+        if self.modalita != "Schede":
+            s += f"-{self.modalita.lower()}"
+        if self.solo_nc:
+            s += "-solonc"
+        return s + (f"-{self.foto}foto" if self.tipo == "pdf" else "")
+
+
+SCENARI = [
+    Scenario("app", 56, 0.0, limite_ms=2000), Scenario("app", 56, 0.3, limite_ms=2000),
+    Scenario("app", 500, 0.3, limite_ms=3000),
+    # ogni widget con chiave (radio, selectbox, text_area) copia l'intero session_state: oltre
+    # SCHEDE_MAX requisiti l'app disegna una sezione alla volta, ma con 5000 requisiti compilati
+    # il session_state resta grande e ogni scheda della sezione aperta costa di più
+    Scenario("app", 5000, 0.0, quota_applicabili=0.0, limite_ms=3000), Scenario("app", 5000, 0.3, limite_ms=30000),
+    Scenario("app", 500, 0.3, modalita="Griglia", limite_ms=2000),
+    Scenario("app", 5000, 0.3, modalita="Griglia", limite_ms=6000),
+    # audit compilato, si lavora solo sulle poche NC aperte
+    Scenario("app", 500, 0.01, solo_nc=True, limite_ms=2000),
+    Scenario("pdf", 56, 0.0), Scenario("pdf", 56, 0.3), Scenario("pdf", 56, 0.3, 10), Scenario("pdf", 56, 0.3, 100),
+    Scenario("pdf", 500, 0.3), Scenario("pdf", 500, 0.3, 100),
+    Scenario("pdf", 5000, 0.3), Scenario("pdf", 5000, 1.0),
+]
+# metriche in cui un valore più alto è peggiore (tutte quelle registrate)
+METRICHE = ("primo_run_ms", "rerun_ms", "interazione_ms", "pdf_s", "pdf_modifica_s", "pdf_kb", "picco_mb")
+
+
+# ---------- dati sintetici ----------
+def catalogo_sintetico(n: int, cartella: str) -> str:
+    """Scrive un catalogo di `n` requisiti (sezioni da ~n/10, max 100 item) e ne restituisce l'id."""
+    per_sezione = max(5, min(100, n // 10))
+    sezioni, i = [], 0
+    while i < n:
+        s = len(sezioni) + 1
+        reqs = [{"id": f"S{s:02d}-{j:04d}",
+                 "requisito": f"Requisito sintetico {j} della sezione {s}: verifica documentale e sul campo",
+                 "riferimento": f"Art. {j % 300 + 1} D.Lgs. 81/08"}
+                for j in range(i + 1, min(n, i + per_sezione) + 1)]
+        sezioni.append({"nome": f"{s}. Sezione sintetica {s}", "requisiti": reqs})
+        i += len(reqs)
+    cat_id = f"bench-{n}"
+    with open(os.path.join(cartella, f"{cat_id}.json"), "w", encoding="utf-8") as fh:
+        json.dump({"id": cat_id, "versione": "bench", "titolo": f"Catalogo sintetico {n}", "sezioni": sezioni}, fh)
+    return cat_id
+
+
+def esiti_sintetici(cat, quota_nc: float, rng: random.Random, quota_applicabili: float = 1.0) -> Dict[str, tuple]:
+    """ID requisito -> (stato, livello) per i requisiti applicabili, `quota_nc` non conformi."""
+    out = {}
+    for req in cat:
+        if rng.random() >= quota_applicabili:
+            continue
+        if rng.random() < quota_nc:
+            out[req.id] = ("Non conforme", rng.choice(["Livello 1", "Livello 2"]))
+        else:
+            out[req.id] = ("Conforme", "")
+    return out
+
+
+def foto_sintetiche(n: int, rng: random.Random) -> list:
+    """`n` JPEG 2048x1536 distinti (niente deduplica né cache) salvati nell'archivio allegati."""
+    from io import BytesIO
+
+    import numpy as np
+    from PIL import Image
+
+    from audit_attachments import salva
+
+    gen = np.random.default_rng(rng.randrange(2 ** 32))
+    base = np.linspace(0, 255, 2048, dtype=np.float32)[None, :, None]
+    out = []
+    for i in range(n):
+        arr = (base * 0.6 + gen.integers(0, 100, (1536, 2048, 3))).clip(0, 255).astype("uint8")
+        buf = BytesIO()
+        Image.fromarray(arr).save(buf, "JPEG", quality=90)
+        out.append(salva(buf, f"foto_{i + 1:03d}.jpg", "image/jpeg"))
+    return out
+
+
+def record_sintetici(cat, esiti: Dict[str, tuple], foto: list) -> list:
+    """Record nel formato prodotto da render_requisito; le foto vanno alle prime NC (poi ai conformi)."""
+    ordine = sorted(cat, key=lambda r: esiti[r.id][0] != "Non conforme")
+    allegati = {r.id: [] for r in cat}
+    for i, f in enumerate(foto):
+        allegati[ordine[i % len(ordine)].id].append(f)
+    recs = []
+    for req in cat:
+        stato, livello = esiti[req.id]
+        nc = stato == "Non conforme"
+        recs.append({
+            "ID": req.id, "Applicabile": "Sì", "N": req.n, "Sezione": req.sezione,
+            "Requisito": req.requisito, "Riferimento": req.riferimento, "Stato": stato, "NC Livello": livello,
+            "Note": "Evidenza verificata in sede, documentazione disponibile", "Allegati": ", ".join(f.nome for f in allegati[req.id]),
+            "Punteggio": 0 if nc else 1, "Punteggio ponderato": (0.5 if livello == "Livello 1" else 0.0) if nc else 1.0,
+            "Cause": "Mancata pianificazione degli aggiornamenti" if nc else "",
+            "Trattamento": "Pianificare e registrare l'intervento correttivo" if nc else "",
+            "Periodo": "MEDIO (≤ 6 mesi)" if nc else "", "Data trattamento": "", "Data verifica": "",
+            "Responsabile": "RSPP" if nc else "", "_files": allegati[req.id],
+        })
+    return recs
+
+
+# ---------- misure (nel processo figlio) ----------
+def _picco_mb() -> float:
+    # ru_maxrss è in KB su Linux, in byte su macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def misura_app(sc: Scenario, cat_id: str) -> dict:
+    from streamlit.testing.v1 import AppTest
+
+    from audit_catalog import catalogo
+
+    cat = catalogo(cat_id)
+    esiti = esiti_sintetici(cat, sc.quota_nc, random.Random(SEME), sc.quota_applicabili)
+    at = AppTest.from_file(os.path.join(RADICE, "checklist_Sopralluogo.py"), default_timeout=3600)
+    at.session_state["fornitore"] = "Fornitore Benchmark"
+    at.session_state["modalita"] = sc.modalita
+    at.session_state["filtro_nc"] = sc.solo_nc
+    # nei cataloghi grandi le schede si aprono una sezione alla volta: si lavora sulla prima
+    prima_sezione = next(iter(cat.sezioni.values()))
+    for rid, (stato, livello) in esiti.items():
+        at.session_state[f"{rid}_appl"] = True
+        at.session_state[f"{rid}_st"] = stato
+        if livello:
+            at.session_state[f"{rid}_lvl"] = livello
+            at.session_state[f"{rid}_cause"] = "Mancata pianificazione degli aggiornamenti"
+
+    def run(azione=None) -> float:
+        t0 = time.perf_counter()
+        (azione or at).run()
+        dt = (time.perf_counter() - t0) * 1000
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+        return dt
+
+    prima_nc = next((rid for rid, (stato, _) in esiti.items() if stato == "Non conforme"), None)
+    if sc.solo_nc:
+        at.session_state["sezione_aperta"] = cat.indice[prima_nc].sezione
+
+    primo = run()
+    rerun = median(run() for _ in range(3 if sc.requisiti <= 500 else 1))
+    ultimo = prima_sezione[-1].id
+    if sc.solo_nc:
+        # le altre schede non sono disegnate: si modifica una scheda NC
+        interazione = run(at.text_area(key=f"{prima_nc}_cause").input("Procedura assente"))
+    elif sc.modalita == "Griglia":
+        # AppTest non sa modificare un data_editor: si misura il rerun dopo un filtro
+        interazione = run(at.checkbox(key="filtro_nc").check())
+    else:
+        interazione = run(at.toggle(key=f"{ultimo}_appl").set_value(ultimo not in esiti))
+    return {"primo_run_ms": round(primo), "rerun_ms": round(rerun), "interazione_ms": round(interazione)}
+
+
+def misura_pdf(sc: Scenario, cat_id: str) -> dict:
+    import pandas as pd
+
+    from audit_catalog import catalogo
+    from audit_report import build_pdf
+
+    rng = random.Random(SEME)
+    cat = catalogo(cat_id)
+    df = pd.DataFrame(record_sintetici(cat, esiti_sintetici(cat, sc.quota_nc, rng), foto_sintetiche(sc.foto, rng)))
+    t0 = time.perf_counter()
+    report = build_pdf(df, None, fornitore="Fornitore Benchmark", auditor="Bench")
+    pdf_s = time.perf_counter() - t0
+    # una nota cambiata a metà report: si rigenerano il suo gruppo di sezioni e poco altro
+    df.loc[len(df) // 2, "Note"] = "Nota modificata dopo la prima generazione"
+    t0 = time.perf_counter()
+    build_pdf(df, None, fornitore="Fornitore Benchmark", auditor="Bench")
+    return {"pdf_s": round(pdf_s, 2), "pdf_modifica_s": round(time.perf_counter() - t0, 2),
+            "pdf_kb": round(len(report) / 1024)}
+
+
+def _figlio(nome: str) -> None:
+    sc = next(s for s in SCENARI if s.nome == nome)
+    cat_id = f"bench-{sc.requisiti}"
+    misura = misura_app if sc.tipo == "app" else misura_pdf
+    res = misura(sc, cat_id)
+    res["picco_mb"] = _picco_mb()
+    print(json.dumps(res))
+
+
+def esegui(sc: Scenario, tmp: str) -> dict:
+    """Lancia lo scenario in un processo nuovo, con archivi e cataloghi in una cartella temporanea."""
+    # un solo catalogo per cartella, così l'app lo usa senza selezione
+    cataloghi = os.path.join(tmp, f"cataloghi-{sc.requisiti}")
+    if not os.path.isdir(cataloghi):
+        os.makedirs(cataloghi)
+        catalogo_sintetico(sc.requisiti, cataloghi)
+    env = dict(os.environ, PYTHONPATH=RADICE, AUDIT_CATALOGHI=cataloghi,
+               AUDIT_DB=os.path.join(tmp, f"{sc.nome}.sqlite3"), AUDIT_ALLEGATI=os.path.join(tmp, "allegati"))
+    p = subprocess.run([sys.executable, os.path.abspath(__file__), "--figlio", sc.nome],
+                       env=env, cwd=RADICE, capture_output=True, text=True)
+    if p.returncode != 0:
+        raise RuntimeError(f"{sc.nome}: {p.stderr.strip().splitlines()[-1] if p.stderr.strip() else p.returncode}")
+    return json.loads(p.stdout.strip().splitlines()[-1])
+
+
+def _ambiente() -> dict:
+    import platform
+    from importlib.metadata import version
+
+    return {"python": platform.python_version(), "sistema": platform.platform(terse=True),
+            "cpu": os.cpu_count(), **{p: version(p) for p in ("streamlit", "pandas", "reportlab", "pillow")}}
+
+
+def confronta(risultati: Dict[str, dict], baseline: Dict[str, dict], soglia: float) -> List[str]:
+    regressioni = []
+    for nome, res in risultati.items():
+        base = baseline.get(nome, {})
+        for m in METRICHE:
+            if m in res and base.get(m):
+                delta = (res[m] - base[m]) / base[m]
+                if delta > soglia:
+                    regressioni.append(f"{nome} {m}: {base[m]} -> {res[m]} (+{delta:.0%})")
+    return regressioni
+
+
+def fuori_limite(risultati: Dict[str, dict]) -> List[str]:
+    """Rerun e interazioni dell'app oltre il tetto assoluto dello scenario, indipendente dalla baseline."""
+    out = []
+    for sc in SCENARI:
+        res = risultati.get(sc.nome, {})
+        for m in ("rerun_ms", "interazione_ms"):
+            if sc.limite_ms and res.get(m, 0) > sc.limite_ms:
+                out.append(f"{sc.nome} {m}: {res[m]} > {sc.limite_ms}")
+    return out
+
+
+def _riga(nome: str, res: dict, base: dict) -> str:
+    celle = []
+    for m in METRICHE:
+        if m in res:
+            d = f" ({(res[m] - base[m]) / base[m]:+.0%})" if base.get(m) else ""
+            celle.append(f"{m}={res[m]}{d}")
+    return f"{nome:<30} " + "  ".join(celle)
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark di rerun dell'app e generazione PDF.")
+    ap.add_argument("--rapido", action="store_true", help="solo gli scenari con catalogo da 56 requisiti")
+    ap.add_argument("--scenari", default="", help="nomi degli scenari separati da virgola (default: tutti)")
+    ap.add_argument("--baseline", default=BASELINE, help="file JSON delle baseline")
+    ap.add_argument("--salva-baseline", action="store_true", help="aggiorna la baseline con i valori misurati")
+    ap.add_argument("--soglia", type=float, default=0.25, help="peggioramento tollerato rispetto alla baseline")
+    ap.add_argument("--figlio", default=None, help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+    if args.figlio:
+        _figlio(args.figlio)
+        return 0
+
+    scenari = SCENARI
+    if args.rapido:
+        scenari = [s for s in scenari if s.requisiti == 56]
+    if args.scenari:
+        nomi = {n.strip() for n in args.scenari.split(",")}
+        scenari = [s for s in scenari if s.nome in nomi]
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as fh:
+            baseline = json.load(fh)
+
+    risultati = {}
+    with tempfile.TemporaryDirectory(prefix="bench_audit_") as tmp:
+        for sc in scenari:
+            risultati[sc.nome] = res = esegui(sc, tmp)
+            print(_riga(sc.nome, res, baseline.get(sc.nome, {})), flush=True)
+
+    oltre = fuori_limite(risultati)
+    if oltre:
+        print("\nOltre il tetto assoluto dello scenario:")
+        for r in oltre:
+            print(f"  {r}")
+    if args.salva_baseline:
+        baseline.update(risultati)
+        baseline["_ambiente"] = _ambiente()
+        with open(args.baseline, "w", encoding="utf-8") as fh:
+            json.dump(dict(sorted(baseline.items())), fh, indent=2)
+            fh.write("\n")
+        print(f"\nBaseline aggiornata: {args.baseline}")
+        return 1 if oltre else 0
+    regressioni = confronta(risultati, baseline, args.soglia)
+    if regressioni:
+        print(f"\nRegressioni oltre il {args.soglia:.0%}:")
+        for r in regressioni:
+            print(f"  {r}")
+    return 1 if regressioni or oltre else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,31 +1,29 @@
 # checklist_Sopralluogo.py
 import streamlit as st
 import pandas as pd
-from PIL import Image
+import re
 from io import BytesIO
 from datetime import date
 from typing import Optional
 from calendar import monthrange
 
-# ReportLab
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4, landscape
-from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
-from reportlab.lib.units import cm
-from reportlab.platypus import (
-    BaseDocTemplate, PageTemplate, Frame, NextPageTemplate,
-    Paragraph, Spacer, Table, TableStyle,
-    PageBreak, Image as RLImage
-)
-from reportlab.lib.utils import ImageReader
+from audit_images import DPI_DEFAULT, QUALITA_DEFAULT
+from audit_export import digest_df, export_csv, export_excel, export_parquet
+from audit_charts import dati_sezioni, distribuzione_nc, spec_nc, spec_sezioni
+from audit_filters import CAMPI_DATA, Filtri, maschera
+from audit_record import COLONNE as COLONNE_RECORD, Record, frame_record, formato_export
+from audit_scoring import PERIODI, aggrega, totali, percentuali, tabella_sezioni
+from audit_utils import fmt_date, filename_date
+from audit_store import AuditStore
+from audit_attachments import LIMITE_SESSIONE, salva as salva_allegato, da_dict
+from audit_timing import Cronometro
+from audit_search import IndiceTesto
+from audit_catalog import Requisito, catalogo, id_requisiti, cataloghi_disponibili, carica_catalogo, CATALOGO_DEFAULT
+
+# tempi per fase di questo run (riga di log a fine script, pannello diagnostica in sidebar)
+cron = Cronometro("rerun")
 
 # ---------- Utility ----------
-def fmt_date(d: Optional[date]) -> str:
-    return d.strftime("%d/%m/%Y") if d else ""
-
-def filename_date(d: Optional[date]) -> str:
-    return fmt_date(d).replace("/", "-") if d else "data"
-
 def date_input_eu(label: str, key: str, value: Optional[date] = None, allow_empty: bool = False,
                   min_year: int = 2000, max_year: int = 2100) -> Optional[date]:
     """Date picker europeo (GG/MM/AAAA) con 3 selectbox. Se allow_empty=True, può restare vuoto."""
@@ -58,38 +56,126 @@ def date_input_eu(label: str, key: str, value: Optional[date] = None, allow_empt
 
     return date(aa, mm, gg)
 
+# ---------- Archivio audit (SQLite) ----------
+CHIAVI_TESTATA = ("fornitore", "auditor", "data_audit_d", "data_audit_m", "data_audit_y", "catalogo_id")
+
+@st.cache_resource
+def audit_store():
+    return AuditStore()
+
+def chiave_audit(k: str, ids: frozenset) -> bool:
+    """Chiavi di session_state che appartengono all'audit (testata e widget dei requisiti)."""
+    return k in CHIAVI_TESTATA or (k.split("_", 1)[0] in ids and "_files" not in k)
+
+def _pulisci_audit():
+    ids = id_requisiti()
+    for k in [k for k in st.session_state if chiave_audit(k, ids)]:
+        del st.session_state[k]
+    for k in ("audit_id", "_salvato", "_salvato_rec", "_records", "_stats_memo", "_indice", "griglia", "_pdf_job", "_pdf_digest",
+              "_allegati_byte"):
+        st.session_state.pop(k, None)
+
+def nuovo_audit():
+    _pulisci_audit()
+
+def riprendi_audit(audit_id: int):
+    # callback: gira prima del rerun, così tutti i widget nascono già valorizzati
+    _pulisci_audit()
+    valori = audit_store().carica_risposte(audit_id)
+    st.session_state.update(valori)
+    st.session_state["audit_id"] = audit_id
+    st.session_state["_salvato"] = dict(valori)
+
+def precompila(audit_id: Optional[int] = None):
+    # callback: tutte le chiavi dei widget scritte in un colpo solo, un unico rerun dopo il click
+    from audit_export import leggi_export
+    from audit_prefill import mappa_catalogo, valori_schede
+    from audit_store import record_come_export
+
+    ss = st.session_state
+    try:
+        if audit_id is not None:
+            store = audit_store()
+            df = record_come_export(store.record_storici(audit_ids=[audit_id]))
+            fornitore_origine = (store.audit(audit_id) or {}).get("fornitore", "")
+        else:
+            upl = ss.get("prefill_upl")
+            if upl is None:
+                ss["_prefill_esito"] = ("warning", "Caricare un export (CSV, Excel, Parquet o Arrow).", [])
+                return
+            df, meta = leggi_export(upl.getvalue(), upl.name)
+            fornitore_origine = meta.get("fornitore", "")
+    except (ValueError, KeyError, OSError) as e:
+        ss["_prefill_esito"] = ("error", f"Impossibile leggere l'audit di partenza: {e}", [])
+        return
+    ids, esito = mappa_catalogo(df, CATALOGO)
+    valori = valori_schede(df, ids, RESPONSABILI, PERIODI)
+
+    testata = {k: ss[k] for k in CHIAVI_TESTATA if k in ss}
+    _pulisci_audit()  # nuovo audit: l'origine resta com'era
+    ss.update(testata)
+    if not ss.get("fornitore"):
+        ss["fornitore"] = fornitore_origine or ""
+    for rid, v in valori.items():
+        for col, x in v.items():
+            if col in DATE_GRIGLIA:
+                _scrivi_data(f"{rid}_{DATE_GRIGLIA[col]}", x)
+            else:
+                ss[f"{rid}_{CHIAVI_GRIGLIA[col]}"] = x
+    mancanti = [f"{r.get('ID', '')} — {r.get('Requisito', '')}"
+                for r, rid in zip(df.to_dict("records"), ids) if rid is None]
+    per_metodo = ", ".join(f"{esito[m]} per {m}" for m in ("ID", "testo", "riferimento") if esito[m])
+    ss["_prefill_esito"] = ("success", f"Precompilati {len(valori)} requisiti ({per_metodo or 'nessuno'}); "
+                                       "gli allegati non vengono copiati.", mancanti)
+
+def autosalva(valori: dict, records=(), avvia: bool = False):
+    """Salva solo le chiavi e i record cambiati dall'ultimo salvataggio.
+    Senza un audit aperto ne crea uno solo se `avvia` (primo dato significativo)."""
+    salvato = st.session_state.setdefault("_salvato", {})
+    salvato_rec = st.session_state.setdefault("_salvato_rec", {})
+    diff = {k: v for k, v in valori.items() if k not in salvato or salvato[k] != v}
+    rec_diff = [r for r in records if salvato_rec.get(r.id) != r.firma()]
+    if not diff and not rec_diff:
+        return
+    store = audit_store()
+    audit_id = st.session_state.get("audit_id")
+    if audit_id is None:
+        if not avvia:
+            return
+        audit_id = store.nuovo_audit(st.session_state.get("fornitore", ""), None, st.session_state.get("auditor", ""),
+                                     CATALOGO.id, CATALOGO.versione)
+        st.session_state["audit_id"] = audit_id
+    store.salva_risposte(audit_id, diff)
+    store.salva_record(audit_id, [r.come_dict() for r in rec_diff])
+    salvato.update(diff)
+    salvato_rec.update({r.id: r.firma() for r in rec_diff})
+
+def valori_widget(prefissi: tuple) -> dict:
+    return {k: v for k, v in st.session_state.items()
+            if k.startswith(prefissi) and "_files" not in k and isinstance(v, (bool, int, float, str, date, list))}
+
 st.set_page_config(page_title="Audit Fornitore — D.Lgs. 81/08", page_icon="✅", layout="wide")
 
 # ---------- CSS ----------
-st.markdown("""
-<style>
-:root { --brand:#0f766e; --muted:#6b7280; --soft:#e5e7eb; --danger:#b91c1c; --danger-bg:#fee2e2; }
-.block-container { padding-top: 1rem; }
-h1,h2,h3 { letter-spacing: .2px; }
-div[role="radiogroup"] > label {
-  padding: 6px 10px; border: 1px solid var(--soft); border-radius: 8px; margin-right: 6px; margin-bottom: 6px;
-}
-[data-testid="stMetricValue"] { color: var(--brand); }
-.badge-nc { background:#b91c1c; color:#fff; padding:4px 8px; border-radius:999px; font-size:12px; font-weight:700; }
-.ref { color:#666; font-size:12px; }
-/* Sidebar: allarga i select */
-[data-testid="stSidebar"] div[data-baseweb="select"] { min-width: 88px; }
-[data-testid="stSidebar"] .stSelectbox label { font-size: 12px; }
-/* Brand in sidebar */
-[data-testid="stSidebar"] .brand-box {
-  position: sticky; top: 0;
-  background: inherit;
-  padding: 12px 8px 10px 8px;
-  margin: -8px -8px 8px -8px; /* allineati alla sidebar */
-  border-bottom: 1px solid var(--soft);
-  text-align: center;
-  z-index: 100;
-}
-[data-testid="stSidebar"] .brand-box small {
-  color: var(--muted);
-}
-</style>
-""", unsafe_allow_html=True)
+@st.cache_resource
+def stile_css() -> str:
+    # letto e compattato una volta per processo: ad ogni rerun si invia solo il blocco <style> già pronto
+    with open("assets/app.css", encoding="utf-8") as fh:
+        css = re.sub(r"/\*.*?\*/", "", fh.read(), flags=re.S)
+    return "<style>" + " ".join(css.split()) + "</style>"
+
+
+@st.cache_resource
+def brand_png() -> Optional[bytes]:
+    # byte del PNG già codificato: st.image li serve così come sono, senza ricodificare un'immagine PIL
+    try:
+        with open("assets/sidebar_brand.png", "rb") as fh:
+            return fh.read()
+    except OSError:
+        return None
+
+
+st.markdown(stile_css(), unsafe_allow_html=True)
 
 st.title("Checklist Audit Fornitore — D.Lgs. 81/08 & SMEI")
 
@@ -101,12 +187,7 @@ with st.sidebar:
     BRAND_LOCK = True  # lascia True: così forzi il tuo logo per tutti
     # se vuoi sbloccarlo per te su Streamlit Cloud: metti BRAND_LOCK = st.secrets.get("BRAND_LOCK", True)
 
-    brand_img = None
-    try:
-        brand_img = Image.open("assets/sidebar_brand.png")
-    except Exception:
-        pass
-
+    brand_img = brand_png()
     st.markdown('<div class="brand-box">', unsafe_allow_html=True)
     if brand_img is not None:
         st.image(brand_img, use_container_width=True)
@@ -115,109 +196,146 @@ with st.sidebar:
     st.write("<small>© 2025 Simone Leandrini</small>", unsafe_allow_html=True)
     st.markdown("</div>", unsafe_allow_html=True)
     st.header("Dati Audit")
-    fornitore = st.text_input("Fornitore")
+    fornitore = st.text_input("Fornitore", key="fornitore")
     data_audit = date_input_eu("Data audit", key="data_audit", value=date.today(), allow_empty=False)
-    auditor = st.text_input("Auditor")
+    auditor = st.text_input("Auditor", key="auditor")
+    cataloghi = cataloghi_disponibili()
+    if len(cataloghi) > 1:
+        cat_id = st.selectbox("Catalogo requisiti", list(cataloghi),
+                              index=list(cataloghi).index(CATALOGO_DEFAULT) if CATALOGO_DEFAULT in cataloghi else 0,
+                              format_func=lambda c: carica_catalogo(cataloghi[c]).etichetta, key="catalogo_id")
+    else:
+        cat_id = next(iter(cataloghi))
+    modalita = st.radio("Inserimento", ["Schede", "Griglia"], key="modalita", horizontal=True,
+                        help="Griglia: tutto il catalogo in un'unica tabella modificabile (allegati solo dalle schede).")
 
     st.divider()
     st.caption("Logo per il PDF (opzionale)")
     logo_up = st.file_uploader("Carica logo (JPG/PNG)", type=["jpg","jpeg","png"], key="logo_upl")
+    with st.expander("Foto nel PDF"):
+        dpi_foto = st.number_input("Risoluzione (DPI)", min_value=72, max_value=300, value=DPI_DEFAULT, step=25, key="dpi_foto")
+        qualita_foto = st.slider("Qualità JPEG", min_value=40, max_value=95, value=QUALITA_DEFAULT, step=5, key="qualita_foto")
 
     st.divider()
-    st.caption("Filtri (solo vista)")
+    st.caption("Filtri (solo vista: i requisiti nascosti restano compilati e contano nei punteggi)")
     if st.button("🔄 Reset filtri"):
         st.session_state["filtro_nc"] = False
         st.session_state["filtro_testo"] = ""
+        for k in ("filtro_sezioni", "filtro_livelli", "filtro_resp"):
+            st.session_state[k] = []
+        st.session_state["filtro_date"] = ()
     filtro_nc = st.checkbox("Mostra solo Non conformi", value=st.session_state.get("filtro_nc", False), key="filtro_nc")
-    filtro_testo = st.text_input("Cerca (testo in requisito/note)", value=st.session_state.get("filtro_testo", ""), key="filtro_testo")
+    filtro_testo = st.text_input("Cerca (requisito, riferimento, note, cause, trattamento)", value=st.session_state.get("filtro_testo", ""), key="filtro_testo")
+    box_filtri = st.container()  # filtri che dipendono dal catalogo: riempito dopo averlo caricato
+
+    st.divider()
+    with st.expander("💾 Audit salvati"):
+        if st.session_state.get("audit_id"):
+            st.caption(f"Salvataggio automatico attivo — audit #{st.session_state['audit_id']}")
+        else:
+            st.caption("Il salvataggio automatico parte al primo requisito compilato.")
+        st.button("➕ Nuovo audit", on_click=nuovo_audit, use_container_width=True)
+        cerca_forn = st.text_input("Cerca fornitore", key="cerca_audit")
+        precedenti = audit_store().cerca_audit(cerca_forn, limit=20)
+        for a in precedenti:
+            d = date.fromisoformat(a["data_audit"]) if a["data_audit"] else None
+            st.button(f"↩️ {a['fornitore'] or '—'} — {fmt_date(d) or 's.d.'} (#{a['id']})", key=f"riprendi_{a['id']}",
+                      on_click=riprendi_audit, args=(a["id"],), use_container_width=True)
+
+    with st.expander("📋 Precompila da audit precedente"):
+        st.caption("Avvia un nuovo audit con le risposte di uno precedente (anche su un catalogo aggiornato: "
+                   "i requisiti si riconoscono per ID, testo o riferimento). Fornitore, data e auditor restano quelli inseriti.")
+        st.file_uploader("Export dell'app", type=["csv", "xlsx", "parquet", "arrow", "feather"], key="prefill_upl")
+        st.button("📋 Precompila dal file", on_click=precompila, use_container_width=True,
+                  disabled=st.session_state.get("prefill_upl") is None)
+        if precedenti:
+            etichette = {a["id"]: f"{a['fornitore'] or '—'} — "
+                                  f"{fmt_date(date.fromisoformat(a['data_audit'])) if a['data_audit'] else 's.d.'} (#{a['id']})"
+                         for a in precedenti}
+            origine = st.selectbox("…oppure da un audit salvato (ricerca fornitore sopra)", list(etichette),
+                                   key="prefill_audit", format_func=etichette.get)
+            st.button("📋 Precompila dall'audit salvato", on_click=precompila, args=(origine,), use_container_width=True)
+        esito = st.session_state.pop("_prefill_esito", None)
+        if esito:
+            getattr(st, esito[0])(esito[1])
+            if esito[2]:
+                st.caption(f"Non ricondotti al catalogo ({len(esito[2])}):")
+                st.text("\n".join(esito[2][:50]) + ("\n…" if len(esito[2]) > 50 else ""))
+
+    diagnostica = st.toggle("⏱️ Diagnostica prestazioni", key="diagnostica")
+    pannello_diagnostica = st.empty()  # riempito a fine run, quando tutte le fasi sono misurate
 
 st.write(f"**Fornitore:** {fornitore or '—'}  |  **Data:** {fmt_date(data_audit)}  |  **Auditor:** {auditor or '—'}")
+cron.tappa("sidebar")
 
 # ---------- Catalogo requisiti ----------
-CATALOGO = {
-    "Documentazione e organizzazione": [
-        ("DVR presente, firmato, data ≤ 12 mesi o aggiornato a variazioni", "Art. 17, 28-29 D.Lgs. 81/08"),
-        ("Nomina RSPP disponibile e coerente con macrosettore ATECO", "Art. 17, 31-33 D.Lgs. 81/08"),
-        ("Nomina ASPP (se presente) e evidenze formazione modulo A-B-C", "Art. 32 Acc. Stato-Regioni 2011"),
-        ("Designazione Addetti Primo Soccorso (elenchi e turnazioni)", "Art. 18, 45 D.Lgs. 81/08; DM 388/03"),
-        ("Designazione Addetti Antincendio e registro prove", "Art. 18 D.Lgs. 81/08; DM 02/09/21"),
-        ("Informazione e consultazione RLS/RLST documentata", "Art. 47-50 D.Lgs. 81/08"),
-        ("Gestione appalti: idoneità tecnico-professionale fornitori", "Art. 26 D.Lgs. 81/08"),
-        ("D.U.V.R.I. emesso ove necessario (rischi interferenziali)", "Art. 26 c.3 D.Lgs. 81/08"),
-        ("Piano di emergenza con planimetrie aggiornate/esposte", "Art. 43-46 D.Lgs. 81/08; DM 02/09/21"),
-    ],
-    "Impianti elettrici e verifiche": [
-        ("Verbali verifica messa a terra e differenziali (DPR 462/01)", "DPR 462/01; Art. 86 D.Lgs. 81/08"),
-        ("Quadri elettrici: chiusura, targhette, schemi, IP adeguato", "CEI 64-8; Art. 80-87 D.Lgs. 81/08"),
-        ("Prese e cavi: integrità, assenza di giunte volanti, protezioni", "CEI 64-8; Art. 80-87 D.Lgs. 81/08"),
-        ("Illuminazione di emergenza funzionante e manutenzionata", "UNI EN 1838; Art. 63-64 D.Lgs. 81/08"),
-    ],
-    "Macchine e attrezzature": [
-        ("Marcatura CE e Dichiarazione CE conformità disponibili", "Dir. 2006/42/CE; Art. 70-71 D.Lgs. 81/08"),
-        ("Manuale d’uso/manutenzione disponibile in lingua italiana", "Dir. 2006/42/CE; All. V D.Lgs. 81/08"),
-        ("Ripari fissi/mobili e microinterruttori funzionanti", "Allegato V e VI D.Lgs. 81/08"),
-        ("Dispositivi arresto di emergenza accessibili e testati", "EN ISO 13850; Art. 71 D.Lgs. 81/08"),
-        ("Check-list manutenzione periodica e registri compilati", "Art. 71 c.8-9 D.Lgs. 81/08"),
-        ("Verifiche periodiche attrezzature (carrelli, sollev.)", "Art. 71 c.11; DM 11/04/2011"),
-    ],
-    "Attrezzature in pressione / gas": [
-        ("PED/recipienti in pressione: collaudi/verifiche in validità", "D.Lgs. 81/08 Art. 71; PED 2014/68/UE"),
-        ("Bombole gas: fissaggio, cappellotti, etichette, stoccaggio", "Linee guida INAIL; CLP"),
-    ],
-    "Sostanze chimiche / CLP / REACH": [
-        ("Inventario sostanze aggiornato con codici e quantità", "Titolo IX Capo I D.Lgs. 81/08; REACH"),
-        ("Schede di sicurezza (SDS) 16 sezioni, ≤ 5 anni, in ITA", "REACH; Art. 223 D.Lgs. 81/08"),
-        ("Etichettatura CLP corretta su imballaggi e contenitori secondari", "Reg. CLP (CE) n.1272/2008"),
-        ("Stoccaggio per compatibilità e bacini di contenimento", "Titolo IX D.Lgs. 81/08"),
-        ("Procedure sversamenti e kit assorbenti disponibili", "Titolo IX D.Lgs. 81/08"),
-        ("Valutazioni specifiche: cancerogeni/mutageni dove presenti", "Titolo IX Capo II D.Lgs. 81/08"),
-    ],
-    "Movimentazione merci / carrelli": [
-        ("Abilitazione carrellisti (Accordo CSR 2012) in corso di validità", "Art. 73 D.Lgs. 81/08; CSR 22/02/2012"),
-        ("Check giornaliero carrelli (freni, forche, luci, allarmi)", "Buone pratiche; Art. 71 D.Lgs. 81/08"),
-        ("Viabilità interna segnalata (corsie, limiti, specchi)", "Allegato IV D.Lgs. 81/08"),
-        ("Zone carico/scarico: protezioni bordi, STOP, paraurti", "Allegato IV D.Lgs. 81/08"),
-        ("Mezzi di sollevamento: brache/ganci con certificazione e stato", "Art. 71 D.Lgs. 81/08"),
-    ],
-    "Ambienti di lavoro / antincendio": [
-        ("Estintori adeguati e manutenzione UNI 9994-1 aggiornata", "DM 02/09/21; UNI 9994-1"),
-        ("Idranti/naspi UNI 10779: ispezioni e prova pressione", "UNI 10779; DM 02/09/21"),
-        ("Uscite di emergenza libere e segnaletica UNI EN ISO 7010", "Allegato IV D.Lgs. 81/08"),
-        ("Ordine e pulizia (5S) nelle aree operative e stoccaggi", "Art. 64 D.Lgs. 81/08"),
-        ("Rumore: valutazione e misure (cuffie disponibili dove ≥85 dB)", "Titolo VIII Capo II D.Lgs. 81/08"),
-        ("Vibrazioni: valutazione e controllo esposizioni", "Titolo VIII Capo III D.Lgs. 81/08"),
-    ],
-    "Sorveglianza sanitaria": [
-        ("Nomina Medico Competente ove dovuta", "Art. 18, 25, 41 D.Lgs. 81/08"),
-        ("Protocolli sanitari coerenti con rischi valutati", "Art. 25, 41 D.Lgs. 81/08"),
-        ("Giudizi di idoneità disponibili e comunicati ai preposti", "Art. 41 D.Lgs. 81/08"),
-        ("Gestione idoneità con prescrizioni e follow-up attivi", "Art. 18, 41 D.Lgs. 81/08"),
-    ],
-    "DPI (scelta, consegna, uso)": [
-        ("Valutazione scelta DPI per ciascun rischio", "Art. 76-77 D.Lgs. 81/08"),
-        ("Registro consegna DPI firmato dai lavoratori", "Art. 77 D.Lgs. 81/08"),
-        ("Addestramento DPI di III categoria documentato", "Art. 77 c.5 D.Lgs. 81/08"),
-        ("Sostituzione DPI usurati e stoccaggio corretto", "Art. 77 D.Lgs. 81/08"),
-    ],
-    "Aspetti formativi (dettaglio)": [
-        ("Formazione generale lavoratori (≥4h) erogata a tutti i neoassunti", "Accordi Stato-Regioni 2011/2016"),
-        ("Formazione specifica (4/8/12h secondo rischio) completata", "Accordi SR 2011/2016"),
-        ("Aggiornamento lavoratori (≥6h/5 anni) tracciato", "Accordi SR 2011/2016"),
-        ("Formazione Preposti (moduli aggiuntivi) + aggiornamento", "Accordo SR 2021 (Preposti)"),
-        ("Formazione Dirigenti (≥16h) + aggiornamento quinquennale", "Accordi SR 2011/2016"),
-        ("Antincendio (Liv. 1-2-3) con addestramento pratico", "DM 02/09/21"),
-        ("Primo soccorso (A/B/C) + aggiornamento triennale", "DM 388/03"),
-        ("VDT (ove previsto): informazione/formazione addetti", "Art. 173-176 D.Lgs. 81/08"),
-        ("Attrezzature particolari (carrelli, PLE, gru): abilitazioni", "Accordo CSR 22/02/2012"),
-        ("RSPP/ASPP: moduli A-B-C e aggiornamenti quinquennali", "Art. 32 D.Lgs. 81/08; Accordi SR"),
-    ],
-}
+# letto e validato una volta per processo (audit_catalog), indicizzato per ID requisito
+CATALOGO = catalogo(cat_id)
+
+# oltre questo numero di requisiti le schede si aprono una sezione alla volta: ogni widget con chiave
+# costa in proporzione a tutti quelli della pagina, e il run completo crescerebbe col quadrato delle schede
+SCHEDE_MAX = 120
+TUTTE_SEZIONI = "Tutte le sezioni"
 
 RESPONSABILI = ["Datore di Lavoro", "Dirigente", "Preposto", "RSPP", "Medico Competente", "Addetto Sicurezza", "Altro"]
 
-def render_requisito(idx, sezione, requisito, riferimento):
+def byte_allegati() -> int:
+    """Totale in byte degli allegati della sessione, tenuto in `_allegati_byte`; ricalcolato dai
+    riferimenti se manca (audit ripreso o appena ripulito)."""
+    ss = st.session_state
+    if "_allegati_byte" not in ss:
+        ss["_allegati_byte"] = sum(int(d.get("dimensione", 0)) for k, v in ss.items()
+                                   if k.endswith("_allegati") and v for d in v)
+    return ss["_allegati_byte"]
+
+def _rimuovi_allegato(k: str, sha256: str):
+    refs = st.session_state.get(f"{k}_allegati", [])
+    st.session_state["_allegati_byte"] = byte_allegati() - sum(int(d.get("dimensione", 0)) for d in refs if d["sha256"] == sha256)
+    st.session_state[f"{k}_allegati"] = [d for d in refs if d["sha256"] != sha256]
+
+def allegati_requisito(k: str) -> list:
+    """Uploader e allegati del requisito. I file caricati vengono copiati subito nell'archivio
+    su disco (audit_attachments) e l'uploader viene svuotato cambiandone la chiave: in sessione
+    restano solo i riferimenti (hash, nome, tipo, dimensione) in `<ID>_allegati`."""
+    giro = st.session_state.get(f"{k}_files_giro", 0)
+    caricati = st.file_uploader("Allega foto/documenti (jpg, png, pdf)", accept_multiple_files=True,
+                                type=["jpg","jpeg","png","pdf"], key=f"{k}_files_{giro}")
+    if caricati:
+        peso, totale = sum(f.size for f in caricati), byte_allegati()
+        if totale + peso > LIMITE_SESSIONE:
+            st.session_state[f"{k}_files_errore"] = (
+                f"Caricamento scartato: {peso / 2**20:.1f} MB porterebbero gli allegati dell'audit oltre il limite "
+                f"di {LIMITE_SESSIONE / 2**20:.0f} MB (già caricati {totale / 2**20:.1f} MB).")
+        else:
+            refs = list(st.session_state.get(f"{k}_allegati", []))
+            noti = {d["sha256"] for d in refs}
+            for f in caricati:
+                ref = salva_allegato(f, f.name, f.type)
+                if ref.sha256 not in noti:
+                    noti.add(ref.sha256)
+                    refs.append(ref._asdict())
+                    totale += ref.dimensione
+            st.session_state[f"{k}_allegati"] = refs
+            st.session_state["_allegati_byte"] = totale
+        st.session_state[f"{k}_files_giro"] = giro + 1
+        # "fragment" è ammesso solo durante un rerun del fragment, non nel run completo
+        st.rerun(scope="app" if st.session_state.get("_app_run") else "fragment")
+    errore = st.session_state.pop(f"{k}_files_errore", None)
+    if errore:
+        st.error(errore)
+    files = [da_dict(d) for d in st.session_state.get(f"{k}_allegati", [])]
+    for f in files:
+        c1, c2 = st.columns([10, 1])
+        c1.caption(f"📎 {f.nome} — {f.dimensione / 1024:.0f} KB")
+        c2.button("🗑", key=f"{k}_files_del_{f.sha256[:16]}", help="Rimuovi allegato",
+                  on_click=_rimuovi_allegato, args=(k, f.sha256))
+    return files
+
+def render_requisito(req: Requisito):
+    idx, requisito, riferimento = req.n, req.requisito, req.riferimento
+    k = req.id  # prefisso chiavi stabile: non dipende dalla posizione nel catalogo
     with st.container(border=True):
-        applicabile = st.toggle("Applicabile?", value=False, key=f"{sezione}_{idx}_appl")
+        applicabile = st.toggle("Applicabile?", value=False, key=f"{k}_appl")
 
         ctitle, cbadge = st.columns([10,1])
         with ctitle:
@@ -231,7 +349,7 @@ def render_requisito(idx, sezione, requisito, riferimento):
         files = []
 
         if applicabile:
-            stato = st.radio("Stato", ["Conforme", "Non conforme"], key=f"{sezione}_{idx}_st", horizontal=True)
+            stato = st.radio("Stato", ["Conforme", "Non conforme"], key=f"{k}_st", horizontal=True)
             with cbadge:
                 if stato == "Non conforme":
                     st.markdown("<div style='text-align:right;'><span class='badge-nc'>NC</span></div>", unsafe_allow_html=True)
@@ -240,418 +358,462 @@ def render_requisito(idx, sezione, requisito, riferimento):
                 st.write("")
 
         if applicabile and stato == "Non conforme":
-            livello = st.selectbox("Classificazione NC", ["Livello 1", "Livello 2"], key=f"{sezione}_{idx}_lvl")
+            livello = st.selectbox("Classificazione NC", ["Livello 1", "Livello 2"], key=f"{k}_lvl")
             st.markdown("**Gestione Non Conformità**")
-            cause = st.text_area("Analisi delle cause", key=f"{sezione}_{idx}_cause",
+            cause = st.text_area("Analisi delle cause", key=f"{k}_cause",
                                  placeholder="Es. mancata pianificazione aggiornamenti; assenza procedura…")
             c1, c2 = st.columns(2)
             with c1:
-                trattamento = st.text_area("Trattamento / Azione correttiva", key=f"{sezione}_{idx}_tratt",
+                trattamento = st.text_area("Trattamento / Azione correttiva", key=f"{k}_tratt",
                                            placeholder="Descrivi l'azione correttiva o migliorativa da attuare")
-                periodo = st.selectbox("Periodo di gestione",
-                                       ["BREVE (≤ 1 mese)", "MEDIO (≤ 6 mesi)", "LUNGO (≤ 12 mesi)"],
-                                       key=f"{sezione}_{idx}_periodo")
+                periodo = st.selectbox("Periodo di gestione", PERIODI, key=f"{k}_periodo")
             with c2:
                 data_tratt = date_input_eu("Data prevista completamento trattamento",
-                                           key=f"{sezione}_{idx}_dtratt", value=None, allow_empty=True)
+                                           key=f"{k}_dtratt", value=None, allow_empty=True)
                 data_verifica = date_input_eu("Verifica prevista per",
-                                              key=f"{sezione}_{idx}_dver", value=None, allow_empty=True)
+                                              key=f"{k}_dver", value=None, allow_empty=True)
 
-            resp = st.selectbox("Responsabile", RESPONSABILI, key=f"{sezione}_{idx}_resp")
-            responsabile = st.text_input("Specifica altro responsabile", key=f"{sezione}_{idx}_resp_alt") if resp == "Altro" else resp
+            resp = st.selectbox("Responsabile", RESPONSABILI, key=f"{k}_resp")
+            responsabile = st.text_input("Specifica altro responsabile", key=f"{k}_resp_alt") if resp == "Altro" else resp
 
-            note = st.text_area("Note / Evidenze testuali", key=f"{sezione}_{idx}_note",
+            note = st.text_area("Note / Evidenze testuali", key=f"{k}_note",
                                 placeholder="Annota evidenze, riferimenti documentali, ubicazione file…")
-            files = st.file_uploader("Allega foto/documenti (jpg, png, pdf)", accept_multiple_files=True,
-                                     type=["jpg","jpeg","png","pdf"], key=f"{sezione}_{idx}_files")
+            files = allegati_requisito(k)
 
         elif applicabile and stato == "Conforme":
-            note = st.text_area("Note / Evidenze testuali", key=f"{sezione}_{idx}_note",
+            note = st.text_area("Note / Evidenze testuali", key=f"{k}_note",
                                 placeholder="Annota evidenze, riferimenti documentali, ubicazione file…")
-            files = st.file_uploader("Allega foto/documenti (jpg, png, pdf)", accept_multiple_files=True,
-                                     type=["jpg","jpeg","png","pdf"], key=f"{sezione}_{idx}_files")
-
-        allegati = [f.name for f in files] if files else []
-
-        # punteggi
-        score_simple = 1 if (applicabile and stato == "Conforme") else (0 if (applicabile and stato == "Non conforme") else None)
-        score_weight = (1.0 if (applicabile and stato == "Conforme") else (0.5 if livello == "Livello 1" and applicabile else (0.0 if applicabile and stato == "Non conforme" else None)))
-
-        return {
-            "Applicabile": "Sì" if applicabile else "No",
-            "N": idx,
-            "Sezione": sezione,
-            "Requisito": requisito,
-            "Riferimento": riferimento,
-            "Stato": stato,
-            "NC Livello": livello,
-            "Note": note,
-            "Allegati": ", ".join(allegati),
-            "Punteggio": score_simple,
-            "Punteggio ponderato": score_weight,
-            "Cause": cause,
-            "Trattamento": trattamento,
-            "Periodo": periodo,
-            "Data trattamento": fmt_date(data_tratt),
-            "Data verifica": fmt_date(data_verifica),
-            "Responsabile": responsabile,
-            "_files": files
-        }
+            files = allegati_requisito(k)
+
+        return crea_record(req, applicabile, stato, livello, note, files, cause, trattamento, periodo,
+                           data_tratt, data_verifica, responsabile)
+
+def crea_record(req: Requisito, applicabile: bool, stato: str, livello: str = "", note: str = "", files=(),
+                cause: str = "", trattamento: str = "", periodo: str = "", data_tratt: Optional[date] = None,
+                data_verifica: Optional[date] = None, responsabile: str = "") -> Record:
+    """Record di un requisito (stesso formato per schede e griglia); i punteggi si calcolano nel frame."""
+    return Record(req, applicabile, stato, livello, note, tuple(files), cause, trattamento, periodo,
+                  data_tratt, data_verifica, responsabile)
+
+# ---------- Modalità griglia ----------
+# Tutto il catalogo in un'unica tabella: legge e scrive le stesse chiavi di session_state
+# delle schede (<ID>_appl, <ID>_st, ...), quindi record, salvataggio e ripresa dell'audit
+# sono identici e si può passare da una modalità all'altra senza perdere dati.
+CHIAVI_GRIGLIA = {"Applicabile": "appl", "Stato": "st", "NC Livello": "lvl", "Note": "note", "Cause": "cause",
+                  "Trattamento": "tratt", "Periodo": "periodo", "Responsabile": "resp", "Altro responsabile": "resp_alt"}
+DATE_GRIGLIA = {"Data trattamento": "dtratt", "Data verifica": "dver"}
+
+def _data_sessione(k: str) -> Optional[date]:
+    """Valore di un date_input_eu(allow_empty=True) dalle sue chiavi, senza disegnarlo."""
+    ss = st.session_state
+    if not ss.get(f"{k}_enable"):
+        return None
+    oggi = date.today()
+    aa, mm = ss.get(f"{k}_y", oggi.year), ss.get(f"{k}_m", oggi.month)
+    return date(aa, mm, min(ss.get(f"{k}_d", oggi.day), monthrange(aa, mm)[1]))
+
+def _scrivi_data(k: str, d: Optional[date]):
+    st.session_state[f"{k}_enable"] = d is not None
+    if d is not None:
+        st.session_state.update({f"{k}_d": d.day, f"{k}_m": d.month, f"{k}_y": d.year})
+
+def valori_sessione(req: Requisito) -> dict:
+    """Campi del requisito come li mostrerebbe la scheda (default dei widget se mai compilati)."""
+    ss, k = st.session_state, req.id
+    return {
+        "Applicabile": ss.get(f"{k}_appl", False),
+        "Stato": ss.get(f"{k}_st", "Conforme"),
+        "NC Livello": ss.get(f"{k}_lvl", "Livello 1"),
+        "Note": ss.get(f"{k}_note", ""),
+        "Cause": ss.get(f"{k}_cause", ""),
+        "Trattamento": ss.get(f"{k}_tratt", ""),
+        "Periodo": ss.get(f"{k}_periodo", PERIODI[0]),
+        "Data trattamento": _data_sessione(f"{k}_dtratt"),
+        "Data verifica": _data_sessione(f"{k}_dver"),
+        "Responsabile": ss.get(f"{k}_resp", RESPONSABILI[0]),
+        "Altro responsabile": ss.get(f"{k}_resp_alt", ""),
+    }
+
+def record_da_sessione(req: Requisito) -> Record:
+    """Stesso record di render_requisito, calcolato dalle chiavi di sessione."""
+    v = valori_sessione(req)
+    if not v["Applicabile"]:
+        return crea_record(req, False, "Non applicabile")
+    files = [da_dict(d) for d in st.session_state.get(f"{req.id}_allegati", [])]
+    if v["Stato"] == "Conforme":
+        return crea_record(req, True, "Conforme", note=v["Note"], files=files)
+    responsabile = v["Altro responsabile"] if v["Responsabile"] == "Altro" else v["Responsabile"]
+    return crea_record(req, True, "Non conforme", v["NC Livello"], v["Note"], files, v["Cause"], v["Trattamento"],
+                       v["Periodo"], v["Data trattamento"], v["Data verifica"], responsabile)
+
+def _applica_griglia(ids: list):
+    # edited_rows è cumulativo rispetto alla tabella disegnata: riapplicarlo tutto è idempotente
+    for riga, campi in st.session_state["griglia"]["edited_rows"].items():
+        k = ids[int(riga)]
+        for col, v in campi.items():
+            if col in DATE_GRIGLIA:
+                _scrivi_data(f"{k}_{DATE_GRIGLIA[col]}", date.fromisoformat(v[:10]) if v else None)
+            elif col in CHIAVI_GRIGLIA:
+                st.session_state[f"{k}_{CHIAVI_GRIGLIA[col]}"] = v if v is not None else (False if col == "Applicabile" else "")
+
+def render_griglia():
+    prefissi = tuple(f"{req.id}_" for req in CATALOGO)
+    # i widget delle schede non disegnati perderebbero il valore a fine run: riassegnarlo
+    # via session_state lo stacca dal widget e lo conserva per il ritorno alle schede
+    for k, v in valori_widget(prefissi).items():
+        st.session_state[k] = v
+    reqs = list(CATALOGO)
+    df = pd.DataFrame([{"ID": req.id, "Sezione": req.sezione, "N": req.n, "Requisito": req.requisito,
+                        **valori_sessione(req), "Allegati": len(st.session_state.get(f"{req.id}_allegati", []))}
+                       for req in reqs])
+    col = st.column_config
+    st.data_editor(
+        df, key="griglia", on_change=_applica_griglia, args=([req.id for req in reqs],),
+        hide_index=True, num_rows="fixed", use_container_width=True, height=min(38 + 35 * len(df), 720),
+        disabled=["ID", "Sezione", "N", "Requisito", "Allegati"],
+        column_config={
+            "Applicabile": col.CheckboxColumn("Applicabile"),
+            "Stato": col.SelectboxColumn("Stato", options=["Conforme", "Non conforme"], required=True),
+            "NC Livello": col.SelectboxColumn("Livello NC", options=["Livello 1", "Livello 2"], required=True),
+            "Periodo": col.SelectboxColumn("Periodo", options=PERIODI, required=True),
+            "Data trattamento": col.DateColumn("Data trattamento", format="DD/MM/YYYY"),
+            "Data verifica": col.DateColumn("Data verifica", format="DD/MM/YYYY"),
+            "Responsabile": col.SelectboxColumn("Responsabile", options=RESPONSABILI, required=True),
+            "Allegati": col.NumberColumn("Allegati", help="Gli allegati si caricano dalle schede"),
+        },
+    )
+    st.caption("Livello, cause, trattamento, periodo, date e responsabile contano solo per i requisiti Non conformi.")
+    cron.tappa("schede")
+    recs = []
+    for sezione, requisiti in CATALOGO.sezioni.items():
+        st.session_state["_records"][sezione] = [record_da_sessione(req) for req in requisiti]
+        recs.extend(st.session_state["_records"][sezione])
+    autosalva(valori_widget(prefissi), recs, avvia=any(r.applicabile for r in recs))
+    cron.tappa("salvataggio")
 
 # ---------- Raccolta risultati ----------
-records_all, records_visible = [], []
-for sezione, requisiti in CATALOGO.items():
+# Ogni sezione è un fragment: un click su una scheda riesegue solo la sua sezione.
+# Il resto della pagina (statistiche, riepilogo, export, stato del PDF) si aggiorna
+# con un rerun completo solo quando cambia un record della sezione; le statistiche
+# si ricalcolano solo se cambiano i campi che incidono sui punteggi.
+def firma_punteggi(records):
+    # campi che incidono sui punteggi e sui grafici (NC per periodo)
+    return tuple((r.applicabile, r.stato, r.livello, r.periodo) for r in records)
+
+@st.fragment
+def render_sezione(sezione, requisiti, visibili: Optional[frozenset] = None):
+    # nel run completo le fasi si sommano a quelle della pagina; un rerun del solo fragment ha la sua misura
+    c = cron if st.session_state["_app_run"] else Cronometro("fragment")
     st.header(sezione)
-    for i, (req, rif) in enumerate(requisiti, start=1):
-        rec = render_requisito(i, sezione, req, rif)
-        records_all.append(rec)
-
-        vis_ok = True
-        if st.session_state.get("filtro_nc") and rec["Stato"] != "Non conforme":
-            vis_ok = False
-        if st.session_state.get("filtro_testo"):
-            text_blob = f"{rec['Requisito']} {rec['Note']} {rec['Sezione']}".lower()
-            if st.session_state["filtro_testo"].lower() not in text_blob:
-                vis_ok = False
-        if vis_ok:
-            records_visible.append(rec)
+    nascosti = 0 if visibili is None else sum(req.id not in visibili for req in requisiti)
+    if nascosti:
+        st.caption(f"{nascosti} requisiti nascosti dai filtri")
+    # schede nascoste: niente widget, il record viene dalla sessione
+    recs = [render_requisito(req) if visibili is None or req.id in visibili else record_da_sessione(req)
+            for req in requisiti]
+    prev = st.session_state["_records"].get(sezione)
+    st.session_state["_records"][sezione] = recs
+    c.tappa("schede")
+    autosalva(valori_widget(tuple(f"{req.id}_" for req in requisiti)), recs,
+              avvia=any(r.applicabile for r in recs))
+    c.tappa("salvataggio")
+    if c is not cron:
+        st.session_state["_tempi_fragment"] = c.emetti(sezione=sezione, audit=st.session_state.get("audit_id"))
+    # rerun limitato al fragment: se cambia un record (anche note, cause, date) riepilogo e stato del PDF
+    # vanno ricalcolati; restano nel fragment le interazioni che non toccano i record
+    if not st.session_state["_app_run"] and prev is not None and [r.firma() for r in prev] != [r.firma() for r in recs]:
+        st.rerun(scope="app")
+
+st.session_state.setdefault("_records", {})
+
+# ---------- Filtri di vista ----------
+# valutati prima di disegnare: le schede escluse non vengono create affatto
+with box_filtri:
+    if "filtro_sezioni" in st.session_state:  # cambio catalogo: via le sezioni che non esistono più
+        st.session_state["filtro_sezioni"] = [x for x in st.session_state["filtro_sezioni"] if x in CATALOGO.sezioni]
+    filtro_sezioni = st.multiselect("Sezioni", list(CATALOGO.sezioni), key="filtro_sezioni")
+    filtro_livelli = st.multiselect("Livello NC", ["Livello 1", "Livello 2"], key="filtro_livelli")
+    resp_noti = {r.responsabile for recs in st.session_state["_records"].values() for r in recs if r.responsabile}
+    filtro_resp = st.multiselect("Responsabile", sorted(resp_noti | set(RESPONSABILI[:-1]) |
+                                                        set(st.session_state.get("filtro_resp", []))), key="filtro_resp")
+    campo_data = st.radio("Scadenza", CAMPI_DATA, format_func=lambda c: c.split()[-1].capitalize(), horizontal=True,
+                          key="filtro_campo_data")
+    filtro_date = st.date_input("Scadenza compresa tra", value=(), format="DD/MM/YYYY", key="filtro_date")
+dal, al = (tuple(filtro_date) + (None, None))[:2] if isinstance(filtro_date, (tuple, list)) else (filtro_date, None)
+filtri = Filtri(filtro_nc, None, tuple(filtro_sezioni), tuple(filtro_livelli), tuple(filtro_resp), dal, al, campo_data)
+
+indice = st.session_state.setdefault("_indice", IndiceTesto())
+visibili = None  # None = nessun filtro, tutte le schede
+rec_sessione = {}
+if filtri.attivi or filtro_testo:
+    # i widget hanno già il valore dell'ultima interazione: i record si ricostruiscono dalla sessione
+    rec_sessione = {req.id: record_da_sessione(req) for req in CATALOGO}
+    if filtro_testo:
+        for rec in rec_sessione.values():
+            indice.aggiorna(rec.id, rec)
+        filtri = filtri._replace(ids={doc for doc, _, _ in indice.cerca(filtro_testo, limit=None)})
+    df_filtri = frame_record(list(rec_sessione.values()))
+    visibili = frozenset(df_filtri["ID"][maschera(df_filtri, filtri)])
+cron.tappa("filtri")
+
+if modalita == "Griglia":
+    render_griglia()
+else:
+    # sezioni con almeno una scheda visibile; nei cataloghi grandi se ne apre una sola
+    sezioni_vis = [sez for sez, reqs in CATALOGO.sezioni.items()
+                   if visibili is None or any(req.id in visibili for req in reqs)]
+    opzioni = ([TUTTE_SEZIONI] if len(CATALOGO) <= SCHEDE_MAX else []) + sezioni_vis
+    if st.session_state.get("sezione_aperta") not in opzioni:  # cambio catalogo o filtri
+        st.session_state.pop("sezione_aperta", None)
+    aperta = st.selectbox("Sezione", opzioni, key="sezione_aperta") if opzioni else None
+    aperte = set(sezioni_vis) if aperta == TUTTE_SEZIONI else {aperta}
+    if visibili is not None or len(aperte) < len(CATALOGO.sezioni):
+        # i widget non disegnati perderebbero il valore a fine run: come per la griglia, lo si
+        # riassegna via session_state così la scheda lo ritrova quando torna visibile
+        nascosti = tuple(f"{req.id}_" for sez, reqs in CATALOGO.sezioni.items() for req in reqs
+                         if sez not in aperte or (visibili is not None and req.id not in visibili))
+        for k, v in valori_widget(nascosti).items():
+            st.session_state[k] = v
+    st.session_state["_app_run"] = True
+    try:
+        for sezione, requisiti in CATALOGO.sezioni.items():
+            if sezione not in aperte:
+                st.session_state["_records"][sezione] = [rec_sessione.get(req.id) or record_da_sessione(req)
+                                                         for req in requisiti]
+                continue
+            render_sezione(sezione, requisiti, visibili)
+    finally:
+        st.session_state["_app_run"] = False
+
+# testata: si apre un audit anche solo indicando il fornitore
+testata = {k: st.session_state[k] for k in CHIAVI_TESTATA if k in st.session_state}
+testata_cambiata = any(st.session_state.get("_salvato", {}).get(k) != v for k, v in testata.items())
+autosalva(testata, avvia=bool(fornitore))
+if testata_cambiata and st.session_state.get("audit_id"):
+    audit_store().aggiorna_testata(st.session_state["audit_id"], fornitore, data_audit, auditor)
+cron.tappa("salvataggio")
+
+records_all = [rec for sezione in CATALOGO.sezioni for rec in st.session_state["_records"].get(sezione, [])]
+
+# indice testuale della sessione: ogni record viene reindicizzato solo se il testo cambia
+for rec in records_all:
+    indice.aggiorna(rec.id, rec)
+cron.tappa("indice")
 
 st.divider()
 
 # ---------- Statistiche ----------
 st.subheader("Valutazione complessiva")
-df_all = pd.DataFrame(records_all)
-df_vis = pd.DataFrame(records_visible)
-
-def percentuali(df_section, col="Punteggio"):
-    if df_section.empty or col not in df_section: return (None, 0, 0, 0)
-    validi = df_section[col].dropna()
-    if len(validi) == 0: return (None, 0, 0, 0)
-    if col == "Punteggio":
-        conformi = (validi == 1).sum()
-        nonconf = (validi == 0).sum()
-        perc = round((conformi / len(validi)) * 100, 1)
-        return perc, conformi, nonconf, len(validi)
-    else:
-        media = round(validi.mean() * 100, 1)
-        conformi = (df_section["Stato"] == "Conforme").sum()
-        nonconf = (df_section["Stato"] == "Non conforme").sum()
-        return media, conformi, nonconf, len(validi)
-
-def stats_per_sezione(df, col="Punteggio"):
-    if df.empty: return pd.DataFrame()
-    out = []
-    for sezione, dfg in df.groupby("Sezione"):
-        perc, conf, nc, tot = percentuali(dfg, col=col)
-        out.append({
-            "Sezione": sezione,
-            ("% Conformità" if col=="Punteggio" else "% Conformità ponderata"): perc if perc is not None else "—",
-            "Conformi": conf, "Non conformi": nc, "Requisiti valutati": tot
+# un solo frame tipizzato per run: il riepilogo ne è una maschera, il PDF lo riceve senza copie
+df_all = frame_record(records_all)
+df_vis = df_all if visibili is None or df_all.empty else df_all[df_all["ID"].isin(visibili)]
+cron.tappa("dataframe")
+
+def statistiche(df_all):
+    """Statistiche e grafici memorizzati in sessione: si ricalcolano solo se cambiano i punteggi.
+    Le spec dei grafici restano le stesse fra un rerun e l'altro, così il browser non li ridisegna."""
+    firma = firma_punteggi(records_all)
+    memo = st.session_state.get("_stats_memo")
+    if memo is None or memo[0] != firma:
+        agg = aggrega(df_all)
+        tot = totali(agg)
+        memo = (firma, {
+            "sez_s": tabella_sezioni(agg),
+            "sez_w": tabella_sezioni(agg, ponderata=True),
+            "tot_s": percentuali(tot),
+            "tot_w": percentuali(tot, ponderata=True),
+            "graf_sez": spec_sezioni(dati_sezioni(agg)),
+            "graf_nc": spec_nc(distribuzione_nc(df_all)) if tot["NC (stato)"] else None,
         })
-    sdf = pd.DataFrame(out)
-    metric_col = "% Conformità" if col=="Punteggio" else "% Conformità ponderata"
-    sdf["_ord"] = pd.to_numeric(sdf[metric_col], errors="coerce")
-    sdf = sdf.sort_values("_ord", ascending=False, na_position="last").drop(columns=["_ord"])
-    return sdf
+        st.session_state["_stats_memo"] = memo
+    return memo[1]
 
 if not df_all.empty:
+    stats = statistiche(df_all)
     colL, colR = st.columns([2,1])
     with colL:
         st.markdown("**Per sezione (semplice)**")
-        st.dataframe(stats_per_sezione(df_all, col="Punteggio"), use_container_width=True)
+        st.dataframe(stats["sez_s"], use_container_width=True)
         st.markdown("**Per sezione (ponderata L1=0.5 / L2=0)**")
-        st.dataframe(stats_per_sezione(df_all, col="Punteggio ponderato"), use_container_width=True)
+        st.dataframe(stats["sez_w"], use_container_width=True)
     with colR:
-        perc_tot_s, conf_tot_s, nc_tot_s, tot_tot_s = percentuali(df_all, col="Punteggio")
+        perc_tot_s, conf_tot_s, nc_tot_s, tot_tot_s = stats["tot_s"]
         st.metric("Conformità totale (semplice)", f"{perc_tot_s if perc_tot_s is not None else '—'}%")
-        perc_tot_w, _, _, _ = percentuali(df_all, col="Punteggio ponderato")
+        perc_tot_w, _, _, _ = stats["tot_w"]
         st.metric("Conformità totale (ponderata)", f"{perc_tot_w if perc_tot_w is not None else '—'}%")
         st.write(f"**Conformi:** {conf_tot_s}  \n**Non conformi:** {nc_tot_s}  \n**Requisiti valutati:** {tot_tot_s}")
+    with st.expander("📊 Grafici", expanded=True):
+        g1, g2 = st.columns([2, 1])
+        with g1:
+            st.markdown("**Conformità per sezione**")
+            if stats["graf_sez"]["data"]["values"]:
+                st.vega_lite_chart(stats["graf_sez"], use_container_width=True)
+            else:
+                st.caption("Nessun requisito valutato.")
+        with g2:
+            st.markdown("**Non conformità per periodo e livello**")
+            if stats["graf_nc"] is not None:
+                st.vega_lite_chart(stats["graf_nc"], use_container_width=True)
+            else:
+                st.caption("Nessuna non conformità.")
 else:
     st.info("Compila almeno un requisito per vedere le statistiche.")
+cron.tappa("statistiche")
 
 st.divider()
 
 # ---------- Riepilogo & Export (sul visibile) ----------
 st.subheader("Riepilogo requisiti (filtri applicati)")
+@st.cache_data(max_entries=16, show_spinner=False)
+def export_cached(formato: str, digest: str, _df: pd.DataFrame, _testata: Optional[dict] = None) -> bytes:
+    # _df e _testata non vengono hashati: la chiave è il digest dei record visibili + filtri + testata
+    c = Cronometro("export")
+    with c.fase(formato):
+        if formato == "parquet":
+            data = export_parquet(_df, _testata)
+        elif formato == "csv":
+            data = export_csv(formato_export(_df))
+        else:
+            data = export_excel(formato_export(_df))
+    c.emetti(formato=formato, righe=len(_df), kb=round(len(data) / 1024))
+    return data
+
 if not df_vis.empty:
-    st.dataframe(df_vis.drop(columns=["_files"]), use_container_width=True)
+    # `_files` (riferimenti agli allegati) non si serializza in Arrow: a video solo le colonne del record
+    col = st.column_config
+    st.dataframe(df_vis[COLONNE_RECORD], use_container_width=True, column_config={
+        "Data trattamento": col.DateColumn(format="DD/MM/YYYY"), "Data verifica": col.DateColumn(format="DD/MM/YYYY")})
     data_str = filename_date(data_audit)
+    meta_export = {"fornitore": fornitore, "data_audit": data_audit.isoformat() if data_audit else None, "auditor": auditor}
+    # stesso dict che i rerun dei soli fragment aggiornano (note, cause, date non forzano il run completo)
+    records_sessione = st.session_state["_records"]
+
+    def export_corrente(formato: str) -> bytes:
+        # gira al click, fuori dal run dello script: frame e digest dai record più recenti, non da df_vis
+        df = frame_record([rec for sezione in CATALOGO.sezioni for rec in records_sessione.get(sezione, [])])
+        if visibili is not None and not df.empty:
+            df = df[df["ID"].isin(visibili)]
+        digest = digest_df(df, filtri._replace(ids=None), filtro_testo, sorted(meta_export.items()))
+        return export_cached(formato, digest, df, meta_export if formato == "parquet" else None)
+
+    # export costruiti solo al click sul download (data callable), poi memorizzati per digest
     st.download_button(
         "⬇️ Scarica CSV",
-        data=df_vis.drop(columns=["_files"]).to_csv(index=False).encode("utf-8"),
+        data=lambda: export_corrente("csv"),
         file_name=f"audit_{(fornitore or 'fornitore')}_{data_str}.csv",
         mime="text/csv"
     )
-    excel_buffer = BytesIO()
-    with pd.ExcelWriter(excel_buffer, engine="xlsxwriter") as writer:
-        df_vis.drop(columns=["_files"]).to_excel(writer, index=False, sheet_name="Audit")
     st.download_button(
         "⬇️ Scarica Excel",
-        data=excel_buffer.getvalue(),
+        data=lambda: export_corrente("xlsx"),
         file_name=f"audit_{(fornitore or 'fornitore')}_{data_str}.xlsx",
         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
     )
+    st.download_button(
+        "⬇️ Scarica Parquet",
+        data=lambda: export_corrente("parquet"),
+        file_name=f"audit_{(fornitore or 'fornitore')}_{data_str}.parquet",
+        mime="application/vnd.apache.parquet",
+        help="Colonne tipizzate (booleani, categorie, date) per analisi con pandas, DuckDB, Power BI…"
+    )
 else:
     st.info("Nessun dato da esportare (verifica i filtri).")
+cron.tappa("riepilogo")
 
 # ---------- PDF ----------
 st.subheader("Report PDF")
-st.caption("Sezioni in verticale; riepilogo di tutte le Non Conformità in orizzontale; immagini ridimensionate.")
-
-def build_pdf(df_all: pd.DataFrame, logo_file) -> bytes:
-    buf = BytesIO()
-
-    # Margini
-    lm, rm, tm, bm = 2*cm, 2*cm, 1.5*cm, 1.5*cm
-    doc = BaseDocTemplate(buf, pagesize=A4,
-                          leftMargin=lm, rightMargin=rm, topMargin=tm, bottomMargin=bm)
-
-    # Frame Portrait
-    frame_p = Frame(lm, bm, doc.width, doc.height, id='portrait_frame')
-    # Frame LANDSCAPE con margini ridotti a 0.2 cm (≈ 2 mm)
-    W, H = landscape(A4)
-    lm_l = rm_l = tm_l = bm_l = 0.2*cm  # margini ridotti
-    frame_l = Frame(lm_l, bm_l, W - lm_l - rm_l, H - tm_l - bm_l, id='landscape_frame')
-
-    pt_portrait  = PageTemplate(id='Portrait',  frames=[frame_p], pagesize=A4)
-    pt_landscape = PageTemplate(id='Landscape', frames=[frame_l], pagesize=landscape(A4))
-    doc.addPageTemplates([pt_portrait, pt_landscape])
-
-    story = []
-
-    styles = getSampleStyleSheet()
-    H1 = ParagraphStyle("H1", parent=styles["Heading1"], fontSize=18, spaceAfter=8, leading=22, textColor=colors.HexColor("#0f172a"))
-    H2 = ParagraphStyle("H2", parent=styles["Heading2"], fontSize=14, spaceBefore=8, spaceAfter=4, textColor=colors.HexColor("#111827"))
-    P  = ParagraphStyle("P",  parent=styles["BodyText"], fontSize=10, leading=13)
-    Small = ParagraphStyle("Small", parent=styles["BodyText"], fontSize=9, textColor=colors.grey)
-
-    # helper Paragraph con wrap
-    def par(txt, style):
-        if txt is None: txt = ""
-        txt = str(txt).replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
-        return Paragraph(txt, style)
-    
-    Cell      = ParagraphStyle("Cell",      parent=P, fontSize=8.55, leading=11,  wordWrap='LTR')
-    CellSmall = ParagraphStyle("CellSmall", parent=P, fontSize=8.2, leading=10.5, wordWrap='LTR')
-    HeaderCell= ParagraphStyle("HeaderCell",parent=styles["Heading4"], fontSize=8.0, leading=11)
-
-
-    # Logo
-    if logo_file is not None:
-        try:
-            logo_file.seek(0)
-            story.append(RLImage(logo_file, width=3*cm))
-            story.append(Spacer(1, 6))
-        except Exception:
-            pass
-
-    # Intestazione
-    story.append(Paragraph("Report Audit Fornitore — D.Lgs. 81/08 & SMEI", H1))
-    story.append(Paragraph(
-        f"Fornitore: <b>{fornitore or '—'}</b> &nbsp;&nbsp; Data: <b>{fmt_date(data_audit)}</b> &nbsp;&nbsp; Auditor: <b>{auditor or '—'}</b>",
-        P
-    ))
-    story.append(Spacer(1, 8))
-
-    # Sintesi
-    def percentuali_local(df_section, col="Punteggio"):
-        if df_section.empty or col not in df_section: return (None, 0, 0, 0)
-        validi = df_section[col].dropna()
-        if len(validi) == 0: return (None, 0, 0, 0)
-        if col == "Punteggio":
-            conformi = (validi == 1).sum()
-            nonconf = (validi == 0).sum()
-            perc = round((conformi / len(validi)) * 100, 1)
-            return perc, conformi, nonconf, len(validi)
-        else:
-            media = round(validi.mean() * 100, 1)
-            conformi = (df_section["Stato"] == "Conforme").sum()
-            nonconf = (df_section["Stato"] == "Non conforme").sum()
-            return media, conformi, nonconf, len(validi)
-
-    perc_tot_s, conf_tot_s, nc_tot_s, tot_tot_s = percentuali_local(df_all, col="Punteggio")
-    perc_tot_w, _, _, _ = percentuali_local(df_all, col="Punteggio ponderato")
-    sintesi_data = [
-        ["Conformità totale (semplice)", f"{perc_tot_s if perc_tot_s is not None else '—'}%"],
-        ["Conformità totale (ponderata)", f"{perc_tot_w if perc_tot_w is not None else '—'}%"],
-        ["Requisiti conformi", str(conf_tot_s)],
-        ["Requisiti non conformi", str(nc_tot_s)],
-        ["Requisiti valutati", str(tot_tot_s)],
-    ]
-    t = Table(sintesi_data, colWidths=[7*cm, 7*cm])
-    t.setStyle(TableStyle([
-        ("BACKGROUND", (0,0), (-1,0), colors.HexColor("#f3f4f6")),
-        ("BOX", (0,0), (-1,-1), 0.5, colors.grey),
-        ("INNERGRID", (0,0), (-1,-1), 0.25, colors.grey),
-        ("FONTNAME", (0,0), (-1,0), "Helvetica-Bold")
-    ]))
-    story.append(t)
-    story.append(Spacer(1, 12))
-
-    # Tabelle per sezione (portrait)
-    for sezione, dfg in df_all.groupby("Sezione"):
-        dfg = dfg.sort_values("N")
-        story.append(Paragraph(sezione, H2))
-
-        rows = [[par("#", HeaderCell), par("Requisito", HeaderCell), par("Stato", HeaderCell),
-                 par("Riferimento", HeaderCell), par("Note", HeaderCell)]]
-        for _, r in dfg.iterrows():
-            rows.append([
-                par(str(r.get("N","")), Cell),
-                par(r["Requisito"], Cell),
-                par(r["Stato"], Cell),
-                par(r["Riferimento"], CellSmall),
-                par(r.get("Note",""), CellSmall)
-            ])
-
-        tbl = Table(rows, colWidths=[1.0*cm, 6.2*cm, 2.4*cm, 4.1*cm, 3.3*cm], repeatRows=1, splitByRow=1)
-        tbl_style = TableStyle([
-            ("FONTNAME", (0,0), (-1,0), "Helvetica-Bold"),
-            ("BACKGROUND", (0,0), (-1,0), colors.HexColor("#e5e7eb")),
-            ("BOX", (0,0), (-1,-1), 0.5, colors.grey),
-            ("INNERGRID", (0,0), (-1,-1), 0.25, colors.grey),
-            ("VALIGN", (0,0), (-1,-1), "TOP"),
-            ("LEFTPADDING", (0,0), (-1,-1), 4),
-            ("RIGHTPADDING", (0,0), (-1,-1), 4),
-            ("TOPPADDING", (0,0), (-1,-1), 3),
-            ("BOTTOMPADDING", (0,0), (-1,-1), 3),
-        ])
-        # righe NC in rosso
-        for ridx in range(1, len(rows)):
-            if dfg.iloc[ridx-1]["Stato"] == "Non conforme":
-                tbl_style.add("TEXTCOLOR", (0, ridx), (-1, ridx), colors.HexColor("#b91c1c"))
-        tbl.setStyle(tbl_style)
-        story.append(tbl)
-        story.append(Spacer(1, 10))
-
-    # ---- Appendice NC in Landscape (tutte insieme) ----
-    df_nc_all = df_all[df_all["Stato"] == "Non conforme"].copy()
-    if not df_nc_all.empty:
-        story.append(NextPageTemplate('Landscape'))
-        story.append(PageBreak())
-
-        story.append(Paragraph("Non Conformità — Riepilogo complessivo", H1))
-        story.append(Paragraph("Elenco sintetico di tutte le NC rilevate, con campi principali.", Small))
-        story.append(Spacer(1, 6))
-
-        df_nc_all = df_nc_all.sort_values(["Sezione", "N"], kind="stable")
-        nc_rows = [[
-            par("#", HeaderCell), par("Sezione", HeaderCell), par("Requisito", HeaderCell),
-            par("Livello", HeaderCell), par("Cause", HeaderCell), par("Trattamento", HeaderCell),
-            par("Periodo", HeaderCell), par("Data tratt.", HeaderCell), par("Verifica", HeaderCell),
-            par("Responsabile", HeaderCell)
-        ]]
-        for _, r in df_nc_all.iterrows():
-            nc_rows.append([
-                par(str(r.get("N","")), Cell),
-                par(r.get("Sezione",""), CellSmall),
-                par(r.get("Requisito",""), Cell),
-                par(r.get("NC Livello",""), Cell),
-                par(r.get("Cause",""), CellSmall),
-                par(r.get("Trattamento",""), CellSmall),
-                par(r.get("Periodo",""), Cell),
-                par(r.get("Data trattamento",""), Cell),
-                par(r.get("Data verifica",""), Cell),
-                par(r.get("Responsabile",""), CellSmall),
-            ])
-
-        nc_tbl = Table(
-            nc_rows,
-            colWidths=[
-                0.9*cm,  # #
-                3.2*cm,  # Sezione
-                8.7*cm,  # Requisito
-                1.4*cm,  # Livello
-                4.3*cm,  # Cause
-                4.0*cm,  # Trattamento
-                1.4*cm,  # Periodo
-                1.7*cm,  # Data tratt.
-                1.7*cm,  # Verifica
-                2.0*cm   # Responsabile
-            ],
-            repeatRows=1, splitByRow=1
-        )
-        
-        nc_tbl.setStyle(TableStyle([
-            ("FONTNAME", (0,0), (-1,0), "Helvetica-Bold"),
-            ("BACKGROUND", (0,0), (-1,0), colors.HexColor("#fee2e2")),
-            ("BOX", (0,0), (-1,-1), 0.5, colors.grey),
-            ("INNERGRID", (0,0), (-1,-1), 0.25, colors.grey),
-            ("VALIGN", (0,0), (-1,-1), "TOP"),
-            ("LEFTPADDING",(0,0),(-1,-1),2),
-            ("RIGHTPADDING",(0,0),(-1,-1),2),
-            ("TOPPADDING",(0,0),(-1,-1),2),
-            ("BOTTOMPADDING",(0,0),(-1,-1),2),
-            ("TEXTCOLOR", (0,1), (-1,-1), colors.HexColor("#7f1d1d")),
-        ]))
-        story.append(nc_tbl)
-        story.append(Spacer(1, 12))
-
-        # torna al portrait per le sezioni successive (firme/foto)
-        story.append(NextPageTemplate('Portrait'))
-        story.append(PageBreak())
-
-    # Firme
-    story.append(Paragraph("Firme", H2))
-    firm_tbl = Table([
-        ["Auditor", "Rappresentante Fornitore"],
-        ["\n\n__________________________", "\n\n__________________________"]
-    ], colWidths=[8*cm, 8*cm])
-    firm_tbl.setStyle(TableStyle([("ALIGN", (0,0), (-1,-1), "CENTER"), ("FONTNAME", (0,0), (-1,0), "Helvetica-Bold")]))
-    story.append(firm_tbl)
-    story.append(Spacer(1, 8))
-
-    # Appendice fotografica (ridimensionamento sicuro)
-    imgs = []
-    for _, r in df_all.iterrows():
-        files = r.get("_files", None)
-        if files:
-            for f in files:
-                try:
-                    if f.type and f.type.startswith("image/"):
-                        imgs.append(f)
-                except Exception:
-                    pass
-
-    if imgs:
-        story.append(PageBreak())
-        story.append(Paragraph("Appendice fotografica", H1))
-        story.append(Paragraph("Selezione immagini caricate a supporto dell’audit.", Small))
-        story.append(Spacer(1, 6))
-
-        max_w = doc.width
-        max_h = doc.height * 0.65
-        for f in imgs:
-            try:
-                f.seek(0)
-                ir = ImageReader(f)
-                iw, ih = ir.getSize()
-                scale = min(max_w / iw, max_h / ih)
-                w, h = iw * scale, ih * scale
-                story.append(RLImage(f, width=w, height=h))
-                story.append(Spacer(1, 6))
-                story.append(Paragraph(f.name, Small))
-                story.append(Spacer(1, 12))
-            except Exception:
-                continue
-
-    doc.build(story)
-    pdf_bytes = buf.getvalue()
-    buf.close()
-    return pdf_bytes
+st.caption("Sezioni in verticale; riepilogo di tutte le Non Conformità in orizzontale; immagini ridimensionate; "
+           "allegati PDF accodati in appendice. La generazione prosegue in background: si può continuare a compilare.")
+
+@st.cache_resource
+def report_cache():
+    # condivisa fra le sessioni: la chiave è l'impronta completa del contenuto
+    from audit_report import nuova_cache_report
+
+    return nuova_cache_report()
+
+@st.cache_resource
+def coda_pdf():
+    # un pool di generazione per server: il rerun non aspetta il PDF e richieste uguali si accodano allo stesso lavoro
+    from audit_jobs import CodaPDF
+
+    return CodaPDF(cache=report_cache())
+
+@st.fragment(run_every=1.0)
+def avanzamento_pdf(id_lavoro: str):
+    lav = coda_pdf().lavoro(id_lavoro)
+    if lav is None or not lav.in_corso:
+        st.rerun()  # il run completo mostra il risultato (e smette di interrogare)
+    st.progress(lav.progresso, text=f"Generazione PDF — {lav.fase} ({lav.progresso:.0%})")
+    if st.button("✖ Annulla", key="btn_pdf_annulla"):
+        # la sessione smette di aspettarlo; il lavoro si ferma se nessun'altra lo aspetta
+        coda_pdf().annulla(id_lavoro)
+        st.session_state.pop("_pdf_job", None)
+        st.rerun()
 
 # ---- Azione: genera/scarica il PDF ----
 if not df_all.empty:
-    if st.button("🧾 Genera Report PDF", key="btn_pdf"):
-        pdf_data = build_pdf(df_all.copy(), logo_up)
-        st.download_button(
-            "⬇️ Scarica Report PDF",
-            data=pdf_data,
-            file_name=f"Audit_{(fornitore or 'fornitore')}_{filename_date(data_audit)}.pdf",
-            mime="application/pdf",
-            use_container_width=True,
-            key="dl_pdf"
-        )
+    lavoro_pdf = coda_pdf().lavoro(st.session_state.get("_pdf_job"))
+    pdf_args = dict(fornitore=fornitore, data_audit=data_audit, auditor=auditor,
+                    dpi_foto=dpi_foto, qualita_foto=qualita_foto)
+
+    def stato_pdf() -> str:
+        # per capire se il PDF pronto corrisponde ancora ai dati a video (senza rileggere il logo)
+        return digest_df(df_all, sorted(pdf_args.items()), getattr(logo_up, "file_id", None))
+
+    if st.button("🧾 Genera Report PDF", key="btn_pdf", disabled=lavoro_pdf is not None and lavoro_pdf.in_corso):
+        # ReportLab si carica solo alla prima richiesta di un PDF, non all'avvio dell'app
+        from audit_report import build_pdf, fingerprint_report
+
+        fp = fingerprint_report(df_all, logo_up, **pdf_args)
+        # df_all non viene più modificato (ogni run ne costruisce uno nuovo); il logo della sessione sì: copia
+        logo = BytesIO(logo_up.getvalue()) if logo_up is not None else None
+        lavoro_pdf = coda_pdf().invia(fp, build_pdf, df_all, logo, **pdf_args)
+        st.session_state["_pdf_job"] = lavoro_pdf.id
+        st.session_state["_pdf_digest"] = stato_pdf()
+        st.rerun()  # ridisegna il pulsante disabilitato finché il lavoro è in corso
+    # il lavoro concluso tiene solo stato e chiave: il report si rilegge dalla cache condivisa
+    report = coda_pdf().report(lavoro_pdf) if lavoro_pdf is not None else None
+    if lavoro_pdf is not None:
+        if lavoro_pdf.in_corso:
+            avanzamento_pdf(lavoro_pdf.id)
+        elif lavoro_pdf.stato == "completato" and report is None:
+            st.info("Il PDF generato non è più disponibile (uscito dalla cache): rigeneralo.")
+        elif lavoro_pdf.stato == "completato":
+            st.session_state["_tempi_pdf"] = report.tempi
+            if stato_pdf() != st.session_state.get("_pdf_digest"):
+                st.warning("I dati sono cambiati dopo la generazione: il PDF non li comprende, rigeneralo.")
+            # il PDF resta sul file temporaneo del report e viene letto solo al click
+            st.download_button(
+                "⬇️ Scarica Report PDF",
+                data=report.leggi,
+                file_name=f"Audit_{(fornitore or 'fornitore')}_{filename_date(data_audit)}.pdf",
+                mime="application/pdf",
+                use_container_width=True,
+                key="dl_pdf"
+            )
+        elif lavoro_pdf.stato == "errore":
+            st.error(f"Generazione del PDF non riuscita: {lavoro_pdf.errore}")
+        else:
+            st.info("Generazione del PDF annullata.")
 else:
     st.info("Compila almeno un requisito per generare il PDF.")
+cron.tappa("pdf")
+
+# ---------- Diagnostica ----------
+tempi_run = cron.emetti(audit=st.session_state.get("audit_id"), requisiti=len(records_all))
+if diagnostica:
+    def tabella_tempi(t: dict) -> pd.DataFrame:
+        return pd.DataFrame({"Fase": list(t["fasi"]), "ms": list(t["fasi"].values())})
+
+    with pannello_diagnostica.container():
+        st.caption(f"Ultimo run completo: **{tempi_run['totale_ms']:.0f} ms** ({len(records_all)} requisiti)")
+        st.dataframe(tabella_tempi(tempi_run), hide_index=True, use_container_width=True)
+        if "_tempi_fragment" in st.session_state:
+            t = st.session_state["_tempi_fragment"]
+            st.caption(f"Ultimo rerun di sezione ({t['sezione']}): {t['totale_ms']:.0f} ms")
+        if "_tempi_pdf" in st.session_state:
+            t = st.session_state["_tempi_pdf"]
+            st.caption(f"Ultima generazione PDF: {t['totale_ms']:.0f} ms, {t.get('pagine_report', '?')} pagine, "
+                       f"{t.get('riusati', 0)}/{t.get('frammenti', '?')} frammenti dalla cache")
+            st.dataframe(tabella_tempi(t), hide_index=True, use_container_width=True)
@@ -0,0 +1,67 @@
+# pages/1_Portafoglio.py
+import streamlit as st
+import pandas as pd
+import threading
+from datetime import date
+
+from audit_store import AuditStore
+from audit_portfolio import carica_portafoglio, filtra, per_fornitore, per_sezione, nc_per_livello, andamento
+
+st.set_page_config(page_title="Portafoglio audit", page_icon="📊", layout="wide")
+st.title("Portafoglio audit fornitori")
+
+@st.cache_resource
+def audit_store():
+    return AuditStore()
+
+@st.cache_resource
+def portafoglio_condiviso() -> dict:
+    # unico per processo, condiviso in sola lettura fra le sessioni
+    return {"df": None, "lock": threading.Lock()}
+
+def portafoglio() -> pd.DataFrame:
+    # a ogni rerun rilegge solo gli audit salvati o eliminati dall'ultima lettura
+    stato = portafoglio_condiviso()
+    with stato["lock"]:
+        stato["df"] = carica_portafoglio(audit_store(), precedente=stato["df"])
+        return stato["df"]
+
+store = audit_store()
+n_audit, _ = store.versione_dati()
+if not n_audit:
+    st.info("Nessun audit archiviato: gli audit compilati nella checklist vengono salvati automaticamente.")
+    st.stop()
+
+df = portafoglio()
+
+with st.sidebar:
+    st.header("Filtri portafoglio")
+    d_min, d_max = df["Data audit"].min(), df["Data audit"].max()
+    periodo = st.date_input("Periodo", value=(d_min.date(), d_max.date()) if pd.notna(d_min) else (date.today(), date.today()),
+                            format="DD/MM/YYYY")
+    fornitori = st.multiselect("Fornitori", sorted(df["Fornitore"].cat.categories))
+dal, al = (periodo + (None,))[:2] if isinstance(periodo, tuple) else (periodo, None)
+dfv = filtra(df, dal, al, fornitori)
+
+c1, c2, c3, c4 = st.columns(4)
+c1.metric("Audit", f"{dfv['Audit'].nunique():,}".replace(",", "."))
+c2.metric("Fornitori", dfv["Fornitore"].nunique())
+valutati = dfv["Punteggio"].notna().sum()
+c3.metric("Conformità media", f"{round(float((dfv['Punteggio'] == 1).sum()) / valutati * 100, 1) if valutati else '—'}%")
+c4.metric("Non conformità", int((dfv["Stato"] == "Non conforme").sum()))
+
+st.subheader("Per fornitore")
+st.caption("Ordinati dalla conformità più bassa.")
+st.dataframe(per_fornitore(dfv), use_container_width=True, hide_index=True,
+             column_config={"Ultimo audit": st.column_config.DateColumn(format="DD/MM/YYYY")})
+
+colL, colR = st.columns(2)
+with colL:
+    st.subheader("Per sezione")
+    st.dataframe(per_sezione(dfv), use_container_width=True, hide_index=True)
+with colR:
+    st.subheader("NC per livello")
+    st.dataframe(nc_per_livello(dfv), use_container_width=True, hide_index=True)
+
+st.subheader("Andamento mensile")
+st.line_chart(andamento(dfv)[["% Conformità", "% Conformità ponderata"]])
@@ -0,0 +1,49 @@
+# pages/2_Ricerca.py
+import streamlit as st
+import pandas as pd
+
+from audit_store import AuditStore
+from audit_search import IndiceArchivio
+
+st.set_page_config(page_title="Ricerca negli audit", page_icon="🔎", layout="wide")
+st.title("Ricerca negli audit archiviati")
+st.caption("Cerca in requisiti, riferimenti, note, cause e trattamenti di tutti gli audit salvati. "
+           "Senza accenti né maiuscole; le parole possono essere incomplete (es. «sorv», «DPR 462»).")
+
+@st.cache_resource
+def audit_store():
+    return AuditStore()
+
+@st.cache_resource
+def indice_archivio():
+    # unico per processo; sincronizzato in modo incrementale a ogni ricerca
+    return IndiceArchivio()
+
+store = audit_store()
+indice = indice_archivio()
+with st.spinner("Aggiornamento indice…"):
+    indice.sincronizza(store)
+
+c1, c2 = st.columns([4, 1])
+query = c1.text_input("Cerca", placeholder="es. SDS, DPR 462, estintori manutenzione", key="q_archivio")
+limite = c2.selectbox("Risultati", [25, 50, 100, 250], index=1)
+
+if query:
+    hits = indice.cerca(query, limit=limite)
+    if not hits:
+        st.info("Nessun risultato.")
+        st.stop()
+    punteggi = pd.DataFrame([(a, r, s) for (a, r), s, _ in hits], columns=["audit_id", "req_id", "Rilevanza"])
+    dettagli = store.record_storici(audit_ids=punteggi["audit_id"].unique(),
+                                    colonne=["req_id", "sezione", "requisito", "riferimento", "stato", "note", "cause", "trattamento"])
+    out = punteggi.merge(dettagli, on=["audit_id", "req_id"], how="left")
+    out["data_audit"] = pd.to_datetime(out["data_audit"], errors="coerce")
+    st.caption(f"{len(out)} risultati su {len(indice):,} requisiti indicizzati".replace(",", "."))
+    st.dataframe(
+        out[["fornitore", "data_audit", "sezione", "requisito", "riferimento", "stato", "note", "cause", "trattamento", "audit_id"]],
+        use_container_width=True, hide_index=True,
+        column_config={
+            "fornitore": "Fornitore", "data_audit": st.column_config.DateColumn("Data", format="DD/MM/YYYY"),
+            "sezione": "Sezione", "requisito": "Requisito", "riferimento": "Riferimento", "stato": "Stato",
+            "note": "Note", "cause": "Cause", "trattamento": "Trattamento", "audit_id": "Audit #",
+        })
@@ -0,0 +1,62 @@
+# pages/3_Scadenzario.py
+import streamlit as st
+from datetime import date
+
+from audit_store import AuditStore
+import audit_tracker as tracker
+
+st.set_page_config(page_title="Scadenzario NC", page_icon="⏰", layout="wide")
+st.title("Scadenzario azioni correttive")
+st.caption("Non conformità di tutti gli audit archiviati, per data prevista di trattamento o di verifica. "
+           "Le NC di un requisito rivalutato in un audit successivo dello stesso fornitore non compaiono, salvo richiesta.")
+
+@st.cache_resource
+def audit_store():
+    return AuditStore()
+
+store = audit_store()
+oggi = date.today()
+
+with st.sidebar:
+    st.header("Filtri scadenzario")
+    campo = st.radio("Scadenza", ["trattamento", "verifica"], format_func=str.capitalize, horizontal=True, key="sc_campo")
+    vista = st.radio("Mostra", ["Scadute", "In scadenza", "Tutte"], key="sc_vista")
+    giorni = st.slider("Entro giorni", 7, 180, 30, step=1, key="sc_giorni", disabled=vista != "In scadenza")
+    responsabile = st.selectbox("Responsabile", ["Tutti"] + store.valori_nc("responsabile"), key="sc_resp")
+    periodo = st.selectbox("Periodo di gestione", ["Tutti"] + store.valori_nc("periodo"), key="sc_periodo")
+    fornitore = st.text_input("Fornitore (nome esatto)", key="sc_fornitore")
+    superate = st.checkbox("Includi NC superate da audit successivi", key="sc_superate")
+
+filtri = dict(responsabile=None if responsabile == "Tutti" else responsabile,
+              periodo=None if periodo == "Tutti" else periodo,
+              fornitore=fornitore.strip(), escludi_superate=not superate, oggi=oggi)
+if vista == "Scadute":
+    df = tracker.scadute(store, campo, **filtri)
+elif vista == "In scadenza":
+    df = tracker.in_scadenza(store, giorni, campo, **filtri)
+else:
+    df = tracker.azioni(store, campo, **filtri)
+
+if df.empty:
+    st.info("Nessuna azione correttiva per i filtri scelti.")
+    st.stop()
+
+scadenza = tracker.SCADENZA[campo]
+c1, c2, c3 = st.columns(3)
+c1.metric("Azioni", f"{len(df):,}".replace(",", "."))
+c2.metric("Scadute", f"{int((df['Giorni'] < 0).sum()):,}".replace(",", "."))
+c3.metric("Fornitori", df["Fornitore"].nunique())
+
+st.dataframe(
+    df[["Fornitore", scadenza, "Giorni", "Responsabile", "Periodo", "NC Livello", "Sezione", "Requisito",
+        "Trattamento", "Data audit", "Audit"]],
+    use_container_width=True, hide_index=True,
+    column_config={
+        scadenza: st.column_config.DateColumn(f"Scadenza ({campo})", format="DD/MM/YYYY"),
+        "Data audit": st.column_config.DateColumn(format="DD/MM/YYYY"),
+        "Giorni": st.column_config.NumberColumn(help="Giorni alla scadenza; negativi se già scaduta"),
+        "Audit": st.column_config.NumberColumn("Audit #", format="%d"),
+    })
+
+st.subheader("Per responsabile")
+st.dataframe(tracker.riepilogo(df, "Responsabile"), use_container_width=True, hide_index=True)
@@ -0,0 +1,9 @@
+# tests/conftest.py
+import os
+import sys
+import tempfile
+
+# archivio allegati isolato: va fissato prima che audit_attachments venga importato
+os.environ.setdefault("AUDIT_ALLEGATI", tempfile.mkdtemp(prefix="audit-allegati-"))
+os.environ.setdefault("AUDIT_LOG_TEMPI", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
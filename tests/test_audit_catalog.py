@@ -0,0 +1,23 @@
+# tests/test_audit_catalog.py
+import json
+import os
+
+import audit_catalog
+from audit_catalog import carica_catalogo
+
+
+def _scrivi(path, versione: str) -> None:
+    path.write_text(json.dumps({"id": "prova", "versione": versione, "titolo": "Prova", "sezioni": [
+        {"nome": "1. Sezione", "requisiti": [{"id": "R1", "requisito": "Requisito"}]}]}), encoding="utf-8")
+
+
+def test_cache_una_voce_per_file_ricaricata_se_cambia(tmp_path):
+    path = tmp_path / "prova.json"
+    _scrivi(path, "1")
+    primo = carica_catalogo(str(path))
+    assert carica_catalogo(str(path)) is primo
+    voci = len(audit_catalog._CACHE)
+    _scrivi(path, "2")
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1_000_000_000))
+    assert carica_catalogo(str(path)).versione == "2"
+    assert len(audit_catalog._CACHE) == voci
@@ -0,0 +1,51 @@
+# tests/test_audit_export.py
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from audit_catalog import Requisito
+from audit_export import export_arrow, export_csv, export_excel, export_parquet, leggi_export
+from audit_record import Record, formato_export, frame_record
+
+
+@pytest.fixture
+def df():
+    reqs = [Requisito(f"R{i}", "1. Documenti" if i < 3 else "2. Impianti", i, f"Requisito {i}", f"Art. {i}")
+            for i in range(1, 5)]
+    return frame_record([
+        Record(reqs[0], True, "Conforme", note="DVR firmato"),
+        Record(reqs[1], True, "Non conforme", "Livello 1", "Manca verbale", (), "Nessuna procedura",
+               "Redigere procedura", "BREVE (≤ 1 mese)", date(2026, 3, 31), date(2026, 4, 30), "RSPP"),
+        Record(reqs[2], True, "Non conforme", "Livello 2", responsabile="Preposto"),
+        Record(reqs[3]),
+    ])
+
+
+def _confrontabile(df: pd.DataFrame) -> pd.DataFrame:
+    cols = ["ID", "Applicabile", "Sezione", "Stato", "NC Livello", "Note", "Cause", "Periodo",
+            "Data trattamento", "Data verifica", "Responsabile"]
+    return df[cols].astype(str).reset_index(drop=True)
+
+
+@pytest.mark.parametrize("nome, esporta", [
+    ("audit.csv", lambda df: export_csv(formato_export(df))),
+    ("audit.xlsx", lambda df: export_excel(formato_export(df))),
+    ("audit.parquet", export_parquet),
+    ("audit.arrow", export_arrow),
+])
+def test_export_riletto_uguale(df, nome, esporta):
+    letto, _ = leggi_export(esporta(df), nome)
+    pd.testing.assert_frame_equal(_confrontabile(letto), _confrontabile(formato_export(df)))
+    assert letto["Punteggio"].tolist()[:3] == [1, 0, 0] and pd.isna(letto["Punteggio"].iloc[3])
+    assert letto["Punteggio ponderato"].tolist()[:3] == [1.0, 0.5, 0.0]
+
+
+def test_metadati_colonnari(df):
+    _, meta = leggi_export(export_parquet(df, {"fornitore": "ACME", "auditor": None}), "audit.parquet")
+    assert meta == {"fornitore": "ACME"}
+
+
+def test_formato_sconosciuto(df):
+    with pytest.raises(ValueError):
+        leggi_export(export_csv(formato_export(df)), "audit.txt")
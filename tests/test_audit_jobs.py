@@ -0,0 +1,75 @@
+# tests/test_audit_jobs.py
+import threading
+
+import pytest
+
+from audit_cache import BoundedCache
+from audit_jobs import ANNULLATO, COMPLETATO, CodaPDF
+
+
+def _genera(via: threading.Event, partito: threading.Event):
+    def genera(avanzamento):
+        partito.set()
+        while not via.wait(0.01):
+            avanzamento("Sezioni", 0.5)
+        avanzamento("Fine", 1.0)
+        return b"%PDF-"
+    return genera
+
+
+def _attendi(lav, timeout=5.0):
+    lav._future.result(timeout)
+
+
+@pytest.fixture
+def coda():
+    c = CodaPDF(workers=1)
+    yield c
+    c._pool.shutdown(wait=True, cancel_futures=True)
+
+
+def test_richieste_uguali_condividono_il_lavoro(coda):
+    via, partito = threading.Event(), threading.Event()
+    a = coda.invia("k", _genera(via, partito))
+    b = coda.invia("k", _genera(via, partito))
+    assert a is b and a.richieste == 2
+    via.set()
+    _attendi(a)
+    assert a.stato == COMPLETATO
+    assert coda.report(a) == b"%PDF-"
+    assert coda.report(a) is None  # senza cache il report si consegna una volta
+    # concluso: una nuova richiesta avvia un altro lavoro
+    assert coda.invia("k", _genera(via, partito)) is not a
+
+
+def test_annulla_solo_quando_nessuno_aspetta(coda):
+    via, partito = threading.Event(), threading.Event()
+    lav = coda.invia("k", _genera(via, partito))
+    coda.invia("k", _genera(via, partito))
+    assert partito.wait(5)
+    coda.annulla(lav.id)
+    assert lav.in_corso
+    coda.annulla(lav.id)
+    _attendi(lav)
+    assert lav.stato == ANNULLATO and coda.report(lav) is None
+
+
+def test_annulla_lavoro_in_coda(coda):
+    via, partito = threading.Event(), threading.Event()
+    primo = coda.invia("a", _genera(via, partito))
+    secondo = coda.invia("b", _genera(via, threading.Event()))
+    coda.annulla(secondo.id)
+    assert secondo.stato == ANNULLATO
+    via.set()
+    _attendi(primo)
+    assert primo.stato == COMPLETATO
+
+
+def test_report_in_cache_completato_subito():
+    cache = BoundedCache(1 << 20, 60, len)
+    coda = CodaPDF(workers=1, cache=cache)
+    cache.put("k", b"%PDF-cache")
+    lav = coda.invia("k", lambda avanzamento: pytest.fail("non deve rigenerare"))
+    assert lav.stato == COMPLETATO and lav._future is None
+    assert coda.report(lav) == b"%PDF-cache"
+    assert coda.lavoro(lav.id) is lav
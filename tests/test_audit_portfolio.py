@@ -0,0 +1,63 @@
+# tests/test_audit_portfolio.py
+import os
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from audit_portfolio import carica_portafoglio
+from audit_store import AuditStore
+
+
+def _record(rid: str, stato: str = "Conforme", sezione: str = "1. Sezione") -> dict:
+    punteggio = {"Conforme": 1.0, "Non conforme": 0.0}.get(stato)
+    return {"ID": rid, "Applicabile": "Sì", "N": 1, "Sezione": sezione, "Requisito": "Requisito", "Riferimento": "",
+            "Stato": stato, "NC Livello": "Livello 1" if stato == "Non conforme" else "", "Note": "", "Allegati": "",
+            "Punteggio": punteggio, "Punteggio ponderato": punteggio, "Cause": "", "Trattamento": "", "Periodo": "",
+            "Data trattamento": "", "Data verifica": "", "Responsabile": ""}
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = AuditStore(str(tmp_path / "audit.sqlite3"))
+    for fornitore in ("ACME", "BETA"):
+        a = s.nuovo_audit(fornitore, date(2026, 1, 10), "Auditor")
+        s.salva_record(a, [_record("R1"), _record("R2", "Non conforme")])
+    yield s
+    s.close()
+
+
+def _ordinato(df: pd.DataFrame) -> pd.DataFrame:
+    return df.sort_values(["Audit", "Sezione", "Stato"]).reset_index(drop=True)
+
+
+def test_aggiornamento_incrementale_uguale_a_rilettura(store, tmp_path):
+    df = carica_portafoglio(store)
+    assert len(df) == 4
+    a3 = store.nuovo_audit("GAMMA", date(2026, 2, 1), "Auditor")
+    store.salva_record(a3, [_record("R1", sezione="2. Nuova")])
+    store.salva_record(1, [_record("R2")])
+    store.elimina_audit(2)
+
+    letti = []
+    record_storici = store.record_storici
+    store.record_storici = lambda **kw: letti.append(kw.get("audit_ids")) or record_storici(**kw)
+    df2 = carica_portafoglio(store, precedente=df)
+    assert [sorted(ids) for ids in letti] == [[1, 3]]
+    assert df2.attrs["versione"] == store.versione_dati()[1]
+    assert list(df2["Fornitore"].cat.categories) == ["ACME", "GAMMA"]
+
+    os.remove(os.path.splitext(store.path)[0] + "_portafoglio.parquet")
+    pd.testing.assert_frame_equal(_ordinato(df2), _ordinato(carica_portafoglio(store)))
+    # invariato: stesso frame, nessuna lettura
+    assert carica_portafoglio(store, precedente=df2) is df2
+
+
+def test_snapshot_stantio_aggiornato_al_caricamento(store):
+    carica_portafoglio(store)
+    store.salva_record(1, [_record("R3", "Non conforme")])
+    df = carica_portafoglio(store)
+    assert len(df) == 5
+    riletto = carica_portafoglio(store)
+    assert riletto.attrs["versione"] == df.attrs["versione"]
+    pd.testing.assert_frame_equal(_ordinato(df), _ordinato(riletto))
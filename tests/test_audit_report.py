@@ -0,0 +1,21 @@
+# tests/test_audit_report.py
+from audit_attachments import Allegato
+from audit_report import _entro_limite
+
+
+def _pdf(nome: str, mb: int) -> Allegato:
+    return Allegato(nome * 64, f"{nome}.pdf", "application/pdf", mb * 2**20)
+
+
+def test_entro_limite_in_ordine_saltando_i_troppo_grandi():
+    a, b, c, d = _pdf("a", 30), _pdf("b", 40), _pdf("c", 20), _pdf("d", 15)
+    pdfs = [(a, "R1"), (b, "R2"), (c, "R3"), (d, "R4")]
+    accodati, esclusi = _entro_limite(pdfs, 64 * 2**20)
+    # b non ci sta più, c sì: l'esclusione di un file grande non blocca quelli dopo
+    assert accodati == [(a, "R1"), (c, "R3")]
+    assert esclusi == [(b, "R2"), (d, "R4")]
+
+
+def test_entro_limite_tutti_dentro():
+    pdfs = [(_pdf("a", 1), "R1"), (_pdf("b", 1), "R2")]
+    assert _entro_limite(pdfs, 2 * 2**20) == (pdfs, [])
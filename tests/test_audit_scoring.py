@@ -0,0 +1,36 @@
+# tests/test_audit_scoring.py
+import numpy as np
+import pandas as pd
+
+from audit_scoring import aggrega, percentuali, tabella_sezioni, totali
+
+
+def _df() -> pd.DataFrame:
+    return pd.DataFrame({
+        "Sezione": ["A", "A", "A", "B", "B"],
+        "Stato": ["Conforme", "Non conforme", "Non conforme", "Conforme", "Non applicabile"],
+        "Punteggio": [1.0, 0.0, 0.0, 1.0, np.nan],
+        "Punteggio ponderato": [1.0, 0.5, 0.0, 1.0, np.nan],
+    })
+
+
+def test_aggrega_per_sezione():
+    agg = aggrega(_df())
+    assert agg.loc["A", ["Valutati", "Conformi", "Non conformi"]].tolist() == [3, 1, 2]
+    assert agg.loc["A", "% Conformità"] == 33.3
+    assert agg.loc["A", "% Conformità ponderata"] == 50.0
+    assert agg.loc["B", "Valutati"] == 1 and agg.loc["B", "% Conformità"] == 100.0
+
+
+def test_totali_e_percentuali():
+    tot = totali(aggrega(_df()))
+    assert percentuali(tot) == (50.0, 2, 2, 4)
+    # ponderata: conformi e NC contati sullo stato
+    assert percentuali(tot, ponderata=True) == (62.5, 2, 2, 4)
+
+
+def test_nessun_valutato():
+    df = _df().iloc[[4]]
+    assert percentuali(totali(aggrega(df))) == (None, 0, 0, 0)
+    vuoto = aggrega(df.iloc[:0])
+    assert vuoto.empty and tabella_sezioni(vuoto).empty
@@ -0,0 +1,104 @@
+# tests/test_audit_search.py
+import sqlite3
+from datetime import date
+
+import pytest
+
+import audit_store
+from audit_search import IndiceArchivio, IndiceTesto
+from audit_store import AuditStore
+
+
+def _record(rid: str, note: str = "", applicabile: str = "Sì") -> dict:
+    return {"ID": rid, "Applicabile": applicabile, "N": 1, "Sezione": "1. Sezione", "Requisito": f"Requisito {rid}",
+            "Riferimento": "Art. 1", "Stato": "Conforme", "NC Livello": "", "Note": note, "Allegati": "",
+            "Punteggio": None, "Punteggio ponderato": None, "Cause": "", "Trattamento": "", "Periodo": "",
+            "Data trattamento": "", "Data verifica": "", "Responsabile": ""}
+
+
+@pytest.fixture
+def store():
+    s = AuditStore(":memory:")
+    yield s
+    s.close()
+
+
+def _docs(indice, query):
+    return [doc for doc, _, _ in indice.cerca(query)]
+
+
+def test_sincronizza_incrementale(store):
+    a1 = store.nuovo_audit("ACME", date(2026, 1, 10), "Auditor")
+    store.salva_record(a1, [_record("R1", "estintore scaduto"), _record("R2")])
+    indice = IndiceArchivio()
+    assert indice.sincronizza(store) == 2
+    assert _docs(indice, "estint") == [(a1, "R1")]
+    assert indice.sincronizza(store) == 0
+
+    a2 = store.nuovo_audit("BETA", date(2026, 2, 10), "Auditor")
+    store.salva_record(a2, [_record("R1", "estintore mancante")])
+    store.salva_record(a1, [_record("R1", "tutto in ordine")])
+    indice.sincronizza(store)
+    assert _docs(indice, "estintore") == [(a2, "R1")]
+    assert _docs(indice, "ordine") == [(a1, "R1")]
+
+
+def test_sincronizza_non_perde_salvataggi_nello_stesso_millisecondo(store, monkeypatch):
+    monkeypatch.setattr(audit_store, "_adesso", lambda: "2026-03-01T10:00:00.000")
+    a1 = store.nuovo_audit("ACME", date(2026, 1, 10), "Auditor")
+    store.salva_record(a1, [_record("R1")])
+    indice = IndiceArchivio()
+    indice.sincronizza(store)
+    store.salva_record(a1, [_record("R1", "porta tagliafuoco bloccata")])
+    indice.sincronizza(store)
+    assert _docs(indice, "tagliafuoco") == [(a1, "R1")]
+
+
+def test_sincronizza_eliminati_e_non_applicabili(store):
+    a1 = store.nuovo_audit("ACME", date(2026, 1, 10), "Auditor")
+    a2 = store.nuovo_audit("BETA", date(2026, 2, 10), "Auditor")
+    for a in (a1, a2):
+        store.salva_record(a, [_record("R1", "ponteggio"), _record("R2", "ponteggio")])
+    indice = IndiceArchivio()
+    indice.sincronizza(store)
+    store.elimina_audit(a2)
+    store.salva_record(a1, [_record("R2", "ponteggio", applicabile="No")])
+    indice.sincronizza(store)
+    assert _docs(indice, "ponteggio") == [(a1, "R1")]
+
+
+def test_archivio_senza_colonna_versione(tmp_path):
+    path = str(tmp_path / "vecchio.sqlite3")
+    con = sqlite3.connect(path)
+    con.executescript(audit_store.SCHEMA.replace(",\n    versione          INTEGER NOT NULL DEFAULT 0", ""))
+    con.execute("INSERT INTO audit (fornitore, creato, aggiornato) VALUES ('ACME', 'x', 'x')")
+    con.commit()
+    con.close()
+    s = AuditStore(path)
+    try:
+        assert [a["versione"] for a in s.audit_modificati()] == [0]
+        s.salva_record(1, [_record("R1")])
+        assert [a["id"] for a in s.audit_modificati(0)] == [1]
+    finally:
+        s.close()
+
+
+def test_bm25_peso_campi_e_prefisso():
+    indice = IndiceTesto()
+    indice.aggiorna("nota", {"Requisito": "Registro", "Note": "estintori"})
+    indice.aggiorna("requisito", {"Requisito": "Estintori", "Note": "registro"})
+    # stesso termine e stessa lunghezza: vale di più nel requisito (peso 2) che nelle note
+    assert [doc for doc, _, _ in indice.cerca("estintori")] == ["requisito", "nota"]
+    indice.aggiorna("esatta", {"Requisito": "Scala portatile"})
+    indice.aggiorna("prefisso", {"Requisito": "Scalata portatile"})
+    # la parola intera vale più della corrispondenza per prefisso
+    assert [doc for doc, _, _ in indice.cerca("scala")] == ["esatta", "prefisso"]
+
+
+def test_tutte_le_parole_senza_accenti():
+    indice = IndiceTesto()
+    indice.aggiorna(1, {"Requisito": "Verifica impianto di messa a terra", "Riferimento": "DPR 462"})
+    indice.aggiorna(2, {"Requisito": "Verifica periodica", "Note": "Sicurezzà"})
+    assert [doc for doc, _, _ in indice.cerca("verifica 462")] == [1]
+    assert [doc for doc, _, _ in indice.cerca("SICUREZZA")] == [2]
+    assert indice.cerca("verifica assente") == []
@@ -0,0 +1,50 @@
+# tests/test_audit_store.py
+from datetime import date
+
+import pytest
+
+from audit_store import AuditStore
+
+
+def _record(stato: str, applicabile: str = "Sì", **extra) -> dict:
+    rec = {"ID": "R1", "Applicabile": applicabile, "N": 1, "Sezione": "1. Sezione", "Requisito": "Requisito",
+           "Riferimento": "Art. 1", "Stato": stato, "NC Livello": "", "Note": "", "Allegati": "", "Punteggio": None,
+           "Punteggio ponderato": None, "Cause": "", "Trattamento": "", "Periodo": "", "Data trattamento": "",
+           "Data verifica": "", "Responsabile": ""}
+    rec.update(extra)
+    return rec
+
+
+@pytest.fixture
+def store():
+    s = AuditStore(":memory:")
+    yield s
+    s.close()
+
+
+def _audit_nc(store: AuditStore) -> int:
+    a1 = store.nuovo_audit("ACME", date(2026, 1, 10), "Auditor")
+    store.salva_record(a1, [_record("Non conforme", **{"NC Livello": "Livello 1", "Data trattamento": "01/03/2026"})])
+    return a1
+
+
+def test_nc_aperta_senza_audit_successivi(store):
+    _audit_nc(store)
+    assert len(store.azioni_nc()) == 1
+
+
+def test_nc_non_superata_da_record_non_applicabile_di_default(store):
+    _audit_nc(store)
+    a2 = store.nuovo_audit("ACME", date(2026, 6, 10), "Auditor")
+    store.salva_record(a2, [_record("Non applicabile", applicabile="No")])
+    assert len(store.azioni_nc()) == 1
+
+
+@pytest.mark.parametrize("stato", ["Conforme", "Non conforme"])
+def test_nc_superata_da_rivalutazione(store, stato):
+    _audit_nc(store)
+    a2 = store.nuovo_audit("ACME", date(2026, 6, 10), "Auditor")
+    store.salva_record(a2, [_record(stato)])
+    df = store.azioni_nc()
+    assert a2 in set(df["audit_id"]) if stato == "Non conforme" else df.empty
+    assert len(store.azioni_nc(escludi_superate=False)) == (2 if stato == "Non conforme" else 1)
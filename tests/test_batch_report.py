@@ -0,0 +1,45 @@
+# tests/test_batch_report.py
+from datetime import date
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from audit_attachments import salva
+from audit_export import leggi_export
+from audit_store import AuditStore
+from batch_report import Lavoro, genera
+
+
+def _record(rid: str, n: int, stato: str) -> dict:
+    return {"ID": rid, "Applicabile": "Sì", "N": n, "Sezione": "1. Sezione", "Requisito": f"Requisito {n}",
+            "Riferimento": "Art. 1", "Stato": stato, "NC Livello": "Livello 1" if stato == "Non conforme" else "",
+            "Note": "nota", "Allegati": "", "Punteggio": None, "Punteggio ponderato": None, "Cause": "",
+            "Trattamento": "", "Periodo": "", "Data trattamento": "", "Data verifica": "", "Responsabile": ""}
+
+
+@pytest.fixture
+def archivio(tmp_path):
+    db = str(tmp_path / "audit.db")
+    store = AuditStore(db)
+    audit_id = store.nuovo_audit("ACME", date(2026, 3, 1), "Auditor")
+    store.salva_record(audit_id, [_record("R1", 1, "Conforme"), _record("R2", 2, "Non conforme")])
+    foto = BytesIO()
+    Image.new("RGB", (40, 30), "red").save(foto, "PNG")
+    ref = salva(foto, "foto.png", "image/png")
+    store.salva_risposte(audit_id, {"R2_allegati": [ref._asdict()]})
+    store.close()
+    return db, audit_id
+
+
+def test_genera_da_archivio_con_allegati(archivio, tmp_path):
+    db, audit_id = archivio
+    out = tmp_path / "out"
+    out.mkdir()
+    esito = genera(Lavoro("acme", db=db, audit_id=audit_id), str(out), ("pdf", "xlsx"))
+    assert esito.ok, esito.errore
+    pdf, xlsx = esito.file
+    assert open(pdf, "rb").read(5) == b"%PDF-"
+    df, _ = leggi_export(xlsx)
+    assert list(df["ID"]) == ["R1", "R2"]
+    assert "_files" not in df.columns